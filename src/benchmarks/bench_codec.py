@@ -0,0 +1,60 @@
+"""
+Size and speed of the message encodings for TBOT.
+
+Encodes representative TradingView alerts as JSON and as msgpack (see
+utils/codec.py) and reports bytes on the wire and encode/decode time.
+
+    cd src && python -m benchmarks.bench_codec
+"""
+import timeit
+
+from utils.codec import decode_entry, encode, entry_fields
+
+ENTRY = {
+    'timestamp': 1700000000000,
+    'ticker': 'AAPL',
+    'currency': 'USD',
+    'timeframe': '5',
+    'clientId': 1,
+    'key': 'WebhookReceived:fcbd3d',
+    'contract': 'stock',
+    'orderRef': 'Long#1',
+    'direction': 'strategy.entrylong',
+    'metrics': [
+        {'name': 'entry.limit', 'value': 189.25},
+        {'name': 'entry.stop', 'value': 0},
+        {'name': 'exit.limit', 'value': 195.5},
+        {'name': 'exit.stop', 'value': 185.0},
+        {'name': 'qty', 'value': 100},
+        {'name': 'price', 'value': 189.31},
+    ],
+}
+CANCEL = {
+    'timestamp': 1700000000000,
+    'ticker': 'AAPL',
+    'currency': 'USD',
+    'timeframe': 'S',
+    'clientId': 1,
+    'key': 'WebhookReceived:fcbd3d',
+    'contract': 'stock',
+    'orderRef': 'cancel_all',
+    'direction': 'strategy.cancel_all',
+    'metrics': [],
+}
+BASKET = {**ENTRY, 'metrics': ENTRY['metrics'] * 20}
+
+
+def main():
+    for name, data in (('entry', ENTRY), ('cancel_all', CANCEL), ('basket', BASKET)):
+        for encoding in ('json', 'msgpack'):
+            body = encode(data, encoding)
+            fields = entry_fields(body, encoding)
+            assert decode_entry(fields) == data
+            number = 20000
+            encode_us = min(timeit.repeat(lambda: encode(data, encoding), number=number, repeat=5)) / number * 1e6
+            decode_us = min(timeit.repeat(lambda: decode_entry(fields), number=number, repeat=5)) / number * 1e6
+            print(f'{name:<11} {encoding:<8} {len(body):>6} B  encode {encode_us:7.2f} us  decode {decode_us:7.2f} us')
+
+
+if __name__ == '__main__':
+    main()
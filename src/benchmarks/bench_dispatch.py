@@ -0,0 +1,55 @@
+"""
+Micro-benchmark for webhook key dispatch.
+
+Compares the old linear scan over every registered event against the key
+index kept by EventManager.
+
+    cd src && python -m benchmarks.bench_dispatch
+"""
+import timeit
+
+from components.events.base.event import Event, EventManager
+
+
+class BenchEvent(Event):
+    def __init__(self, name):
+        self._bench_name = name
+        super().__init__()
+
+    def get_name(self):
+        return self._bench_name
+
+
+def build_manager(size):
+    manager = EventManager()
+    template = BenchEvent('BenchEvent')
+    for idx in range(size):
+        # copy the template instead of calling __init__ so building 10k events stays cheap
+        event = object.__new__(BenchEvent)
+        event.__dict__.update(template.__dict__, name=f'BenchEvent{idx}', key=f'BenchEvent{idx}:{idx:06x}')
+        manager.add(event)
+    return manager
+
+
+def linear_dispatch(manager, key):
+    return [event for event in manager.get_all() if event.webhook and event.key == key]
+
+
+def indexed_dispatch(manager, key):
+    return manager.get_by_key(key)
+
+
+def main(sizes=(10, 1_000, 10_000), number=2_000):
+    print(f'{"events":>8} {"linear (us)":>14} {"indexed (us)":>14}')
+    for size in sizes:
+        manager = build_manager(size)
+        # worst case for the linear scan: the last registered event
+        key = manager.get_all()[-1].key
+        assert linear_dispatch(manager, key) == indexed_dispatch(manager, key)
+        linear = timeit.timeit(lambda: linear_dispatch(manager, key), number=number) / number
+        indexed = timeit.timeit(lambda: indexed_dispatch(manager, key), number=number) / number
+        print(f'{size:>8} {linear * 1e6:>14.2f} {indexed * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
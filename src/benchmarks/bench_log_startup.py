@@ -0,0 +1,60 @@
+"""
+Startup benchmark for loading event logs.
+
+Compares every event scanning the whole log with strptime (the old
+Event.__init__) against one parse into the shared LogIndex.
+
+    cd src && python -m benchmarks.bench_log_startup
+"""
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from components.logs.event_log import EventLog
+from components.logs.log_index import LogIndex
+
+
+def write_log(path, lines, events):
+    with open(path, 'w') as log_file:
+        for idx in range(lines):
+            log_file.write(f'BenchEvent{idx % events},triggered,2023-01-31 13:45:{idx % 60:02d},'
+                           f'BenchEvent{idx % events} was triggered\n')
+
+
+def scan_per_event(path, events):
+    logs = {}
+    for idx in range(events):
+        name = f'BenchEvent{idx}'
+        logs[name] = []
+        for line in open(path, 'r'):
+            if line.split(',')[0] == name:
+                parent, event_type, event_time, event_data = line.split(',')
+                logs[name].append((parent, event_type, datetime.strptime(event_time, '%Y-%m-%d %H:%M:%S'), event_data))
+    return logs
+
+
+def load_index(path, events):
+    index = LogIndex(EventLog(path, max_lines=10 ** 9))
+    return {f'BenchEvent{idx}': index.get(f'BenchEvent{idx}') for idx in range(events)}
+
+
+def main(lines=20_000, events=(10, 100, 500)):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'log.log')
+        print(f'{"lines":>8} {"events":>8} {"per-event scan (s)":>20} {"index (s)":>12}')
+        for count in events:
+            write_log(path, lines, count)
+            start = time.perf_counter()
+            scanned = scan_per_event(path, count)
+            scan_time = time.perf_counter() - start
+            start = time.perf_counter()
+            indexed = load_index(path, count)
+            index_time = time.perf_counter() - start
+            assert {name: len(logs) for name, logs in scanned.items()} == \
+                   {name: len(logs) for name, logs in indexed.items()}
+            print(f'{lines:>8} {count:>8} {scan_time:>20.3f} {index_time:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark for forwarding webhook bodies to Redis.
+
+Compares decoding the whole body and encoding it again (the default
+/webhook path) against scanning only the routing fields and forwarding
+the body as sent (TVWB_RAW_FORWARD), for 1 KB and 32 KB payloads.
+
+    cd src && python -m benchmarks.bench_raw_forward
+"""
+import json
+import timeit
+import tracemalloc
+
+from utils.raw_payload import RawPayload
+
+
+def make_body(size, routing_first=True):
+    routing = {'key': 'WebhookReceived:400bad', 'clientId': 1}
+    data = {'ticker': 'AAPL', 'direction': 'strategy.entrylong', 'qty': 100, 'orders': []}
+    while len(json.dumps(data)) < size:
+        data['orders'].append({'price': 189.25, 'qty': 10, 'comment': 'tranche', 'ts': 1700000000000})
+    data = {**routing, **data} if routing_first else {**data, **routing}
+    return json.dumps(data)
+
+
+def decode_encode(body):
+    data = json.loads(body)
+    return data['key'], int(data['clientId']), json.dumps(data)
+
+
+def raw_forward(body):
+    payload = RawPayload.parse(body)
+    return payload['key'], int(payload['clientId']), payload.raw
+
+
+def peak_bytes(func, body):
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    for size in (1024, 32 * 1024):
+        for routing_first in (True, False):
+            body = make_body(size, routing_first)
+            assert decode_encode(body)[:2] == raw_forward(body)[:2]
+            label = f'{len(body) // 1024:>3} KB, routing fields {"first" if routing_first else "last "}'
+            for name, func in (('decode+encode', decode_encode), ('raw forward', raw_forward)):
+                number = 20000 if size <= 1024 else 1000
+                best = min(timeit.repeat(lambda: func(body), number=number, repeat=5)) / number
+                print(f'{label}  {name:<14} {best * 1e6:9.2f} us/op  peak {peak_bytes(func, body):>8} B')
+
+
+if __name__ == '__main__':
+    main()
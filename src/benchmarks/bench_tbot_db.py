@@ -0,0 +1,54 @@
+"""
+Latency of a dashboard poll with a connection per request and with the
+read-only connection tbot.get_db keeps per thread.
+
+Fills a TBOT-like database in a temporary directory and reads the latest
+page of orders the way /orders/data does.
+
+    cd src && python -m benchmarks.bench_tbot_db
+"""
+import os
+import sqlite3
+import tempfile
+import timeit
+
+ROWS = 50000
+QUERY = 'SELECT rowid AS _rowid, * FROM TBOTORDERS ORDER BY rowid DESC LIMIT 25'
+
+
+def fill(path):
+    database = sqlite3.connect(path)
+    database.execute('PRAGMA journal_mode = WAL')
+    database.execute('CREATE TABLE TBOTORDERS (timestamp TEXT, uniquekey TEXT, ticker TEXT, action TEXT, '
+                     'ordertype TEXT, qty REAL, orderref TEXT, orderstatus TEXT, position REAL, avgprice REAL)')
+    database.executemany('INSERT INTO TBOTORDERS VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         [(f'2024-01-01 00:00:{idx}', f'k{idx}', 'AAPL', 'BUY', 'LMT', 100, f'Long#{idx}',
+                           'Filled', 100, 189.31) for idx in range(ROWS)])
+    database.commit()
+    database.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tbot_sqlite3')
+        fill(path)
+        os.environ['TBOT_DB_OFFICE'] = path
+        import tbot
+
+        def per_request():
+            database = sqlite3.connect(path, timeout=10)
+            database.row_factory = sqlite3.Row
+            [dict(row) for row in database.execute(QUERY)]
+            database.close()
+
+        def pooled():
+            [dict(row) for row in tbot.get_db().execute(QUERY)]
+
+        number = 2000
+        for name, poll in (('connect per request', per_request), ('tbot.get_db', pooled)):
+            poll_us = min(timeit.repeat(poll, number=number, repeat=5)) / number * 1e6
+            print(f'{name:<20} {poll_us:8.1f} us per poll')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,75 @@
 # settings
 import uuid
 import os
+from distutils.util import strtobool
 
 LOG_LOCATION = 'components/logs/log.log'
+# lines per log segment, readers get the latest LOG_LIMIT lines
 LOG_LIMIT = 100
+# also rotate a segment once it reaches this many bytes (0 disables)
+LOG_MAX_BYTES = 0
+# rotated segments kept next to the active one
+LOG_SEGMENTS = 1
+# log records are written in batches by a background thread,
+# once LOG_BATCH_SIZE records are pending or every LOG_FLUSH_INTERVAL seconds
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 0.05
+# write log records on the calling thread instead (i.e. for tests)
+LOG_SYNC = strtobool(os.environ.get('TVWB_LOG_SYNC', 'False'))
+
+# webhook dispatch
+# when enabled, /webhook queues triggered events and returns immediately
+ASYNC_DISPATCH = strtobool(os.environ.get('TVWB_ASYNC_DISPATCH', 'False'))
+# each worker has its own queue, and webhooks for one clientId (or, without one,
+# one event) always go to the same worker, so they reach Redis in the order received.
+# More workers let other clients run alongside a slow one, but clients sharing a
+# worker still wait on each other.
+DISPATCH_WORKERS = int(os.environ.get('TVWB_DISPATCH_WORKERS', '4'))
+# webhooks waiting in all worker queues together
+DISPATCH_QUEUE_SIZE = int(os.environ.get('TVWB_DISPATCH_QUEUE_SIZE', '1000'))
+# when enabled, /webhook only decodes the routing fields (key, clientId) and
+# actions forward the body as sent, see utils/raw_payload.py
+RAW_FORWARD = strtobool(os.environ.get('TVWB_RAW_FORWARD', 'False'))
+
+# server
+# threads serving requests in production (waitress, or gunicorn --threads)
+SERVER_THREADS = int(os.environ.get('TVWB_SERVER_THREADS', '16'))
+
+# live dashboard updates (/stream)
+# every open stream holds one of the SERVER_THREADS for as long as the page is open,
+# keep this well below it so webhooks always find a free thread.
+# Browsers refused a stream fall back to polling.
+STREAM_MAX_CLIENTS = int(os.environ.get('TVWB_STREAM_MAX_CLIENTS', '8'))
+# seconds between checks for changes
+STREAM_INTERVAL = float(os.environ.get('TVWB_STREAM_INTERVAL', '1'))
+# messages buffered per stream before a slow browser misses some
+STREAM_BUFFER = int(os.environ.get('TVWB_STREAM_BUFFER', '256'))
+
+# job queue
+# when enabled, Event.trigger appends a job to a Redis stream and `tvwb.py worker` runs the actions
+JOB_QUEUE = strtobool(os.environ.get('TVWB_JOB_QUEUE', 'False'))
+JOB_REDIS_URL = os.environ.get('TVWB_JOB_REDIS_URL', 'redis://127.0.0.1:6379/0')
+JOB_STREAM = os.environ.get('TVWB_JOB_STREAM', 'TVWB_JOBS')
+JOB_GROUP = os.environ.get('TVWB_JOB_GROUP', 'tvwb-workers')
+# jobs are split by clientId over this many streams (TVWB_JOBS:0, TVWB_JOBS:1, ...; one is TVWB_JOBS),
+# each read by a single worker process, so jobs for a clientId run in the order queued.
+# `tvwb.py worker` runs at most one process per shard.
+JOB_SHARDS = int(os.environ.get('TVWB_JOB_SHARDS', '1'))
+# approximate cap on the stream length, keep it well above the expected backlog
+JOB_STREAM_MAXLEN = int(os.environ.get('TVWB_JOB_STREAM_MAXLEN', '100000'))
+# a job unacknowledged for this long is reclaimed from its worker, which is presumed dead
+JOB_CLAIM_IDLE_MS = int(os.environ.get('TVWB_JOB_CLAIM_IDLE_MS', '60000'))
+# deliveries before a job is moved to the dead-letter stream
+JOB_MAX_DELIVERIES = int(os.environ.get('TVWB_JOB_MAX_DELIVERIES', '5'))
+
+# action execution
+# default policy for running an event's actions: 'sequential', 'parallel' or 'priority'
+ACTION_EXECUTION_POLICY = os.environ.get('TVWB_ACTION_POLICY', 'sequential')
+# seconds each action may run before its siblings stop waiting on it (0 disables).
+# Timed out actions keep running in the background, so with the sequential and
+# priority policies they can overlap the next action; queued ones are cancelled.
+ACTION_TIMEOUT = float(os.environ.get('TVWB_ACTION_TIMEOUT', '0'))
+ACTION_WORKERS = int(os.environ.get('TVWB_ACTION_WORKERS', '8'))
 
 # ensure log file exists
 try:
@@ -1,4 +1,5 @@
 import datetime
+import threading
 from logging import getLogger, DEBUG
 
 from components.logs.log_event import LogEvent
@@ -10,6 +11,7 @@ logger = get_logger(__name__)
 class ActionManager:
     def __init__(self):
         self._actions = []
+        self._actions_by_name = {}
 
     def get_all(self):
         """
@@ -24,11 +26,18 @@ class ActionManager:
         :param action_name: name of action
         :return: Action()
         """
-        for action in self._actions:
-            if action.name == action_name:
-                return action
+        action = self._actions_by_name.get(action_name)
+        if action is None:
+            raise ValueError(f'Cannot find action with name {action_name}')
+        return action
 
-        raise ValueError(f'Cannot find action with name {action_name}')
+    def add(self, action):
+        """
+        Adds action to manager and indexes it by name
+        :param action: Action() to add
+        """
+        self._actions.append(action)
+        self._actions_by_name.setdefault(action.name, action)
 
 
 am = ActionManager()
@@ -41,13 +50,42 @@ class ActionLogEvent:
         self.msg = msg
 
 
+class ActionContext:
+    """
+    Data for a single run of an action.
+
+    A new context is made for every trigger, so concurrent runs of one
+    Action() never see each other's data.
+    """
+
+    def __init__(self, data, event=None, received_ns=None, dispatched_ns=None):
+        self.payload = data
+        # webhook body as sent, when /webhook only decoded its routing fields (see RawPayload)
+        self.raw = getattr(data, 'raw', None)
+        self.event = event
+        self.timestamp = datetime.datetime.now()
+        # time.monotonic_ns() when /webhook received the request and when the event ran its actions
+        self.received_ns = received_ns
+        self.dispatched_ns = dispatched_ns
+        self._data = None if self.raw is not None else data
+
+    @property
+    def data(self):
+        """Webhook data, fully decoded on first use if only the routing fields were"""
+        if self._data is None and self.raw is not None:
+            self._data = self.payload.decode()
+        return self._data
+
+
 class Action:
     objects = am
+    # higher runs first when the event's execution policy is 'priority'
+    priority = 0
 
     def __init__(self):
         self.name = self.get_name()
         self.logs = []
-        self._raw_data = None
+        self._local = threading.local()
 
     def get_name(self):
         return type(self).__name__
@@ -66,23 +104,36 @@ class Action:
         """
         Registers action with manager
         """
-        self.objects._actions.append(self)
+        self.objects.add(self)
         logger.info(f'ACTION REGISTERED --->\t{str(self)}')
 
     def set_data(self, data):
-        """Sets data for action"""
-        self._raw_data = data
+        """Sets data for action on the current thread (prefer passing context to run)"""
+        self.set_context(ActionContext(data))
+
+    def set_context(self, context):
+        """Sets context for the run on the current thread"""
+        self._local.context = context
+
+    def get_context(self):
+        """Gets context for the run on the current thread"""
+        return getattr(self._local, 'context', None)
 
-    def validate_data(self):
+    def validate_data(self, context=None):
         """Ensures data is valid"""
-        if not self._raw_data:
+        context = context or self.get_context()
+        if context is None or not context.data:
             raise ValueError('No data provided to action')
-        return self._raw_data
+        return context.data
 
     def run(self, *args, **kwargs):
         """
         Runs, logs action
+        :param context: ActionContext() for this run
         """
+        context = kwargs.get('context')
+        if context is not None:
+            self.set_context(context)
         self.logs.append(ActionLogEvent('INFO', 'action run'))
         log_event = LogEvent(self.name, 'action_run', datetime.datetime.now(), f'{self.name} triggered')
         log_event.write()
@@ -3,13 +3,24 @@ Redis Pub for Tbot on Tradingboat
 """
 import os
 import sys
-import json
+import time
+import atexit
+import threading
 from dataclasses import dataclass
+from functools import partial
 
 from distutils.util import strtobool
-from redis import Redis, ConnectionPool
+from redis import Redis
+from redis.exceptions import ConnectionError, TimeoutError
 from loguru import logger
 from components.actions.base.action import Action
+from utils.codec import encode, entry_fields, frame, require_encoding
+from utils.hash_ring import HashRing
+from utils.latency import latency_fields
+from utils.redis_batch import TRANSACTION, RedisBatcher, execute_transaction
+from utils.redis_outbox import RedisOutbox
+from utils.redis_pool import MonitoredConnectionPool, get_pool
+from utils.redis_retention import StreamRetention, StreamTrimmer, stream_stats
 
 
 # Change the log levelfor loguru
@@ -24,7 +35,36 @@ REDIS_STREAM_KEY = "REDIS_SKEY_"
 # This is a key used in the Redis stream dictionary to identify the data from TradingBoat.
 REDIS_STREAM_TB_KEY = "tradingboat"
 
-TBOT_CLIENT_MAX_LEN = 4
+# Highest clientId accepted from TradingView, clients are connected on first use
+TBOT_CLIENT_MAX_LEN = int(os.getenv("TBOT_CLIENT_MAX_LEN", "4"))
+
+# Comma separated Redis urls, i.e. redis://10.0.0.1:6379,redis://10.0.0.2:6379.
+# When set, client streams are spread across them on a consistent-hash ring
+# instead of all going to TBOT_REDIS_HOST.
+TBOT_REDIS_NODES = [node.strip() for node in os.getenv("TBOT_REDIS_NODES", "").split(",") if node.strip()]
+
+# Commands for a client are pipelined in batches of up to TBOT_REDIS_BATCH_SIZE,
+# sent TBOT_REDIS_LINGER_MS after the first one is queued. 0 sends each one straight away.
+TBOT_REDIS_LINGER_MS = float(os.getenv("TBOT_REDIS_LINGER_MS", "0"))
+TBOT_REDIS_BATCH_SIZE = int(os.getenv("TBOT_REDIS_BATCH_SIZE", "64"))
+
+# Seconds between background trims of the client streams, see StreamRetention for the limits
+TBOT_REDIS_TRIM_INTERVAL_SEC = float(os.getenv("TBOT_REDIS_TRIM_INTERVAL_SEC", "60"))
+
+# Commands that cannot be sent are spooled to this SQLite file and replayed
+# once Redis is back. Empty (the default) disables the outbox. Every process
+# sending to Redis may share the file, see utils/redis_outbox.py.
+TBOT_REDIS_OUTBOX = os.getenv("TBOT_REDIS_OUTBOX", "")
+TBOT_REDIS_OUTBOX_BATCH_SIZE = int(os.getenv("TBOT_REDIS_OUTBOX_BATCH_SIZE", "1000"))
+# A command slower than this marks Redis degraded, so the following ones are spooled. 0 disables.
+TBOT_REDIS_OUTBOX_LATENCY_MS = float(os.getenv("TBOT_REDIS_OUTBOX_LATENCY_MS", "0"))
+
+# Add receive/dispatch/publish timestamps to stream entries, see utils/latency.py.
+# Off by default, the fields are sent to TBOT with every message.
+TBOT_REDIS_LATENCY_STAMPS = strtobool(os.getenv("TBOT_REDIS_LATENCY_STAMPS", "0"))
+
+# 'json', or 'msgpack' for compact binary messages, see utils/codec.py
+TBOT_REDIS_ENCODING = os.getenv("TBOT_REDIS_ENCODING", "json")
 
 
 @dataclass
@@ -32,11 +72,57 @@ class RedisClient:
     """Redis Client for TradingView's ClientId"""
     stream_key: str
     channel: str
-    pool: ConnectionPool = None
+    client_id: int = 0
+    pool: MonitoredConnectionPool = None
     connection: Redis = None
+    batcher: RedisBatcher = None
+    retention: StreamRetention = None
+
+
+class RedisBrokerMessage:
+    """Reads the message for TBOT from an action's context"""
+
+    def validate_broker_data(self, context=None):
+        """Validate Message"""
+        try:
+            data = self.validate_data(context)
+            return data
+        except ValueError:
+            return None
+
+    def broker_message(self, context=None):
+        """
+        Get the routing fields and the encoded message to send,
+        for JSON the webhook body as sent when /webhook kept it
+        """
+        context = context or self.get_context()
+        if TBOT_REDIS_ENCODING == 'json' and context is not None and context.raw is not None:
+            return context.payload, context.raw
+        data_dict = self.validate_broker_data(context)
+        if not data_dict:
+            return None, None
+        return data_dict, encode(data_dict, TBOT_REDIS_ENCODING)
+
+    def broker_legs(self, context=None):
+        """
+        Get the encoded message of each leg of a multi-leg alert, i.e. a bracket order,
+        or None for a single alert. Each leg is sent with the alert's other fields.
+        """
+        context = context or self.get_context()
+        # a body kept as sent is only decoded if it may have legs
+        if context is None or (context.raw is not None and '"legs"' not in context.raw):
+            return None
+        data_dict = self.validate_broker_data(context)
+        legs = data_dict.get("legs") if data_dict else None
+        if not legs:
+            return None
+        if not isinstance(legs, list) or not all(isinstance(leg, dict) for leg in legs):
+            raise ValueError("legs must be a list of JSON objects")
+        shared = {name: value for name, value in data_dict.items() if name != "legs"}
+        return [encode({**shared, **leg}, TBOT_REDIS_ENCODING) for leg in legs]
 
 
-class RedisPubActionClients(Action):
+class RedisPubActionClients(RedisBrokerMessage, Action):
     """Class for handling Redis connections for message delivery.
 
     This class sets up a Redis connection either as a stream or as a
@@ -46,54 +132,70 @@ class RedisPubActionClients(Action):
 
     def __init__(self):
         super().__init__()
-        self.clients = []
+        require_encoding(TBOT_REDIS_ENCODING)
+        self.clients = {}
+        self._clients_lock = threading.Lock()
+        self.ring = HashRing(TBOT_REDIS_NODES) if TBOT_REDIS_NODES else None
         self.is_redis_stream = strtobool(
             os.getenv("TBOT_USES_REDIS_STREAM", "1"))
-        self.create_connection_pools_for_clients()
-
-    def create_connection_pools_for_clients(self, nums: int = TBOT_CLIENT_MAX_LEN):
-        """Create Connection Pools for Each TV Client"""
-        for idx in range(nums + 1):
-            client = RedisClient(stream_key=REDIS_STREAM_KEY + str(idx),
-                                 channel=REDIS_CHANNEL + str(idx))
-            self.clients.append(client)
-            if idx > 0:
-                self.connect_redis_host(client)
-        logger.success(f'Created {TBOT_CLIENT_MAX_LEN} clients')
-
-    def validate_broker_data(self):
-        """Validate Message"""
-        try:
-            data = self.validate_data()
-            return data
-        except ValueError:
+        self.outbox = RedisOutbox(TBOT_REDIS_OUTBOX, batch_size=TBOT_REDIS_OUTBOX_BATCH_SIZE) \
+            if TBOT_REDIS_OUTBOX else None
+        if self.outbox is not None:
+            # replay what was spooled before a restart without waiting for the next alert
+            self.outbox.start(self.get_client)
+        self.trimmer = StreamTrimmer(self.get_streams, TBOT_REDIS_TRIM_INTERVAL_SEC)
+        if self.is_redis_stream and TBOT_REDIS_TRIM_INTERVAL_SEC > 0:
+            self.trimmer.start()
+        atexit.register(self.close)
+
+    def get_client(self, client_id: int):
+        """Get the client for a clientId, connecting it on first use, or None if it is out of range"""
+        if client_id <= 0 or client_id > TBOT_CLIENT_MAX_LEN:
             return None
+        client = self.clients.get(client_id)
+        if client is None:
+            with self._clients_lock:
+                client = self.clients.get(client_id)
+                if client is None:
+                    client = RedisClient(stream_key=REDIS_STREAM_KEY + str(client_id),
+                                         channel=REDIS_CHANNEL + str(client_id),
+                                         client_id=client_id,
+                                         retention=StreamRetention.from_env(f"_{client_id}"))
+                    self.connect_redis_host(client)
+                    self.clients[client_id] = client
+        return client
 
     def connect_redis_host(self, client: RedisClient):
-        """Connect to Redis via either unix or tcp """
+        """Connect to Redis via either unix or tcp, or to the client's node on the hash ring"""
         password = os.getenv("TBOT_REDIS_PASSWORD", "")
         host = os.getenv("TBOT_REDIS_HOST", "127.0.0.1")
         unix_sock = os.getenv('TBOT_REDIS_UNIXDOMAIN_SOCK', '')
         unix = {
             'password': password,
             'decode_responses': True,
-            "max_connections": 10,
         }
         tcp = {
             'host': host,
             'port': int(os.getenv("TBOT_REDIS_PORT", "6379")),
             'password': password,
             'decode_responses': True,
-            "max_connections": 10,
             }
         try:
-            if host:
-                client.pool = ConnectionPool(**tcp)
-                client.connection = Redis(connection_pool=client.pool)
+            # every client on the same endpoint shares one pool
+            if self.ring is not None:
+                client.pool = get_pool(self.ring.get_node(client.stream_key), **unix)
+            elif host:
+                client.pool = get_pool(**tcp)
             else:
-                redis_url = f"unix://{unix_sock}"
-                client.pool = ConnectionPool.from_url(redis_url, **unix)
-                client.connection = Redis(**unix)
+                client.pool = get_pool(f"unix://{unix_sock}", **unix)
+            client.connection = Redis(connection_pool=client.pool)
+            if TBOT_REDIS_LINGER_MS > 0:
+                client.batcher = RedisBatcher(client.connection,
+                                              linger=TBOT_REDIS_LINGER_MS / 1000,
+                                              max_batch=TBOT_REDIS_BATCH_SIZE,
+                                              name=f"batch-{client.stream_key}",
+                                              on_error=partial(self.spool, client),
+                                              hold=partial(self.hold, client))
             if self.is_redis_stream:
                 logger.success(f"Connected to Redis| {client.stream_key}:"
                                f"{REDIS_STREAM_TB_KEY}")
@@ -102,35 +204,122 @@ class RedisPubActionClients(Action):
         except ConnectionRefusedError as err:
             logger.error(err)
 
-    def run_redis_stream(self):
+    def spool(self, client: RedisClient, err, commands):
+        """Mark Redis unavailable and keep the commands in the outbox, or drop them without one"""
+        client.pool.mark_unhealthy(err)
+        if self.outbox is None:
+            logger.error(f"Dropped {len(commands)} commands for {client.stream_key}: {err}")
+            return
+        for command, args, kwargs in commands:
+            self.outbox.put(client.client_id, command, args, kwargs)
+        logger.warning(f"Spooled {len(commands)} commands for {client.stream_key}: {err}")
+
+    def hold(self, client: RedisClient, commands):
+        """Keep a batch in the outbox while the client has spooled commands, so it does not overtake them"""
+        if self.outbox is None or not self.outbox.has_pending(client.client_id):
+            return False
+        for command, args, kwargs in commands:
+            self.outbox.put(client.client_id, command, args, kwargs)
+        return True
+
+    def send(self, client: RedisClient, command: str, *args, **kwargs):
+        """Send a command now, or queue it for the client's next pipelined batch"""
+        if self.outbox is not None:
+            # threads do not survive a fork, start the replayer again in a forked worker
+            self.outbox.start(self.get_client)
+            if not client.pool.healthy or self.outbox.has_pending(client.client_id):
+                # keep the client's order, nothing may overtake what is spooled by any process
+                self.outbox.put(client.client_id, command, args, kwargs)
+                return
+        if not client.pool.healthy:
+            # the pool's monitor is reconnecting, do not hold up the webhook
+            raise ConnectionError(f"Redis {client.pool!r} is unavailable")
+        if client.batcher is not None:
+            client.batcher.submit(command, *args, **kwargs)
+            return
+        start = time.perf_counter()
+        try:
+            if command == TRANSACTION:
+                # raises ResponseError if a leg was rejected, the action reports it as failed
+                execute_transaction(client.connection, args)
+            else:
+                getattr(client.connection, command)(*args, **kwargs)
+        except (ConnectionError, TimeoutError) as err:
+            if self.outbox is None:
+                client.pool.mark_unhealthy(err)
+                raise
+            self.spool(client, err, [(command, args, kwargs)])
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        if TBOT_REDIS_OUTBOX_LATENCY_MS and elapsed > TBOT_REDIS_OUTBOX_LATENCY_MS and self.outbox is not None:
+            # sent, but spool what follows until the health monitor sees Redis again
+            client.pool.mark_unhealthy(f"{command} took {elapsed:.1f}ms")
+
+    def get_streams(self):
+        """Get (connection, stream key, retention) for each connected client"""
+        return [(client.connection, client.stream_key, client.retention)
+                for client in list(self.clients.values()) if client.connection is not None]
+
+    def stream_stats(self):
+        """Get length and memory use of each client stream"""
+        return {key: stream_stats(connection, key) for connection, key, _ in self.get_streams()}
+
+    def close(self):
+        """Send any queued commands"""
+        self.trimmer.stop()
+        for client in list(self.clients.values()):
+            if client.batcher is not None:
+                client.batcher.close()
+        if self.outbox is not None:
+            self.outbox.close()
+
+    def stream_dict(self, body, context=None, leg=None):
+        """Create a bespoken dictionary for Redis Stream"""
+        stream_dict = entry_fields(body, TBOT_REDIS_ENCODING, REDIS_STREAM_TB_KEY)
+        if leg is not None:
+            stream_dict["leg"] = leg
+        if TBOT_REDIS_LATENCY_STAMPS:
+            stream_dict.update(latency_fields(context or self.get_context()))
+        return stream_dict
+
+    def run_redis_stream(self, context=None):
         """Add data to the stream"""
-        data_dict = self.validate_broker_data()
+        data_dict, body = self.broker_message(context)
         if data_dict:
             client_id = int(data_dict.get("clientId", -1))
-            if client_id <= 0 or client_id > TBOT_CLIENT_MAX_LEN:
+            client = self.get_client(client_id)
+            if client is None:
                 logger.critical(f'Invalid clientId={client_id} from TradingView')
                 return
-            # Create a bespoken dictionary for Redis Stream
-            stream_dict = {REDIS_STREAM_TB_KEY: json.dumps(data_dict)}
-            client = self.clients[client_id]
-            client.connection.xadd(
-                client.stream_key, stream_dict)
+            legs = self.broker_legs(context)
+            if legs:
+                # all legs land next to each other in one MULTI/EXEC round trip
+                commands = [("xadd", (client.stream_key, self.stream_dict(leg, context, f"{idx}/{len(legs)}")),
+                             client.retention.xadd_kwargs()) for idx, leg in enumerate(legs, 1)]
+                self.send(client, TRANSACTION, *commands)
+            else:
+                self.send(client, "xadd", client.stream_key, self.stream_dict(body, context),
+                          **client.retention.xadd_kwargs())
             logger.success(
                 f"->pushed|{client.stream_key}:{REDIS_STREAM_TB_KEY}"
             )
 
-    def run_redis_pubsub(self):
+    def run_redis_pubsub(self, context=None):
         """Publish message"""
-        data_dict = self.validate_broker_data()
+        data_dict, body = self.broker_message(context)
         # Publishing data
         if data_dict:
-            client_id = data_dict.get("clientId", -1)
-            if client_id <= 0 or client_id > TBOT_CLIENT_MAX_LEN:
+            client_id = int(data_dict.get("clientId", -1))
+            client = self.get_client(client_id)
+            if client is None:
                 logger.critical(f'Invalid clientId={client_id}')
                 return
-            json_string = json.dumps(data_dict)
-            client = self.clients[client_id]
-            client.connection.publish(client.channel, json_string)
+            legs = self.broker_legs(context)
+            if legs:
+                self.send(client, TRANSACTION, *[("publish", (client.channel, frame(leg, TBOT_REDIS_ENCODING)), {})
+                                                 for leg in legs])
+            else:
+                self.send(client, "publish", client.channel, frame(body, TBOT_REDIS_ENCODING))
             logger.success(
                 f"->pushed| {client.channel}"
             )
@@ -140,7 +329,8 @@ class RedisPubActionClients(Action):
         Custom run method. Add your custom logic here.
         """
         super().run(*args, **kwargs)  # this is required
+        context = kwargs.get('context')
         if self.is_redis_stream:
-            self.run_redis_stream()
+            self.run_redis_stream(context)
         else:
-            self.run_redis_pubsub()
+            self.run_redis_pubsub(context)
@@ -0,0 +1,186 @@
+"""
+Redis Pub for Tbot on Tradingboat, on redis.asyncio
+"""
+import os
+import asyncio
+import atexit
+import threading
+from concurrent.futures import wait
+from dataclasses import dataclass
+
+from distutils.util import strtobool
+from redis.asyncio import Redis, BlockingConnectionPool
+from loguru import logger
+from components.actions.base.action import Action
+from components.actions.redis_pub_action_clients import (
+    REDIS_CHANNEL, REDIS_STREAM_KEY, REDIS_STREAM_TB_KEY, TBOT_CLIENT_MAX_LEN, TBOT_REDIS_NODES,
+    TBOT_REDIS_ENCODING, TBOT_REDIS_LATENCY_STAMPS,
+    RedisBrokerMessage,
+)
+from utils import async_bridge
+from utils.codec import entry_fields, frame, require_encoding
+from utils.hash_ring import HashRing
+from utils.latency import latency_fields
+from utils.redis_pool import TBOT_REDIS_MAX_CONNECTIONS, TBOT_REDIS_POOL_TIMEOUT
+from utils.redis_retention import StreamRetention
+
+# Wait for each publish before the action returns, so failures reach the event's action_result.
+# Off by default: the action returns once the publish is scheduled, without holding
+# its thread, and a failed publish is logged, counted in stats() and set on the
+# future run() returns, while the event reports the action as ok.
+TBOT_REDIS_ASYNC_WAIT = strtobool(os.getenv("TBOT_REDIS_ASYNC_WAIT", "0"))
+
+
+@dataclass
+class AsyncRedisClient:
+    """asyncio Redis Client for TradingView's ClientId"""
+    stream_key: str
+    channel: str
+    client_id: int = 0
+    connection: Redis = None
+    retention: StreamRetention = None
+    # publishes for one client are sent in the order they were scheduled
+    lock: asyncio.Lock = None
+    lock_loop: asyncio.AbstractEventLoop = None
+
+    def get_lock(self):
+        """Get the client's lock, made in the running loop, as a lock belongs to the loop it is used in"""
+        loop = asyncio.get_running_loop()
+        if self.lock is None or self.lock_loop is not loop:
+            # a new bridge loop after a fork gets a new lock
+            self.lock, self.lock_loop = asyncio.Lock(), loop
+        return self.lock
+
+
+class RedisPubActionClientsAsync(RedisBrokerMessage, Action):
+    """Asynchronous counterpart of RedisPubActionClients.
+
+    Publishes run as coroutines on the shared loop of utils.async_bridge,
+    so many can be in flight at once without holding a WSGI thread each.
+    Failures are logged rather than reaching the event's action_result,
+    unless TBOT_REDIS_ASYNC_WAIT=1.
+    Register it in place of RedisPubActionClients to use it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        require_encoding(TBOT_REDIS_ENCODING)
+        self.clients = {}
+        self.pools = {}
+        self._clients_lock = threading.Lock()
+        self._in_flight = set()
+        self.ring = HashRing(TBOT_REDIS_NODES) if TBOT_REDIS_NODES else None
+        self.is_redis_stream = strtobool(
+            os.getenv("TBOT_USES_REDIS_STREAM", "1"))
+        self.published = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def endpoint(self, client: AsyncRedisClient):
+        """Get the Redis url for a client"""
+        if self.ring is not None:
+            return self.ring.get_node(client.stream_key)
+        host = os.getenv("TBOT_REDIS_HOST", "127.0.0.1")
+        if host:
+            return f"redis://{host}:{int(os.getenv('TBOT_REDIS_PORT', '6379'))}"
+        return f"unix://{os.getenv('TBOT_REDIS_UNIXDOMAIN_SOCK', '')}"
+
+    def get_client(self, client_id: int):
+        """Get the client for a clientId, connecting it on first use, or None if it is out of range"""
+        if client_id <= 0 or client_id > TBOT_CLIENT_MAX_LEN:
+            return None
+        client = self.clients.get(client_id)
+        if client is None:
+            with self._clients_lock:
+                client = self.clients.get(client_id)
+                if client is None:
+                    client = AsyncRedisClient(stream_key=REDIS_STREAM_KEY + str(client_id),
+                                              channel=REDIS_CHANNEL + str(client_id),
+                                              client_id=client_id,
+                                              retention=StreamRetention.from_env(f"_{client_id}"))
+                    url = self.endpoint(client)
+                    # every client on the same endpoint shares one pool
+                    pool = self.pools.get(url)
+                    if pool is None:
+                        pool = self.pools[url] = BlockingConnectionPool.from_url(
+                            url,
+                            max_connections=TBOT_REDIS_MAX_CONNECTIONS,
+                            timeout=TBOT_REDIS_POOL_TIMEOUT,
+                            password=os.getenv("TBOT_REDIS_PASSWORD", ""),
+                            decode_responses=True)
+                    client.connection = Redis(connection_pool=pool)
+                    self.clients[client_id] = client
+        return client
+
+    def queue(self, target, client: AsyncRedisClient, body, context=None, leg=None):
+        """Queue the message on a connection or pipeline, to the client's stream or channel"""
+        if not self.is_redis_stream:
+            return target.publish(client.channel, frame(body, TBOT_REDIS_ENCODING))
+        stream_dict = entry_fields(body, TBOT_REDIS_ENCODING, REDIS_STREAM_TB_KEY)
+        if leg is not None:
+            stream_dict["leg"] = leg
+        if TBOT_REDIS_LATENCY_STAMPS:
+            stream_dict.update(latency_fields(context))
+        return target.xadd(client.stream_key, stream_dict, **client.retention.xadd_kwargs())
+
+    async def publish(self, client: AsyncRedisClient, body, context=None, legs=None):
+        """Add the message to the client's stream, or publish it on its channel"""
+        async with client.get_lock():
+            if not legs:
+                await self.queue(client.connection, client, body, context)
+                return
+            # all legs land next to each other in one MULTI/EXEC round trip
+            async with client.connection.pipeline(transaction=True) as pipe:
+                for idx, leg in enumerate(legs, 1):
+                    self.queue(pipe, client, leg, context, f"{idx}/{len(legs)}")
+                await pipe.execute()
+
+    def _published(self, client, future):
+        self._in_flight.discard(future)
+        err = future.exception()
+        if err is not None:
+            self.failed += 1
+            logger.error(f"Failed to push to {client.stream_key}: {err}")
+            return
+        self.published += 1
+        if self.is_redis_stream:
+            logger.success(f"->pushed|{client.stream_key}:{REDIS_STREAM_TB_KEY}")
+        else:
+            logger.success(f"->pushed| {client.channel}")
+
+    def stats(self):
+        return {'in_flight': len(self._in_flight), 'published': self.published, 'failed': self.failed}
+
+    def close(self, timeout: float = 10):
+        """Wait for in-flight publishes and close the pools"""
+        if self._in_flight:
+            wait(list(self._in_flight), timeout)
+        for pool in list(self.pools.values()):
+            try:
+                async_bridge.run(pool.disconnect(), timeout)
+            except Exception as err:
+                logger.warning(f"Failed to close Redis pool: {err}")
+        self.pools.clear()
+        self.clients.clear()
+
+    def run(self, *args, **kwargs):
+        """
+        Custom run method. Add your custom logic here.
+        :return: concurrent.futures.Future of the publish, None if nothing was published
+        """
+        super().run(*args, **kwargs)  # this is required
+        context = kwargs.get('context')
+        data_dict, body = self.broker_message(context)
+        if not data_dict:
+            return
+        client_id = int(data_dict.get("clientId", -1))
+        client = self.get_client(client_id)
+        if client is None:
+            logger.critical(f'Invalid clientId={client_id} from TradingView')
+            return
+        future = async_bridge.submit(self.publish(client, body, context, self.broker_legs(context)))
+        self._in_flight.add(future)
+        future.add_done_callback(lambda done: self._published(client, done))
+        if TBOT_REDIS_ASYNC_WAIT:
+            future.result()
+        return future
@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+import zlib
+
+from commons import DISPATCH_QUEUE_SIZE, DISPATCH_WORKERS
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def shard_index(data, fallback, shards: int) -> int:
+    """
+    Gets the shard of a webhook, so the ones for a clientId always land on the same shard
+    :param fallback: key used when data has no clientId, i.e. the event's
+    :return: int in range(shards)
+    """
+    key = data.get('clientId') if isinstance(data, dict) else None
+    if key is None:
+        key = fallback
+    return zlib.crc32(str(key).encode()) % shards
+
+
+class Dispatcher:
+    """
+    Bounded in-process queues, each drained by one worker thread.
+
+    Lets /webhook accept a request and return straight away, while the
+    triggered events (and their actions) run in the background.
+
+    Webhooks are sharded by clientId, or by the first event's key when they
+    have none, so the ones for a client run one after another in the order
+    received. The cost is that a slow client holds up the others on its
+    worker, and a busy one cannot use more than one worker.
+    """
+
+    def __init__(self, workers: int = DISPATCH_WORKERS, queue_size: int = DISPATCH_QUEUE_SIZE):
+        self.workers = max(workers, 1)
+        self.queue_size = queue_size
+        self._queues = [queue.Queue() for _ in range(self.workers)]
+        # the bound is shared, a busy client may use all of it
+        self._slots = threading.Semaphore(queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.dispatched = 0
+        self.rejected = 0
+        self.failed = 0
+        self._latency_total = 0.0
+        self._latency_last = 0.0
+        self._latency_max = 0.0
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """
+        Starts the worker threads, if not already running
+        """
+        if self.running:
+            return
+        self._threads = [
+            threading.Thread(target=self._work, args=(work_queue,), name=f'dispatch-{idx}', daemon=True)
+            for idx, work_queue in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f'DISPATCHER STARTED --->\t{self.workers} workers, queue size {self.queue_size}')
+
+    def shard(self, events, data):
+        """
+        Gets the index of the worker queue for a webhook
+        :return: int
+        """
+        return shard_index(data, events[0].key if events else '', self.workers)
+
+    def submit(self, events, data, received_ns=None):
+        """
+        Queues events to be triggered with data, behind earlier webhooks of the same clientId
+        :param events: list of Event() to trigger
+        :param data: webhook data passed to the events
+        :param received_ns: time.monotonic_ns() when the webhook was received
+        :return: bool, False if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        self._queues[self.shard(events, data)].put((time.monotonic(), events, data, received_ns))
+        return True
+
+    def _work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            try:
+                if item is None:
+                    return
+                self._slots.release()
+                enqueued_at, events, data, received_ns = item
+                latency = time.monotonic() - enqueued_at
+                with self._lock:
+                    self.dispatched += 1
+                    self._latency_last = latency
+                    self._latency_total += latency
+                    self._latency_max = max(self._latency_max, latency)
+                for event in events:
+                    try:
+                        event.trigger(data=data, received_ns=received_ns)
+                    except Exception as e:
+                        with self._lock:
+                            self.failed += 1
+                        logger.exception(f'EVENT FAILED --->\t{str(event)}: {e}')
+            finally:
+                work_queue.task_done()
+
+    def stats(self):
+        """
+        Gets queue depth and enqueue-to-run latency
+        :return: dict
+        """
+        with self._lock:
+            return {
+                'running': self.running,
+                'workers': self.workers,
+                'queue_depth': sum(work_queue.qsize() for work_queue in self._queues),
+                'queue_size': self.queue_size,
+                'dispatched': self.dispatched,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'latency_ms': {
+                    'last': round(self._latency_last * 1000, 3),
+                    'avg': round(self._latency_total / self.dispatched * 1000, 3) if self.dispatched else 0.0,
+                    'max': round(self._latency_max * 1000, 3),
+                },
+            }
+
+    def shutdown(self, drain: bool = True, timeout: float = None):
+        """
+        Stops the worker threads
+        :param drain: run everything already queued before stopping
+        :param timeout: seconds to wait for each worker to finish
+        """
+        if not self.running:
+            return
+        if not drain:
+            for work_queue in self._queues:
+                try:
+                    while True:
+                        if work_queue.get_nowait() is not None:
+                            self._slots.release()
+                        work_queue.task_done()
+                except queue.Empty:
+                    pass
+        logger.info(f'DISPATCHER STOPPING --->\tdraining {self.stats()["queue_depth"]} queued webhooks')
+        for work_queue in self._queues:
+            # blocking put, so the stop marker queues up behind pending work
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+dispatcher = Dispatcher()
@@ -1,10 +1,18 @@
 # configure logging
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from hashlib import md5
 from logging import getLogger, DEBUG
 
-from commons import LOG_LOCATION, UNIQUE_KEY
+from redis.exceptions import RedisError
+
+from commons import UNIQUE_KEY, ACTION_EXECUTION_POLICY, ACTION_TIMEOUT, ACTION_WORKERS, JOB_QUEUE
+from components.actions.base.action import ActionContext, ActionLogEvent
+from components.events.base.job_queue import job_queue
 from components.logs.log_event import LogEvent
+from components.logs.log_index import log_index
 from utils.log import get_logger
 
 logger = get_logger(__name__)
@@ -13,6 +21,8 @@ logger = get_logger(__name__)
 class EventManager:
     def __init__(self):
         self._events = []
+        self._events_by_name = {}
+        self._events_by_key = {}
 
     def get_all(self):
         """
@@ -27,26 +37,94 @@ class EventManager:
         :param event_name: name of event
         :return: Event()
         """
-        for event in self._events:
-            if event.name == event_name:
-                return event
+        event = self._events_by_name.get(event_name)
+        if event is None:
+            raise ValueError(f'Cannot find event with name {event_name}')
+        return event
 
-        raise ValueError(f'Cannot find event with name {event_name}')
+    def get_by_key(self, key: str):
+        """
+        Gets webhook events from manager that match given key
+        :param key: webhook key sent with the request
+        :return: list of Event()
+        """
+        return [event for event in self._events_by_key.get(key, ()) if event.webhook]
+
+    def add(self, event):
+        """
+        Adds event to manager and indexes it by name and key
+        :param event: Event() to add
+        """
+        self._events.append(event)
+        self._events_by_name.setdefault(event.name, event)
+        self._events_by_key.setdefault(event.key, []).append(event)
 
 
 em = EventManager()
 
+EXECUTION_POLICIES = ('sequential', 'parallel', 'priority')
+
+# shared by every event, created on first use
+_action_pool = None
+_action_pool_lock = threading.Lock()
+
+
+def get_action_pool():
+    """
+    Gets the thread pool actions run on when they are parallel or have a timeout
+    :return: ThreadPoolExecutor()
+    """
+    global _action_pool
+    if _action_pool is None:
+        with _action_pool_lock:
+            if _action_pool is None:
+                _action_pool = ThreadPoolExecutor(max_workers=ACTION_WORKERS, thread_name_prefix='action')
+    return _action_pool
+
+
+class ActionResult:
+    def __init__(self, action_name, status, elapsed, error=None):
+        self.action_name = action_name
+        self.status = status
+        self.elapsed = elapsed
+        self.error = error
+
+    def __str__(self):
+        return f'{self.action_name} {self.status} in {self.elapsed * 1000:.1f}ms'
+
 
 class Event:
     objects = em
+    # how linked actions are run, overridable per event:
+    #   sequential - one after another, in link order
+    #   parallel   - all at once on the shared action pool
+    #   priority   - one after another, highest Action.priority first
+    execution_policy = ACTION_EXECUTION_POLICY
+    # seconds to wait on each action before moving on (0 waits forever).
+    # A running action cannot be stopped, it finishes in the background, so with
+    # sequential or priority runs a timed out action may overlap the next one.
+    # Actions that have not started by then are cancelled.
+    action_timeout = ACTION_TIMEOUT
 
     def __init__(self):
+        if self.execution_policy not in EXECUTION_POLICIES:
+            raise ValueError(f'Execution policy must be one of {EXECUTION_POLICIES}, not "{self.execution_policy}"')
         self.name = self.get_name()
         self.active = True
         self.webhook = True  # all events are webhooks by default
         self.key = f'{self.name}:{md5(f"{self.name + UNIQUE_KEY}".encode()).hexdigest()[:6]}'
         self._actions = []
-        self.logs = [LogEvent().from_line(line) for line in open(LOG_LOCATION, 'r') if line.split(',')[0] == self.name]
+        self._logs = None
+
+    @property
+    def logs(self):
+        """
+        Gets records for this event, read from the shared log index on first use
+        :return: list of LogEvent()
+        """
+        if self._logs is None:
+            self._logs = log_index.get(self.name)
+        return self._logs
 
     def get_name(self):
         return type(self).__name__
@@ -55,7 +133,7 @@ class Event:
         self._actions.append(action)
 
     def register(self):
-        self.objects._events.append(self)
+        self.objects.add(self)
 
     def __str__(self):
         return f'{self.name}'
@@ -70,6 +148,82 @@ class Event:
         """
         self._actions.append(action)
 
+    def _run_action(self, action, data, stamps=None):
+        """
+        Runs action with its own context
+        :param stamps: received_ns/dispatched_ns for the context
+        :return: tuple of (seconds taken, exception or None)
+        """
+        start = time.perf_counter()
+        try:
+            # each run gets its own context, shared action instances hold no request data
+            context = ActionContext(data, event=self, **(stamps or {}))
+            action.set_context(context)
+            action.run(context=context)
+        except Exception as e:
+            return time.perf_counter() - start, e
+        return time.perf_counter() - start, None
+
+    def _wait_action(self, action, future, deadline):
+        """
+        Waits for an action submitted to the pool, up to deadline.
+        An action still queued at the deadline is cancelled, a running one is left to finish.
+        :return: tuple of (seconds taken, exception or None)
+        """
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                return 0, CancelledError(f'{action.name} did not start within {self.action_timeout}s')
+            return self.action_timeout, FutureTimeoutError(f'{action.name} timed out after {self.action_timeout}s')
+
+    def run_actions(self, data, received_ns=None):
+        """
+        Runs linked actions according to the execution policy.
+        A failed or timed out action does not stop the others.
+        :param data: webhook data passed to the actions
+        :param received_ns: time.monotonic_ns() when the webhook was received
+        :return: list of ActionResult()
+        """
+        stamps = {'received_ns': received_ns, 'dispatched_ns': time.monotonic_ns()}
+        timeout = self.action_timeout or None
+        actions = list(self._actions)
+        if self.execution_policy == 'priority':
+            actions.sort(key=lambda a: getattr(a, 'priority', 0), reverse=True)
+
+        if self.execution_policy == 'parallel':
+            deadline = time.monotonic() + timeout if timeout else None
+            futures = [get_action_pool().submit(self._run_action, action, data, stamps) for action in actions]
+            outcomes = [self._wait_action(action, future, deadline) for action, future in zip(actions, futures)]
+        elif timeout:
+            outcomes = [
+                self._wait_action(action, get_action_pool().submit(self._run_action, action, data, stamps),
+                                  time.monotonic() + timeout)
+                for action in actions
+            ]
+        else:
+            outcomes = [self._run_action(action, data, stamps) for action in actions]
+
+        results = []
+        for action, (elapsed, error) in zip(actions, outcomes):
+            if error is None:
+                result = ActionResult(action.name, 'ok', elapsed)
+            elif isinstance(error, FutureTimeoutError):
+                result = ActionResult(action.name, 'timeout', elapsed, error)
+            elif isinstance(error, CancelledError):
+                result = ActionResult(action.name, 'cancelled', elapsed, error)
+            else:
+                result = ActionResult(action.name, 'failed', elapsed, error)
+            if error is not None:
+                action.logs.append(ActionLogEvent('ERROR', str(error)))
+                logger.error(f'ACTION {result.status.upper()} --->\t{action.name}: {error}')
+            log_event = LogEvent(self.name, 'action_result', datetime.now(), str(result))
+            log_event.write()
+            self.logs.append(log_event)
+            results.append(result)
+        return results
+
     def trigger(self, *args, **kwargs):
         if self.active:
             logger.info(f'EVENT TRIGGERED --->\t{str(self)}')
@@ -80,8 +234,13 @@ class Event:
             data = kwargs.get('data')
 
             self.logs.append(log_event)
-            for action in self._actions:
-                action.set_data(data)
-                action.run()
+            if JOB_QUEUE:
+                # a `tvwb.py worker` runs the actions
+                try:
+                    job_queue.enqueue(self.name, data, received_ns=kwargs.get('received_ns'))
+                    return
+                except RedisError as e:
+                    logger.error(f'EVENT NOT QUEUED --->\t{str(self)}, running its actions here: {e}')
+            self.run_actions(data, received_ns=kwargs.get('received_ns'))
         else:
             logger.info(f'EVENT NOT TRIGGERED (event is inactive) --->\t{str(self)}')
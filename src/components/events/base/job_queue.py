@@ -0,0 +1,268 @@
+import json
+import time
+
+from redis import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from commons import (JOB_REDIS_URL, JOB_STREAM, JOB_GROUP, JOB_SHARDS, JOB_STREAM_MAXLEN, JOB_CLAIM_IDLE_MS,
+                     JOB_MAX_DELIVERIES)
+from components.events.base.dispatcher import shard_index
+from utils.latency import monotonic_to_wall_ns, wall_to_monotonic_ns
+from utils.log import get_logger
+from utils.raw_payload import RawPayload
+from utils.redis_pool import get_pool
+
+logger = get_logger(__name__)
+
+
+class JobQueue:
+    """
+    Redis streams of triggered events, read by a consumer group of workers.
+
+    The web process appends a job per triggered event, and `tvwb.py worker`
+    processes run the event's actions. Jobs are acknowledged once their
+    actions ran, so a job whose worker died is reclaimed by another one.
+
+    Jobs are split by clientId over `shards` streams, and each stream is
+    meant to be read by one consumer, so the jobs of a client run one after
+    another in the order they were queued.
+    """
+
+    def __init__(self, url: str = JOB_REDIS_URL, stream: str = JOB_STREAM, group: str = JOB_GROUP,
+                 maxlen: int = JOB_STREAM_MAXLEN, shards: int = JOB_SHARDS):
+        self.url = url
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+        self.shards = max(shards, 1)
+        self._connection = None
+
+    @property
+    def streams(self):
+        """Gets the stream of each shard, a single shard uses the stream name as is"""
+        if self.shards == 1:
+            return [self.stream]
+        return [f'{self.stream}:{shard}' for shard in range(self.shards)]
+
+    @property
+    def dead_stream(self):
+        return f'{self.stream}:dead'
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = Redis(connection_pool=get_pool(self.url, decode_responses=True))
+        return self._connection
+
+    def enqueue(self, event_name: str, data, received_ns=None):
+        """
+        Appends a job running event_name's actions with data, to the stream of its clientId
+        :param received_ns: time.monotonic_ns() when the webhook was received
+        :return: stream id of the job
+        """
+        raw = getattr(data, 'raw', None)
+        fields = {
+            'event': event_name,
+            # a body kept as sent (see RawPayload) is queued as is
+            'data': raw if raw is not None else json.dumps(data),
+            'raw': int(raw is not None),
+            'enqueued_ns': time.time_ns(),
+        }
+        if received_ns is not None:
+            # wall time, monotonic stamps mean nothing in the worker's process
+            fields['received_ns'] = monotonic_to_wall_ns(received_ns)
+        stream = self.streams[shard_index(data, event_name, self.shards)]
+        return self.connection.xadd(stream, fields, maxlen=self.maxlen, approximate=True)
+
+    @staticmethod
+    def decode(fields):
+        """
+        Gets the event name and data of a job
+        :return: tuple of (event name, data)
+        """
+        if fields.get('raw') == '1':
+            return fields['event'], RawPayload.parse(fields['data'])
+        return fields['event'], json.loads(fields['data'])
+
+    @staticmethod
+    def received_ns(fields):
+        """
+        Gets when a job's webhook was received, or else queued, in this process's clock
+        :return: time.monotonic_ns() stamp, or None for jobs queued without one
+        """
+        stamp = fields.get('received_ns') or fields.get('enqueued_ns')
+        return wall_to_monotonic_ns(int(stamp)) if stamp else None
+
+    def ensure_group(self):
+        """Creates the streams and consumer group if needed"""
+        for stream in self.streams:
+            try:
+                self.connection.xgroup_create(stream, self.group, id='0', mkstream=True)
+            except ResponseError as err:
+                if 'BUSYGROUP' not in str(err):
+                    raise
+
+    def stats(self):
+        """
+        Gets the length of the streams and, per consumer group, consumers and pending jobs over all of them
+        :return: dict
+        """
+        lengths, groups = {}, {}
+        for stream in self.streams:
+            lengths[stream] = self.connection.xlen(stream)
+            for group in self.connection.xinfo_groups(stream):
+                totals = groups.setdefault(group['name'], {'consumers': 0, 'pending': 0})
+                totals['consumers'] += group['consumers']
+                totals['pending'] += group['pending']
+        return {'length': sum(lengths.values()), 'streams': lengths, 'dead': self.connection.xlen(self.dead_stream),
+                'groups': groups}
+
+
+class JobWorker:
+    """
+    Reads jobs for one consumer of the group and runs them.
+
+    A worker reads the streams of its shards, all of them by default, and
+    runs each stream's jobs in order. Run one worker per shard to keep the
+    order of a clientId's jobs.
+    """
+
+    def __init__(self, job_queue: JobQueue, manager, consumer: str, count: int = 10, block_ms: int = 5000,
+                 claim_idle_ms: int = JOB_CLAIM_IDLE_MS, max_deliveries: int = JOB_MAX_DELIVERIES, shards=None):
+        """
+        :param manager: EventManager() to look the jobs' events up in
+        :param consumer: name of this consumer, unique within the group and the same after a restart
+        :param count: jobs read per call
+        :param block_ms: milliseconds to wait for new jobs
+        :param shards: indexes of the shards read, None for all
+        """
+        self.queue = job_queue
+        self.manager = manager
+        self.consumer = consumer
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        streams = job_queue.streams
+        self.streams = streams if shards is None else [streams[shard] for shard in shards]
+        self.processed = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self._next_claim = 0.0
+
+    def run_job(self, job_id, fields):
+        event_name, data = self.queue.decode(fields)
+        event = self.manager.get(event_name)
+        event.run_actions(data, received_ns=self.queue.received_ns(fields))
+
+    def process(self, stream, entries):
+        """Runs and acknowledges jobs read from stream"""
+        connection = self.queue.connection
+        for job_id, fields in entries:
+            # a job deleted from the stream while pending comes back without fields
+            if fields:
+                try:
+                    self.run_job(job_id, fields)
+                    self.processed += 1
+                except Exception as e:
+                    # actions report their own failures, this job cannot be run at all
+                    self.failed += 1
+                    logger.exception(f'JOB FAILED --->\t{job_id}: {e}')
+                    self.dead_letter(stream, job_id, fields, str(e))
+                    continue
+            connection.xack(stream, self.queue.group, job_id)
+
+    def dead_letter(self, stream, job_id, fields, reason: str):
+        """Moves a job to the dead-letter stream"""
+        connection = self.queue.connection
+        connection.xadd(self.queue.dead_stream, {**(fields or {}), 'job_id': job_id, 'reason': reason},
+                        maxlen=self.queue.maxlen, approximate=True)
+        connection.xack(stream, self.queue.group, job_id)
+
+    def read(self, last_id: str, block_ms=None):
+        """
+        Reads and runs jobs of every stream of this worker
+        :param last_id: '>' for new jobs, '0' for the ones delivered to this consumer and not acknowledged
+        :return: number of jobs run
+        """
+        response = self.queue.connection.xreadgroup(self.queue.group, self.consumer,
+                                                    {stream: last_id for stream in self.streams},
+                                                    count=self.count, block=block_ms)
+        read = 0
+        for stream, entries in response or []:
+            self.process(stream, entries)
+            read += len(entries)
+        return read
+
+    def recover(self):
+        """
+        Runs the jobs this consumer read before it was restarted, ahead of new ones
+        :return: number of jobs run
+        """
+        recovered = 0
+        while True:
+            count = self.read('0')
+            if not count:
+                return recovered
+            recovered += count
+
+    def reclaim(self):
+        """
+        Takes over jobs left unacknowledged by other consumers,
+        moving those delivered too often to the dead-letter stream.
+        With one consumer per shard this only finds jobs of consumers
+        that were renamed, i.e. after the number of processes changed.
+        :return: number of jobs reclaimed
+        """
+        connection = self.queue.connection
+        reclaimed = 0
+        for stream in self.streams:
+            pending = connection.xpending_range(stream, self.queue.group, '-', '+', self.count * 10,
+                                                idle=self.claim_idle_ms)
+            for job in pending:
+                if job['times_delivered'] >= self.max_deliveries:
+                    entries = connection.xrange(stream, job['message_id'], job['message_id'])
+                    fields = entries[0][1] if entries else None
+                    logger.error(f'JOB DEAD --->\t{job["message_id"]} after {job["times_delivered"]} deliveries')
+                    self.dead_letter(stream, job['message_id'], fields, f'delivered {job["times_delivered"]} times')
+            response = connection.xautoclaim(stream, self.queue.group, self.consumer, self.claim_idle_ms,
+                                             start_id='0-0', count=self.count)
+            entries = response[1]
+            if entries:
+                logger.warning(f'Reclaimed {len(entries)} jobs of {stream} for {self.consumer}')
+                self.reclaimed += len(entries)
+                self.process(stream, entries)
+            reclaimed += len(entries)
+        return reclaimed
+
+    def run_once(self):
+        """
+        Reclaims stale jobs now and then, and runs new ones
+        :return: number of new jobs run
+        """
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + self.claim_idle_ms / 1000 / 2
+            self.reclaim()
+        return self.read('>', self.block_ms)
+
+    def run(self, stop=None):
+        """
+        Runs jobs until stop is set
+        :param stop: threading.Event(), or None to run forever
+        """
+        self.queue.ensure_group()
+        logger.info(f'WORKER STARTED --->\t{self.consumer} on {", ".join(self.streams)}/{self.queue.group}')
+        recovered = False
+        while stop is None or not stop.is_set():
+            try:
+                if not recovered:
+                    self.recover()
+                    recovered = True
+                self.run_once()
+            except RedisError as e:
+                logger.error(f'WORKER ERROR --->\t{self.consumer}: {e}')
+                time.sleep(1)
+        logger.info(f'WORKER STOPPED --->\t{self.consumer}: {self.processed} jobs, {self.failed} failed')
+
+
+job_queue = JobQueue()
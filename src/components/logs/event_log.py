@@ -0,0 +1,207 @@
+import fcntl
+import os
+from collections import deque
+
+from commons import LOG_LOCATION, LOG_LIMIT, LOG_MAX_BYTES, LOG_SEGMENTS
+
+# bytes read per step when scanning a segment backwards
+TAIL_BLOCK_SIZE = 8192
+
+
+class EventLog:
+    """
+    Append-only log file, split into segments.
+
+    New lines are appended to the active segment at `path`. Once it holds
+    `max_lines` lines (or `max_bytes` bytes) it is renamed to `path.1`, older
+    segments shift up, and anything past `segments` is dropped. Writers
+    from every process serialise on an flock'd `path.lock` file, which is
+    never renamed, so the lock stays valid across rotations.
+    """
+
+    def __init__(self, path=LOG_LOCATION, max_lines=LOG_LIMIT, max_bytes=LOG_MAX_BYTES, segments=LOG_SEGMENTS):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.segments = segments
+        # line count of the active segment, valid while its inode and size match
+        self._lines = 0
+        self._inode = None
+        self._size = 0
+
+    def segment_path(self, idx):
+        return self.path if idx == 0 else f'{self.path}.{idx}'
+
+    def _sync(self):
+        """Catches up with rotations and appends made by other processes, reading only the new bytes"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._lines, self._inode, self._size = 0, None, 0
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._size:
+            self._lines, self._inode, self._size = 0, stat.st_ino, 0
+        if stat.st_size > self._size:
+            with open(self.path, 'rb') as segment:
+                segment.seek(self._size)
+                self._lines += segment.read(stat.st_size - self._size).count(b'\n')
+            self._size = stat.st_size
+
+    def _rotate(self):
+        for idx in range(self.segments, 0, -1):
+            try:
+                os.replace(self.segment_path(idx - 1), self.segment_path(idx))
+            except FileNotFoundError:
+                pass
+        if not self.segments:
+            open(self.path, 'w').close()
+        self._lines, self._inode, self._size = 0, None, 0
+
+    def append(self, lines):
+        """
+        Appends lines to the log, rotating first if the active segment is full
+        :param lines: list of str, each ending in a newline
+        """
+        data = ''.join(lines).encode()
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                if self._lines and (self._lines + len(lines) > self.max_lines or
+                                    (self.max_bytes and self._size + len(data) > self.max_bytes)):
+                    self._rotate()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                    stat = os.fstat(fd)
+                finally:
+                    os.close(fd)
+                self._lines += len(lines)
+                self._inode, self._size = stat.st_ino, stat.st_size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_lines(self, limit=None):
+        """
+        Gets lines from the log, oldest first
+        :param limit: only return the latest `limit` lines
+        :return: list of str
+        """
+        lines = deque(maxlen=limit)
+        for idx in range(self.segments, -1, -1):
+            try:
+                with open(self.segment_path(idx), 'r') as segment:
+                    lines.extend(line for line in segment if line.strip())
+            except FileNotFoundError:
+                continue
+        return list(lines)
+
+    @staticmethod
+    def _matches(line, parent):
+        return line.strip() and (parent is None or line.split(',', 1)[0] == parent)
+
+    @staticmethod
+    def _reverse_lines(segment, end):
+        """Yields lines from segment, last first, reading blocks back from byte offset end"""
+        position, head = end, b''
+        while position > 0:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            segment.seek(position)
+            lines = (segment.read(size) + head).split(b'\n')
+            # the first piece may be the end of a line that starts in an earlier block
+            head = lines.pop(0)
+            yield from reversed(lines)
+        if head:
+            yield head
+
+    @classmethod
+    def _complete_end(cls, segment, size):
+        """Gets the byte offset just past the last complete line, skipping one still being written"""
+        if not size:
+            return 0
+        segment.seek(size - 1)
+        if segment.read(1) == b'\n':
+            return size
+        return size - len(next(cls._reverse_lines(segment, size)))
+
+    def tail(self, limit, parent=None):
+        """
+        Gets the latest lines by scanning segments backwards from the end
+        :param limit: number of lines to return
+        :param parent: only return lines with this parent
+        :return: tuple of (list of str oldest first, cursor after the last line)
+        """
+        lines = []
+        cursor = ''
+        for idx in range(self.segments + 1):
+            try:
+                segment = open(self.segment_path(idx), 'rb')
+            except FileNotFoundError:
+                continue
+            with segment:
+                stat = os.fstat(segment.fileno())
+                end = self._complete_end(segment, stat.st_size)
+                if idx == 0:
+                    cursor = f'{stat.st_ino}:{end}'
+                for raw in self._reverse_lines(segment, end):
+                    line = raw.decode() + '\n'
+                    if self._matches(line, parent):
+                        lines.append(line)
+                        if len(lines) >= limit:
+                            return lines[::-1], cursor
+        return lines[::-1], cursor
+
+    def read_after(self, cursor=None, limit=None, parent=None):
+        """
+        Gets lines written after cursor, oldest first
+        :param cursor: "inode:offset" from an earlier call, or a plain byte offset into the active segment
+        :param limit: return at most this many lines
+        :param parent: only return lines with this parent
+        :return: tuple of (list of str, cursor to pass to the next call)
+        """
+        inode, offset = None, 0
+        if cursor:
+            inode, _, offset = cursor.rpartition(':')
+            inode, offset = (int(inode) if inode else None), int(offset)
+
+        segments = []
+        for idx in range(self.segments, -1, -1):
+            try:
+                segments.append(open(self.segment_path(idx), 'rb'))
+            except FileNotFoundError:
+                continue
+        try:
+            inodes = [os.fstat(segment.fileno()).st_ino for segment in segments]
+            if cursor and inode is None and segments and segments[-1].name == self.path:
+                # a plain byte offset is relative to the active segment
+                inode = inodes[-1]
+            if inode not in inodes:
+                # no cursor, or its segment has been rotated away: start from the oldest segment
+                inode, offset = None, 0
+            start = inodes.index(inode) if inode is not None else 0
+
+            lines = []
+            next_cursor = ''
+            for segment, segment_inode in zip(segments[start:], inodes[start:]):
+                position = offset if segment_inode == inode else 0
+                segment.seek(position)
+                for raw in segment:
+                    if not raw.endswith(b'\n'):
+                        # still being written, picked up by the next call
+                        break
+                    position += len(raw)
+                    line = raw.decode()
+                    if self._matches(line, parent):
+                        lines.append(line)
+                        if limit and len(lines) >= limit:
+                            return lines, f'{segment_inode}:{position}'
+                next_cursor = f'{segment_inode}:{position}'
+            return lines, next_cursor or (cursor or '')
+        finally:
+            for segment in segments:
+                segment.close()
+
+
+event_log = EventLog()
@@ -1,14 +1,27 @@
 from datetime import datetime
 
-from commons import LOG_LOCATION, LOG_LIMIT
+from components.logs.log_writer import log_writer
 
 import logging
 
+EVENT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_event_time(value):
+    """
+    Parses an event time written by to_line, i.e. "2023-01-31 13:45:00".
+    fromisoformat reads this fixed format much faster than strptime.
+    """
+    if len(value) == 19 and value[10] == " ":
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, EVENT_TIME_FORMAT)
+
+
 class LogEvent:
     def __init__(self, parent=None, event_type=None, event_time=None, event_data=None):
         self.parent = parent
         self.event_type = event_type
-        self.event_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.event_time = datetime.now().strftime(EVENT_TIME_FORMAT)
         self.event_data = event_data.replace(',', ' ') if event_data else None
 
     def __str__(self):
@@ -48,7 +61,7 @@ class LogEvent:
             self.parent, self.event_type, self.event_time, self.event_data = line.split(
                 ","
             )
-            self.event_time = datetime.strptime(self.event_time, "%Y-%m-%d %H:%M:%S")
+            self.event_time = parse_event_time(self.event_time)
         except ValueError as e:
             logging.error(f"ValueError: {e} occurred for line: {line}")
             # Optionally, you can re-raise the exception if you want the program to stop on errors
@@ -57,19 +70,7 @@ class LogEvent:
 
     def write(self):
         try:
-            # Opening the file in append mode or write mode based on log limit
-            mode = "w" if len(open(LOG_LOCATION, "r").readlines()) >= LOG_LIMIT else "a"
-            with open(LOG_LOCATION, mode) as log_file:
-                # Acquiring an exclusive lock
-                fcntl.flock(log_file, fcntl.LOCK_EX)
-
-                if mode == "w":
-                    rows = open(LOG_LOCATION, "r").readlines()
-                    log_file.writelines(rows[1:])
-                log_file.write(self.to_line())
-
-                # Releasing the lock
-                fcntl.flock(log_file, fcntl.LOCK_UN)
+            log_writer.submit(self.to_line())
         except IOError as e:
             logging.error(f"I/O error({e.errno}): {e.strerror}")
         except Exception as e:
@@ -0,0 +1,53 @@
+import threading
+
+from components.logs.event_log import event_log
+from components.logs.log_event import LogEvent
+
+
+class LogIndex:
+    """
+    Event log parsed once and grouped by parent, so each event reads its
+    own records instead of scanning the whole log at startup.
+    """
+
+    def __init__(self, log=event_log):
+        self.log = log
+        self._by_parent = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """
+        Parses the event log into records grouped by parent
+        :return: dict of parent name to list of LogEvent()
+        """
+        by_parent = {}
+        for line in self.log.read_lines():
+            try:
+                log_event = LogEvent().from_line(line)
+            except ValueError:
+                # from_line has logged the bad line already
+                continue
+            by_parent.setdefault(log_event.parent, []).append(log_event)
+        self._by_parent = by_parent
+        return by_parent
+
+    def get(self, parent):
+        """
+        Gets records for parent, parsing the log on first use
+        :param parent: name of the event or action
+        :return: list of LogEvent()
+        """
+        with self._lock:
+            if self._by_parent is None:
+                self.build()
+            return list(self._by_parent.get(parent, ()))
+
+    def reset(self):
+        """
+        Drops parsed records, the log is parsed again on next use
+        """
+        with self._lock:
+            self._by_parent = None
+
+
+log_index = LogIndex()
@@ -0,0 +1,86 @@
+import atexit
+import logging
+import threading
+
+from commons import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_SYNC
+from components.logs.event_log import event_log
+
+
+class LogWriter:
+    """
+    Batches log lines from every thread and appends them to the event log
+    from one background thread, once `batch_size` lines are pending or
+    `interval` seconds have passed. In sync mode lines are written
+    straight away on the calling thread.
+    """
+
+    def __init__(self, log=event_log, batch_size=LOG_BATCH_SIZE, interval=LOG_FLUSH_INTERVAL, sync=LOG_SYNC):
+        self.log = log
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sync = sync
+        self._pending = []
+        self._cond = threading.Condition()
+        # held while appending, so batches reach the file in submit order
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def _ensure_thread(self):
+        # threads do not survive a fork, so this is checked on every submit
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._work, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, line):
+        """
+        Queues a line for the event log
+        :param line: str ending in a newline
+        """
+        if self.sync:
+            self.log.append([line])
+            return
+        with self._cond:
+            self._pending.append(line)
+            self._ensure_thread()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """
+        Writes every pending line to the event log
+        """
+        with self._write_lock:
+            with self._cond:
+                lines, self._pending = self._pending, []
+            if lines:
+                self.log.append(lines)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or len(self._pending) >= self.batch_size, self.interval)
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush event log: {e}")
+            if stopped:
+                return
+
+    def close(self):
+        """
+        Flushes pending lines and stops the background thread
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.close)
@@ -2,18 +2,26 @@
 import logging
 from logging import getLogger, DEBUG
 from flask_cors import CORS
+import atexit
 import os
+import time
 import requests
 from dotenv import load_dotenv
 import tbot
 from flask import Flask, request, jsonify, render_template, Response, redirect
 
-from commons import VERSION_NUMBER, LOG_LOCATION
+from commons import VERSION_NUMBER, LOG_LIMIT, ASYNC_DISPATCH, RAW_FORWARD, SERVER_THREADS
 from components.actions.base.action import am
+from components.events.base.dispatcher import dispatcher
 from components.events.base.event import em
+from components.logs.event_log import event_log
 from components.logs.log_event import LogEvent
+from components.logs.log_writer import log_writer
 from components.schemas.trading import Order, Position
+from utils.broadcast import broadcaster
 from utils.log import get_logger
+from utils.raw_payload import RawPayload
+from utils.redis_pool import get_pool_stats
 from utils.register import register_action, register_event, register_link
 from distutils.util import strtobool
 
@@ -25,6 +33,11 @@ registered_actions = [register_action(action) for action in REGISTERED_ACTIONS]
 registered_events = [register_event(event) for event in REGISTERED_EVENTS]
 registered_links = [register_link(link, em, am) for link in REGISTERED_LINKS]
 
+# start the dispatch workers, queued webhooks are drained on shutdown
+if ASYNC_DISPATCH:
+    dispatcher.start()
+    atexit.register(dispatcher.shutdown)
+
 # Set the default path to the .env file in the user's home directory
 DEFAULT_ENV_FILE_PATH = os.path.expanduser("~/.env")
 
@@ -55,6 +68,7 @@ app.add_url_rule("/orders/data", view_func=tbot.get_orders_data)
 app.add_url_rule("/alerts/data", view_func=tbot.get_alerts_data)
 app.add_url_rule("/errors/data", view_func=tbot.get_errors_data)
 app.add_url_rule("/tbot/data", view_func=tbot.get_tbot_data)
+app.add_url_rule("/tbot/cache/stats", view_func=tbot.get_cache_stats)
 app.teardown_appcontext(tbot.close_connection)
 
 schema_list = {"order": Order().as_json(), "position": Position().as_json()}
@@ -158,7 +172,11 @@ def dashboard():
 @app.route("/webhook", methods=["POST"])
 def webhook():
     if request.method == "POST":
-        jsondic_data = request.get_json(force=True, silent=True)
+        received_ns = time.monotonic_ns()
+        if RAW_FORWARD:
+            jsondic_data = RawPayload.parse(request.get_data(as_text=True))
+        else:
+            jsondic_data = request.get_json(force=True, silent=True)
         if not jsondic_data:
             logger.warning(f"Invalid JSON response {jsondic_data}")
             return Response(status=415)
@@ -167,11 +185,16 @@ def webhook():
             return Response(status=415)
         logger.debug(f"Request Data: {jsondic_data}")
         triggered_events = []
-        for event in em.get_all():
-            if event.webhook:
-                if event.key == jsondic_data["key"]:
-                    event.trigger(data=jsondic_data)
-                    triggered_events.append(event.name)
+        events = em.get_by_key(jsondic_data["key"])
+        if events and ASYNC_DISPATCH:
+            if not dispatcher.submit(events, jsondic_data, received_ns=received_ns):
+                logger.warning(f"Dispatch queue full, rejecting webhook request {jsondic_data}")
+                return Response(status=503)
+            triggered_events = [event.name for event in events]
+        else:
+            for event in events:
+                event.trigger(data=jsondic_data, received_ns=received_ns)
+                triggered_events.append(event.name)
 
         if not triggered_events:
             logger.warning(f"No events triggered for webhook request {jsondic_data}")
@@ -187,12 +210,63 @@ def webhook():
     return Response(status=200)
 
 
+@app.route("/dispatch/stats", methods=["GET"])
+def get_dispatch_stats():
+    if request.method == 'GET':
+        return jsonify(dispatcher.stats())
+
+
+@app.route("/redis/stats", methods=["GET"])
+def get_redis_stats():
+    if request.method == 'GET':
+        return jsonify(get_pool_stats())
+
+
 @app.route("/logs", methods=["GET"])
 def get_logs():
     if request.method == 'GET':
-        log_file = open(LOG_LOCATION, 'r')
-        logs = [LogEvent().from_line(log) for log in log_file.readlines()]
-        return jsonify([log.as_json() for log in logs])
+        log_writer.flush()
+        after = request.args.get('after', None)
+        limit = request.args.get('limit', None, type=int)
+        parent = request.args.get('parent', None)
+
+        # without paging parameters, keep returning a plain list of the latest logs
+        if after is None and limit is None and parent is None:
+            lines, _ = event_log.tail(LOG_LIMIT)
+            return jsonify([LogEvent().from_line(line).as_json() for line in lines])
+
+        try:
+            if after is None:
+                lines, cursor = event_log.tail(limit or LOG_LIMIT, parent)
+            else:
+                lines, cursor = event_log.read_after(after, limit, parent)
+        except ValueError:
+            return Response(f'Invalid cursor ({after})', status=400)
+        return jsonify({
+            'logs': [LogEvent().from_line(line).as_json() for line in lines],
+            'cursor': cursor
+        })
+
+
+@app.route("/stream", methods=["GET"])
+def stream():
+    if request.method == 'GET':
+        subscription = broadcaster.subscribe()
+        # the browser falls back to polling when refused
+        if subscription is None:
+            return Response('Too many stream clients', status=503)
+
+        def generate():
+            try:
+                yield 'retry: 5000\n\n'
+                while True:
+                    # a comment every 15s stops proxies closing an idle stream
+                    yield ''.join(subscription.get(timeout=15)) or ': keepalive\n\n'
+            finally:
+                broadcaster.unsubscribe(subscription)
+
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route("/event/active", methods=["POST"])
@@ -233,7 +307,7 @@ if __name__ == "__main__":
         
         if is_production:
             logger.info("Starting in production mode.")
-            serve(app, host="0.0.0.0", port=port)
+            serve(app, host="0.0.0.0", port=port, threads=SERVER_THREADS)
         else:
             logger.info("Starting in development mode with debug.")
             app.run(debug=True, host="0.0.0.0", port=port)
@@ -1,12 +1,24 @@
 $(document).ready(function () {
+    const LOG_COUNT = 10;
+    // latest logs, newest first, and the cursor to fetch anything after them
+    let logs = [];
+    let cursor = null;
+
+    function addLogs(data) {
+        cursor = data.cursor;
+        if (data.logs.length === 0 && logs.length > 0) {
+            return
+        }
+        logs = data.logs.reverse().concat(logs).splice(0, LOG_COUNT);
+        createLogs(logs);
+    }
+
     function getLogData() {
         $.ajax({
             url: '/logs',
             type: 'GET',
-            success: function (data) {
-                data.reverse()
-                createLogs(data.splice(0, 10));
-            },
+            data: cursor === null ? {limit: LOG_COUNT} : {after: cursor, limit: LOG_COUNT},
+            success: addLogs,
             error: function (error) {
                 console.log(error)
                 return []
@@ -52,7 +64,5 @@ $(document).ready(function () {
     }
 
     getLogData();
-    setInterval(function () {
-        getLogData()
-    }, 10000);
+    subscribeLiveUpdates({logs: addLogs, reset: getLogData}, getLogData, 10000);
 });
\ No newline at end of file
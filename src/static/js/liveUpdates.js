@@ -0,0 +1,35 @@
+// Listens for live updates on /stream, falling back to polling when the
+// browser has no EventSource or the server refuses the stream.
+//   handlers: {eventName: function (data) {...}}
+//   poll: called every `interval` ms while the stream is down
+function subscribeLiveUpdates(handlers, poll, interval) {
+    let timer = null;
+
+    function startPolling() {
+        if (timer === null) {
+            timer = setInterval(poll, interval);
+        }
+    }
+
+    function stopPolling() {
+        if (timer !== null) {
+            clearInterval(timer);
+            timer = null;
+        }
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource('/stream');
+    Object.keys(handlers).forEach(function (event) {
+        source.addEventListener(event, function (message) {
+            handlers[event](JSON.parse(message.data));
+        });
+    });
+    source.addEventListener('open', stopPolling);
+    // the browser reconnects by itself, poll until it does (or for good if the stream was refused)
+    source.addEventListener('error', startPolling);
+}
@@ -0,0 +1,80 @@
+// DataTables server-side processing against the /<table>/data endpoints.
+// When the page after the one shown is requested, the cursor the server
+// returned for its last row is sent along (`after`), so the server seeks to
+// it instead of skipping every row before the page.
+//   $('#table').DataTable({serverSide: true, ajax: serverSideAjax('/orders/data'), ...})
+function serverSideAjax(url) {
+    let requested = null;
+    let next = null;
+
+    return {
+        url: url,
+        data: function (params) {
+            const state = JSON.stringify([params.order, params.search, params.length]);
+            if (next !== null && next.state === state && next.start === params.start) {
+                params.after = JSON.stringify(next.after);
+            }
+            requested = {state: state, start: params.start + params.length};
+        },
+        dataSrc: function (json) {
+            next = json.after ? {state: requested.state, start: requested.start, after: json.after} : null;
+            return json.data;
+        }
+    };
+}
+
+// Row ids of server-side tables, so rows can be found when they change.
+function serverRowId(row) {
+    return 'row_' + row._rowid;
+}
+
+// Follows the rows added or changed after a rowid watermark (url?since=...).
+// Changed rows shown on the page are updated in place, the page is only
+// fetched again when rows were added.
+//   const deltas = followDeltas(dataTable, '/orders/data');
+//   subscribeLiveUpdates({db: deltas.refresh, reset: deltas.reset}, deltas.refresh, 10000);
+function followDeltas(dataTable, url) {
+    let watermark = null;
+    let busy = false;
+
+    function refresh() {
+        if (busy) {
+            return;
+        }
+        busy = true;
+        const params = watermark === null ? {since: ''} : {since: watermark.since, updated: JSON.stringify(watermark.updated)};
+        $.getJSON(url, params).done(function (json) {
+            if (json.since === null) {
+                return;
+            }
+            const previous = watermark;
+            watermark = {since: json.since, updated: json.updated};
+            if (previous === null) {
+                return;
+            }
+            let added = json.more;
+            json.data.forEach(function (data) {
+                const row = dataTable.row('#' + serverRowId(data));
+                if (row.any()) {
+                    row.data(data);
+                } else if (data._rowid > previous.since) {
+                    added = true;
+                }
+            });
+            if (added) {
+                dataTable.ajax.reload(null, false);
+            }
+        }).always(function () {
+            busy = false;
+        });
+    }
+
+    function reset() {
+        watermark = null;
+        dataTable.ajax.reload(null, false);
+        refresh();
+    }
+
+    refresh();
+    return {refresh: refresh, reset: reset};
+}
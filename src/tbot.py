@@ -4,11 +4,15 @@ Reading database for Tbot on Tradingboat
 """
 import sqlite3
 import os
-from flask import request, render_template
-from flask import g
+import threading
+import time
+from flask import Response, json, request, render_template
 from dotenv import load_dotenv
 
+from utils.datatables import TableSource, fetch_delta, fetch_page, parse_delta, parse_request
 from utils.log import get_logger
+from utils.result_cache import DataVersion, ResultCache
+from utils.timeline import ROWS_QUERY, TIMELINE_COLUMNS, Timeline
 
 logger = get_logger(__name__)
 
@@ -25,34 +29,197 @@ else:
 load_dotenv(dotenv_path=ENV_FILE_PATH, override=True)
 
 
+# read-only connections to the TBOT database, one per thread, kept open across requests
+DB_MMAP_SIZE = int(os.environ.get("TBOT_DB_MMAP_SIZE", 256 * 1024 * 1024))
+# negative values are KiB, as in PRAGMA cache_size
+DB_CACHE_SIZE = int(os.environ.get("TBOT_DB_CACHE_SIZE", -16 * 1024))
+_local = threading.local()
+
+
+def connect_db(path):
+    """Open a read-only connection to the database.
+    Autocommit mode keeps no read transaction open between queries,
+    so TBOT's writer can always checkpoint the WAL.
+    """
+    database = sqlite3.connect(
+        f"file:{path}?mode=ro",
+        uri=True,
+        timeout=10,  # Add timeout to handle database locks
+        isolation_level=None,
+    )
+    database.row_factory = sqlite3.Row
+    database.execute("PRAGMA query_only = ON")
+    database.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    database.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    return database
+
+
 def get_db():
-    """Get the database"""
-    database = getattr(g, "_database", None)
-    if database is None:
-        try:
-            database = g._database = sqlite3.connect(
-                os.environ.get("TBOT_DB_OFFICE", "/run/tbot/tbot_sqlite3"),
-                timeout=10  # Add timeout to handle database locks
-            )
-            database.row_factory = sqlite3.Row
-            logger.info("Database connection established.")
-        except sqlite3.Error as e:
-            logger.error(f"Database connection error: {e}")
-            raise
+    """Get the database connection of this thread, reconnecting after a fork
+    or when TBOT has replaced the database file
+    """
+    path = os.environ.get("TBOT_DB_OFFICE", "/run/tbot/tbot_sqlite3")
+    try:
+        inode = os.stat(path).st_ino
+    except OSError as e:
+        logger.error(f"Database connection error: {e}")
+        raise sqlite3.OperationalError(str(e)) from e
+    database = getattr(_local, "database", None)
+    if database is not None and _local.key == (os.getpid(), path, inode):
+        return database
+    if database is not None and _local.key[0] == os.getpid():
+        database.close()
+        _local.database = None
+        TABLE_COLUMNS.clear()
+    try:
+        database = connect_db(path)
+        logger.info("Database connection established.")
+    except sqlite3.Error as e:
+        logger.error(f"Database connection error: {e}")
+        raise
+    _local.database = database
+    _local.key = (os.getpid(), path, inode)
     return database
 
+
+def fetch_rows(query, args=(), db=get_db):
+    """Query database, raising errors"""
+    started = time.perf_counter()
+    cur = db().execute(query, args)
+    rows = cur.fetchall()
+    unpacked = [{k: item[k] for k in item.keys()} for item in rows]
+    cur.close()
+    logger.info(f"Database query executed successfully in {(time.perf_counter() - started) * 1000:.2f} ms.")
+    return unpacked
+
+
 def query_db(query, args=()):
     """Query database"""
     try:
-        cur = get_db().execute(query, args)
-        rows = cur.fetchall()
-        unpacked = [{k: item[k] for k in item.keys()} for item in rows]
-        cur.close()
-        logger.info("Database query executed successfully.")
+        return fetch_rows(query, args)
     except Exception as err:
         logger.error(f"Failed to execute query: {query} with error: {err}")
         return []
-    return unpacked
+
+
+# JSON of the data endpoints, shared by every tab polling while TBOT writes nothing
+RESULT_CACHE_BYTES = int(os.environ.get("TBOT_DB_RESULT_CACHE_BYTES", 32 * 1024 * 1024))
+result_cache = ResultCache(RESULT_CACHE_BYTES)
+data_version = DataVersion()
+
+# request arguments that change with every request, but not the result
+UNCACHED_ARGS = ("draw", "_")
+
+
+def cached_json(produce, draw=None):
+    """Serve the JSON of produce(), computed once per request arguments and
+    database version. DataTables' draw counter is added to the cached JSON.
+    """
+    key = (request.path, tuple(sorted((name, tuple(values)) for name, values in request.args.lists()
+                                      if name not in UNCACHED_ARGS)))
+
+    def serialise():
+        return json.dumps(produce()).encode()
+
+    try:
+        version = data_version.get()
+    except sqlite3.Error:
+        version = None
+    body = serialise() if version is None else result_cache.get(key, version, serialise)
+    if draw is not None:
+        body = b'{"draw": %d, ' % draw + body[1:]
+    return Response(body, mimetype="application/json")
+
+
+def query_all(query, db=get_db):
+    """Query every row for AJAX"""
+    try:
+        return cached_json(lambda: {"data": fetch_rows(query, db=db)})
+    except Exception as err:
+        logger.error(f"Failed to execute query: {query} with error: {err}")
+        return {"data": []}
+
+
+def get_cache_stats():
+    """Get hits and misses of the result cache"""
+    return result_cache.stats()
+
+
+# column names of each table, read once with PRAGMA table_info
+TABLE_COLUMNS = {}
+
+# the join of TBOTORDERS and TBOTALERTS served on /tbot/data
+TBOT_COLUMNS = {
+    "timestamp": "TBOTORDERS.timestamp",
+    "uniquekey": "TBOTORDERS.uniquekey",
+    "tv_timestamp": "TBOTALERTS.tv_timestamp",
+    "ticker": "TBOTALERTS.ticker",
+    "tv_price": "TBOTALERTS.tv_price",
+    "avgprice": "TBOTORDERS.avgprice",
+    "direction": "TBOTALERTS.direction",
+    "action": "TBOTORDERS.action",
+    "ordertype": "TBOTORDERS.ordertype",
+    "qty": "TBOTORDERS.qty",
+    "position": "TBOTORDERS.position",
+    "orderref": "TBOTALERTS.orderref",
+    "orderstatus": "TBOTORDERS.orderstatus",
+}
+TBOT_JOIN = (
+    "TBOTORDERS INNER JOIN TBOTALERTS "
+    "ON TBOTALERTS.orderref = TBOTORDERS.orderref "
+    "AND TBOTALERTS.uniquekey = TBOTORDERS.uniquekey"
+)
+
+
+# alert to order timeline kept in a side SQLite file, i.e. next to TBOT's database.
+# Empty (the default) joins TBOT's tables on every call.
+TIMELINE_PATH = os.environ.get("TBOT_TIMELINE", "")
+timeline = Timeline(TIMELINE_PATH) if TIMELINE_PATH else None
+TIMELINE_SOURCE = TableSource("timeline", {column: column for column in TIMELINE_COLUMNS}, key="id",
+                              default_order="uniquekey", updated="timestamp", total=ROWS_QUERY)
+
+
+def timeline_db():
+    """Refresh the timeline with TBOT's new rows and get a connection to read it"""
+    timeline.refresh(os.environ.get("TBOT_DB_OFFICE", "/run/tbot/tbot_sqlite3"))
+    return timeline.reader()
+
+
+def table_source(table, updated=None):
+    """Get a table's rows for DataTables, its columns being the only ones sortable and searchable.
+    updated names the column stamped when a row is updated in place.
+    """
+    columns = TABLE_COLUMNS.get(table)
+    if not columns:
+        try:
+            rows = get_db().execute(f"PRAGMA table_info({table})").fetchall()
+        except sqlite3.Error:
+            rows = []
+        columns = {row["name"]: f'"{row["name"]}"' for row in rows}
+        if columns:
+            TABLE_COLUMNS[table] = columns
+    return TableSource(table, columns, updated=columns.get(updated))
+
+
+def query_page(source, db=get_db):
+    """Query the page of rows DataTables asks for"""
+    page = parse_request(request.args)
+    try:
+        return cached_json(lambda: {k: v for k, v in fetch_page(db(), source, page).items() if k != "draw"},
+                           draw=page.draw)
+    except Exception as err:
+        logger.error(f"Failed to query a page of {source.from_sql} with error: {err}")
+        return {"draw": page.draw, "recordsTotal": 0, "recordsFiltered": 0, "data": []}
+
+
+def query_delta(source, db=get_db):
+    """Query the rows added or changed since the watermarks the page sent"""
+    since, updated = parse_delta(request.args)
+    try:
+        return cached_json(lambda: fetch_delta(db(), source, since, updated))
+    except Exception as err:
+        logger.error(f"Failed to query changes of {source.from_sql} with error: {err}")
+        return {"data": [], "since": since, "updated": updated, "more": False}
 
 
 def get_orders():
@@ -61,9 +228,14 @@ def get_orders():
 
 
 def get_orders_data():
-    """Get IBKR Orders for AJAX"""
-    rows = query_db("select * from TBOTORDERS")
-    return {"data": rows}
+    """Get IBKR Orders for AJAX, a page at a time for DataTables.
+    Orders change status in place, so `since` requests also get orders whose timestamp moved.
+    """
+    if "since" in request.args:
+        return query_delta(table_source("TBOTORDERS", updated="timestamp"))
+    if "draw" in request.args:
+        return query_page(table_source("TBOTORDERS"))
+    return query_all("select * from TBOTORDERS")
 
 
 def get_alerts():
@@ -74,9 +246,12 @@ def get_alerts():
 
 
 def get_alerts_data():
-    """Get TradingView alerts for AJAX"""
-    rows = query_db("select * from TBOTALERTS")
-    return {"data": rows}
+    """Get TradingView alerts for AJAX, a page at a time for DataTables, or the alerts added `since`"""
+    if "since" in request.args:
+        return query_delta(table_source("TBOTALERTS"))
+    if "draw" in request.args:
+        return query_page(table_source("TBOTALERTS"))
+    return query_all("select * from TBOTALERTS")
 
 
 def get_errors():
@@ -87,9 +262,12 @@ def get_errors():
 
 
 def get_errors_data():
-    """Get TradingView errors for AJAX"""
-    rows = query_db("select * from TBOTERRORS")
-    return {"data": rows}
+    """Get TradingView errors for AJAX, a page at a time for DataTables, or the errors added `since`"""
+    if "since" in request.args:
+        return query_delta(table_source("TBOTERRORS"))
+    if "draw" in request.args:
+        return query_page(table_source("TBOTERRORS"))
+    return query_all("select * from TBOTERRORS")
 
 
 def get_tbot():
@@ -109,29 +287,24 @@ def get_ngrok():
 def get_tbot_data():
     """Get inner join between TBOTORDERS and TBOTALERTS to
     track orders from WebHook alerts to Orders.
+    DataTables requests (with `draw`) get one page of the join,
+    and `since` requests the rows added or changed since then.
+    The join is read from the timeline unless TBOT_TIMELINE is empty.
     """
-    query = (
-        "SELECT "
-        "TBOTORDERS.timestamp, "
-        "TBOTORDERS.uniquekey, "
-        "TBOTALERTS.tv_timestamp, "
-        "TBOTALERTS.ticker, "
-        "TBOTALERTS.tv_price, "
-        "TBOTORDERS.avgprice, "
-        "TBOTALERTS.direction, "
-        "TBOTORDERS.action, "
-        "TBOTORDERS.ordertype, "
-        "TBOTORDERS.qty, "
-        "TBOTORDERS.position, "
-        "TBOTALERTS.orderref, "
-        "TBOTORDERS.orderstatus "
-        "FROM TBOTORDERS INNER JOIN TBOTALERTS "
-        "ON TBOTALERTS.orderref = TBOTORDERS.orderref "
-        "AND TBOTALERTS.uniquekey = TBOTORDERS.uniquekey "
-        "ORDER BY TBOTORDERS.uniquekey DESC "
-    )
-    rows = query_db(query)
-    return {"data": rows}
+    if timeline is not None:
+        source, db = TIMELINE_SOURCE, timeline_db
+        query = f"SELECT {', '.join(TIMELINE_COLUMNS)} FROM timeline ORDER BY uniquekey DESC, id DESC"
+    else:
+        source = TableSource(TBOT_JOIN, TBOT_COLUMNS, key="TBOTORDERS.rowid", default_order="uniquekey",
+                             updated="TBOTORDERS.timestamp")
+        db = get_db
+        columns = ", ".join(f"{expr} AS {name}" for name, expr in TBOT_COLUMNS.items())
+        query = f"SELECT {columns} FROM {TBOT_JOIN} ORDER BY TBOTORDERS.uniquekey DESC"
+    if "since" in request.args:
+        return query_delta(source, db)
+    if "draw" in request.args:
+        return query_page(source, db)
+    return query_all(query, db)
 
 
 def get_main():
@@ -147,7 +320,8 @@ def get_main():
 
 
 def close_connection(exception):
-    """Close connection"""
-    database = getattr(g, "_database", None)
-    if database is not None:
+    """Close the connection after a failed request, others are kept for the next request"""
+    database = getattr(_local, "database", None)
+    if exception is not None and database is not None and _local.key[0] == os.getpid():
         database.close()
+        _local.database = None
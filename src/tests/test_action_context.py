@@ -0,0 +1,42 @@
+import threading
+from unittest import TestCase
+
+from components.actions.base.action import Action, ActionContext
+
+
+class SlowAction(Action):
+    def __init__(self):
+        super().__init__()
+        self.results = []
+        self.barrier = threading.Barrier(2)
+
+    def run(self, *args, **kwargs):
+        super().run(*args, **kwargs)
+        # both threads are inside run before either reads its data
+        self.barrier.wait(5)
+        self.results.append(self.validate_data())
+
+
+class TestActionContext(TestCase):
+    def test_validate_data_uses_context(self):
+        action = Action()
+        self.assertEqual(action.validate_data(ActionContext({'a': 1})), {'a': 1})
+        self.assertRaises(ValueError, action.validate_data)
+        self.assertRaises(ValueError, action.validate_data, ActionContext(None))
+
+    def test_set_data_shim(self):
+        action = Action()
+        action.set_data({'a': 1})
+        self.assertEqual(action.validate_data(), {'a': 1})
+
+    def test_concurrent_runs_keep_their_data(self):
+        action = SlowAction()
+        threads = [
+            threading.Thread(target=action.run, kwargs={'context': ActionContext({'idx': idx})})
+            for idx in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(data['idx'] for data in action.results), [0, 1])
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from components.logs.event_log import EventLog
+from utils.broadcast import Broadcaster, DatabaseWatcher, LogWatcher, Subscription
+
+
+class TestSubscription(TestCase):
+    def test_overflow_sends_reset(self):
+        subscription = Subscription(buffer_size=2)
+        for idx in range(3):
+            subscription.put(f'{idx}')
+        messages = subscription.get(timeout=0)
+        self.assertTrue(messages[0].startswith('event: reset\n'))
+        self.assertEqual(messages[1:], ['1', '2'])
+        self.assertEqual(subscription.get(timeout=0), [])
+
+
+class TestBroadcaster(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fan_out_and_subscriber_limit(self):
+        broadcaster = Broadcaster(watchers=[], interval=60, max_subscribers=2)
+        first, second = broadcaster.subscribe(), broadcaster.subscribe()
+        self.assertIsNone(broadcaster.subscribe())
+        broadcaster.publish('db', {'data_version': 1})
+        self.assertEqual(first.get(timeout=0), ['event: db\ndata: {"data_version": 1}\n\n'])
+        self.assertEqual(len(second.get(timeout=0)), 1)
+        broadcaster.unsubscribe(first)
+        self.assertIsNotNone(broadcaster.subscribe())
+        broadcaster.stop()
+
+    def test_log_watcher(self):
+        log = EventLog(os.path.join(self.tmp.name, 'log.log'))
+        log.append(['EventA,triggered,2023-01-31 13:45:00,old\n'])
+        watcher = LogWatcher(log)
+        self.assertEqual(watcher.poll(), [])
+        log.append(['EventA,triggered,2023-01-31 13:45:01,new\n'])
+        [(event, data)] = watcher.poll()
+        self.assertEqual(event, 'logs')
+        self.assertEqual([log['event_data'] for log in data['logs']], ['new'])
+
+    def test_database_watcher(self):
+        path = os.path.join(self.tmp.name, 'tbot.db')
+        writer = sqlite3.connect(path)
+        writer.execute('CREATE TABLE TBOTORDERS (id INTEGER)')
+        writer.commit()
+        watcher = DatabaseWatcher(path, tables=('TBOTORDERS', 'MISSING'))
+        [(event, data)] = watcher.poll()
+        self.assertEqual(data['tables'], {'TBOTORDERS': None, 'MISSING': None})
+        self.assertEqual(watcher.poll(), [])
+        writer.execute('INSERT INTO TBOTORDERS VALUES (1)')
+        writer.commit()
+        [(event, data)] = watcher.poll()
+        self.assertEqual(data['tables']['TBOTORDERS'], 1)
+        writer.close()
@@ -0,0 +1,37 @@
+import json
+from unittest import TestCase, skipIf
+
+from utils import codec
+from utils.codec import CODEC_VERSION, MSGPACK_MAGIC, decode_entry, decode_message, encode, entry_fields, frame
+
+DATA = {'ticker': 'AAPL', 'clientId': 1, 'key': 'abc', 'metrics': [{'name': 'qty', 'value': 100.5}]}
+
+
+class TestJsonCodec(TestCase):
+    def test_json_is_unchanged(self):
+        body = encode(DATA)
+        self.assertEqual(entry_fields(body), {'tradingboat': json.dumps(DATA)})
+        self.assertEqual(frame(body), json.dumps(DATA))
+        self.assertEqual(decode_entry({b'tradingboat': body.encode()}), DATA)
+        self.assertEqual(decode_message(body), DATA)
+
+    def test_unknown_encoding(self):
+        self.assertRaises(ValueError, encode, DATA, 'xml')
+
+
+@skipIf(codec.msgpack is None, 'needs msgpack')
+class TestMsgpackCodec(TestCase):
+    def test_round_trip(self):
+        body = encode(DATA, 'msgpack')
+        self.assertLess(len(body), len(json.dumps(DATA)))
+        fields = entry_fields(body, 'msgpack')
+        self.assertEqual(fields['enc'], f'msgpack:{CODEC_VERSION}')
+        # as read with decode_responses=False
+        self.assertEqual(decode_entry({name.encode(): value if isinstance(value, bytes) else value.encode()
+                                       for name, value in fields.items()}), DATA)
+        self.assertEqual(decode_message(frame(body, 'msgpack')), DATA)
+
+    def test_newer_version_is_rejected(self):
+        body = encode(DATA, 'msgpack')
+        self.assertRaises(ValueError, decode_entry, {'tradingboat': body, 'enc': f'msgpack:{CODEC_VERSION + 1}'})
+        self.assertRaises(ValueError, decode_message, MSGPACK_MAGIC + bytes([CODEC_VERSION + 1]) + body)
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+from unittest import TestCase
+
+from utils.datatables import TableSource, fetch_delta, fetch_page, parse_delta, parse_request
+
+
+def request_args(start=0, length=10, order=0, direction='desc', search='', after=None, columns=('name', 'qty')):
+    args = {'draw': '3', 'start': str(start), 'length': str(length), 'search[value]': search,
+            'order[0][column]': str(order), 'order[0][dir]': direction}
+    for idx, name in enumerate(columns):
+        args[f'columns[{idx}][data]'] = name
+        args[f'columns[{idx}][searchable]'] = 'true'
+    if after is not None:
+        args['after'] = after
+    return args
+
+
+class TestDataTables(TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('CREATE TABLE ORDERS (name TEXT, qty INTEGER)')
+        # qty repeats and is sometimes NULL, the rowid breaks ties
+        self.db.executemany('INSERT INTO ORDERS VALUES (?, ?)',
+                            [(f'order_{idx}', None if idx % 7 == 0 else idx % 4) for idx in range(45)])
+        self.source = TableSource('ORDERS', {'name': '"name"', 'qty': '"qty"'})
+
+    def tearDown(self):
+        self.db.close()
+
+    def page(self, **kwargs):
+        return fetch_page(self.db, self.source, parse_request(request_args(**kwargs)))
+
+    def test_page_and_counts(self):
+        response = self.page(start=10, length=5, order=0, direction='asc')
+        self.assertEqual(response['draw'], 3)
+        self.assertEqual(response['recordsTotal'], 45)
+        self.assertEqual(response['recordsFiltered'], 45)
+        names = [row[0] for row in self.db.execute('SELECT name FROM ORDERS ORDER BY name LIMIT 5 OFFSET 10')]
+        self.assertEqual([row['name'] for row in response['data']], names)
+
+    def test_seek_matches_offset(self):
+        for direction in ['asc', 'desc']:
+            offset_rows, seek_rows, after = [], [], None
+            for start in range(0, 45, 10):
+                offset_rows += self.page(start=start, order=1, direction=direction)['data']
+                response = self.page(start=start, order=1, direction=direction, after=after)
+                seek_rows += response['data']
+                after = json.dumps(response['after'])
+            self.assertEqual(len(seek_rows), 45)
+            self.assertEqual(seek_rows, offset_rows)
+
+    def test_search(self):
+        response = self.page(search='order_1')
+        self.assertEqual(response['recordsTotal'], 45)
+        self.assertEqual(response['recordsFiltered'], 11)
+        # LIKE wildcards are matched literally
+        self.assertEqual(self.page(search='order%')['recordsFiltered'], 0)
+
+    def test_unknown_columns_are_ignored(self):
+        response = self.page(order=0, search='x', columns=['name; DROP TABLE ORDERS'])
+        self.assertEqual(response['recordsFiltered'], 45)
+        self.assertEqual(response['data'][0]['_rowid'], 45)
+
+    def test_length_is_bounded(self):
+        self.assertEqual(parse_request(request_args(length=-1), max_length=20).length, 20)
+        self.assertEqual(parse_request({'length': 'many', 'start': '-3'}).start, 0)
+
+
+class TestDeltas(TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('CREATE TABLE ORDERS (name TEXT, status TEXT, updated INTEGER)')
+        self.db.executemany('INSERT INTO ORDERS VALUES (?, ?, ?)', [(f'order_{idx}', 'Submitted', idx) for idx in range(5)])
+        self.source = TableSource('ORDERS', {'name': '"name"', 'status': '"status"'}, updated='"updated"')
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_watermarks(self):
+        self.assertEqual(parse_delta({'since': ''}), (None, None))
+        self.assertEqual(parse_delta({'since': '4', 'updated': '[3, 4]'}), (4, [3, 4]))
+        response = fetch_delta(self.db, self.source, None)
+        self.assertEqual(response, {'data': [], 'since': 5, 'updated': [4, 5], 'more': False})
+
+    def test_added_and_changed_rows(self):
+        watermark = fetch_delta(self.db, self.source, None)
+        self.assertEqual(fetch_delta(self.db, self.source, watermark['since'], watermark['updated'])['data'], [])
+
+        self.db.execute("UPDATE ORDERS SET status = 'Filled', updated = 10 WHERE name = 'order_1'")
+        self.db.execute("INSERT INTO ORDERS VALUES ('order_5', 'Submitted', 11)")
+        response = fetch_delta(self.db, self.source, watermark['since'], watermark['updated'])
+        self.assertEqual([(row['_rowid'], row['status']) for row in response['data']], [(2, 'Filled'), (6, 'Submitted')])
+        self.assertEqual(response['since'], 6)
+        self.assertEqual(response['updated'], [11, 6])
+        self.assertEqual(fetch_delta(self.db, self.source, response['since'], response['updated'])['data'], [])
+
+    def test_more_rows_than_limit(self):
+        self.db.executemany('INSERT INTO ORDERS VALUES (?, ?, ?)', [(f'order_{idx}', 'Submitted', idx) for idx in range(5, 12)])
+        since, updated, rowids = 5, [4, 5], []
+        while True:
+            response = fetch_delta(self.db, self.source, since, updated, limit=3)
+            rowids += [row['_rowid'] for row in response['data']]
+            since, updated = response['since'], response['updated']
+            if not response['more']:
+                break
+        self.assertEqual(rowids, list(range(6, 13)))
+
+    def test_append_only_tables(self):
+        source = TableSource('ORDERS', {'name': '"name"'})
+        self.db.execute("UPDATE ORDERS SET updated = 10")
+        response = fetch_delta(self.db, source, 4)
+        self.assertEqual([row['_rowid'] for row in response['data']], [5])
+        self.assertEqual(response['updated'], None)
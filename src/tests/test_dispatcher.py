@@ -0,0 +1,60 @@
+import random
+import threading
+import time
+from unittest import TestCase
+
+from components.events.base.dispatcher import Dispatcher
+
+
+class RecordingEvent:
+    def __init__(self, name='RecordingEvent', release=None, delay=0.0):
+        self.name = name
+        self.key = f'{name}:abc123'
+        self.release = release
+        self.delay = delay
+        self.triggered = []
+
+    def trigger(self, *args, **kwargs):
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(random.uniform(0, self.delay))
+        self.triggered.append(kwargs.get('data'))
+
+
+class TestDispatcher(TestCase):
+    def test_submit_runs_events(self):
+        dispatcher = Dispatcher(workers=2, queue_size=10)
+        dispatcher.start()
+        event = RecordingEvent()
+        for idx in range(5):
+            self.assertTrue(dispatcher.submit([event], {'idx': idx}))
+        dispatcher.shutdown()
+        self.assertEqual(sorted(data['idx'] for data in event.triggered), list(range(5)))
+        stats = dispatcher.stats()
+        self.assertEqual(stats['dispatched'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_submit_rejects_when_full(self):
+        release = threading.Event()
+        dispatcher = Dispatcher(workers=1, queue_size=1)
+        dispatcher.start()
+        event = RecordingEvent(release=release)
+        results = [dispatcher.submit([event], {'idx': idx}) for idx in range(4)]
+        self.assertIn(False, results)
+        self.assertGreater(dispatcher.stats()['rejected'], 0)
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(len(event.triggered), results.count(True))
+
+    def test_client_order_is_kept(self):
+        dispatcher = Dispatcher(workers=4, queue_size=100)
+        dispatcher.start()
+        event = RecordingEvent(delay=0.005)
+        for idx in range(40):
+            self.assertTrue(dispatcher.submit([event], {'clientId': idx % 3 + 1, 'idx': idx}))
+        dispatcher.shutdown()
+        for client_id in (1, 2, 3):
+            sent = [data['idx'] for data in event.triggered if data['clientId'] == client_id]
+            self.assertEqual(sent, sorted(sent))
+        self.assertEqual(len(event.triggered), 40)
+        self.assertEqual(dispatcher.stats()['queue_size'], 100)
@@ -0,0 +1,85 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from components.logs.event_log import EventLog
+
+
+class TestEventLog(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'log.log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_read(self):
+        log = EventLog(self.path, max_lines=10, segments=1)
+        log.append(['a,b,c,d\n', 'e,f,g,h\n'])
+        self.assertEqual(log.read_lines(), ['a,b,c,d\n', 'e,f,g,h\n'])
+
+    def test_rotation_keeps_latest_lines(self):
+        log = EventLog(self.path, max_lines=3, segments=1)
+        for idx in range(10):
+            log.append([f'{idx}\n'])
+        self.assertEqual(log.read_lines(3), ['7\n', '8\n', '9\n'])
+        self.assertEqual(log.read_lines(), [f'{idx}\n' for idx in range(6, 10)])
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+        self.assertFalse(os.path.exists(f'{self.path}.2'))
+
+    def test_rotation_by_size(self):
+        log = EventLog(self.path, max_lines=100, max_bytes=4, segments=2)
+        for idx in range(3):
+            log.append([f'{idx}{idx}\n'])
+        self.assertEqual(log.read_lines(), ['00\n', '11\n', '22\n'])
+        self.assertTrue(os.path.exists(f'{self.path}.2'))
+
+    def test_appends_from_other_writers_are_counted(self):
+        first = EventLog(self.path, max_lines=4, segments=1)
+        second = EventLog(self.path, max_lines=4, segments=1)
+        for idx in range(4):
+            (first if idx % 2 else second).append([f'{idx}\n'])
+        first.append(['4\n'])
+        with open(self.path) as active:
+            self.assertEqual(active.readlines(), ['4\n'])
+
+    def test_tail(self):
+        log = EventLog(self.path, max_lines=4, segments=2)
+        for idx in range(10):
+            log.append([f'Event{idx % 2},triggered,2023-01-31 13:45:00,{idx}\n'])
+        lines, cursor = log.tail(3)
+        self.assertEqual([line.rsplit(',', 1)[1] for line in lines], ['7\n', '8\n', '9\n'])
+        self.assertEqual(log.read_after(cursor), ([], cursor))
+        lines, _ = log.tail(3, parent='Event0')
+        self.assertEqual([line.rsplit(',', 1)[1] for line in lines], ['4\n', '6\n', '8\n'])
+
+    def test_tail_skips_partial_line(self):
+        log = EventLog(self.path)
+        log.append(['a,b,c,d\n'])
+        with open(self.path, 'a') as active:
+            active.write('e,f,g')
+        lines, cursor = log.tail(10)
+        self.assertEqual(lines, ['a,b,c,d\n'])
+        self.assertTrue(cursor.endswith(':8'))
+
+    def test_read_after(self):
+        log = EventLog(self.path, max_lines=3, segments=2)
+        log.append(['0\n', '1\n'])
+        lines, cursor = log.read_after()
+        self.assertEqual(lines, ['0\n', '1\n'])
+        self.assertEqual(log.read_after(cursor), ([], cursor))
+        # crosses a rotation
+        log.append(['2\n'])
+        log.append(['3\n'])
+        lines, cursor = log.read_after(cursor)
+        self.assertEqual(lines, ['2\n', '3\n'])
+        log.append(['4\n', '5\n'])
+        lines, cursor = log.read_after(cursor, limit=1)
+        self.assertEqual(lines, ['4\n'])
+        lines, cursor = log.read_after(cursor)
+        self.assertEqual(lines, ['5\n'])
+
+    def test_read_after_byte_offset(self):
+        log = EventLog(self.path)
+        log.append(['0\n', '1\n'])
+        self.assertEqual(log.read_after('2')[0], ['1\n'])
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from components.actions.base.action import Action, ActionManager
+from components.events.base.event import Event, EventManager
+
+
+class KeyedEvent(Event):
+    def __init__(self, name):
+        self._test_name = name
+        super().__init__()
+
+    def get_name(self):
+        return self._test_name
+
+
+class TestEventManager(TestCase):
+    def setUp(self):
+        self.manager = EventManager()
+        self.events = [KeyedEvent(f'KeyedEvent{idx}') for idx in range(3)]
+        for event in self.events:
+            self.manager.add(event)
+
+    def test_get(self):
+        self.assertIs(self.manager.get('KeyedEvent1'), self.events[1])
+        self.assertRaises(ValueError, self.manager.get, 'MissingEvent')
+
+    def test_get_by_key(self):
+        event = self.events[2]
+        self.assertEqual(self.manager.get_by_key(event.key), [event])
+        self.assertEqual(self.manager.get_by_key('MissingEvent:000000'), [])
+
+    def test_get_by_key_skips_non_webhook_events(self):
+        event = self.events[0]
+        event.webhook = False
+        self.assertEqual(self.manager.get_by_key(event.key), [])
+        event.webhook = True
+        self.assertEqual(self.manager.get_by_key(event.key), [event])
+
+
+class TestActionManager(TestCase):
+    def test_get(self):
+        manager = ActionManager()
+        action = Action()
+        manager.add(action)
+        self.assertIs(manager.get('Action'), action)
+        self.assertRaises(ValueError, manager.get, 'MissingAction')
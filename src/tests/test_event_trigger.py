@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+
+from components.actions.base.action import Action
+from components.events.base.event import Event, get_action_pool
+
+
+class RecordingAction(Action):
+    def __init__(self, name, calls, delay=0.0, fail=False, priority=0):
+        self._test_name = name
+        super().__init__()
+        self.calls = calls
+        self.delay = delay
+        self.fail = fail
+        self.priority = priority
+
+    def get_name(self):
+        return self._test_name
+
+    def run(self, *args, **kwargs):
+        super().run(*args, **kwargs)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f'{self.name} failed')
+        self.calls.append((self.name, self.validate_data(), threading.current_thread().name))
+
+
+class PolicyEvent(Event):
+    def __init__(self, policy, timeout=0):
+        self.execution_policy = policy
+        self.action_timeout = timeout
+        super().__init__()
+
+
+class TestEventTrigger(TestCase):
+    def test_sequential_failure_does_not_block_siblings(self):
+        calls = []
+        event = PolicyEvent('sequential')
+        event.add_action(RecordingAction('FailingAction', calls, fail=True))
+        event.add_action(RecordingAction('OkAction', calls))
+        results = event.run_actions({'a': 1})
+        self.assertEqual([result.status for result in results], ['failed', 'ok'])
+        self.assertEqual([call[:2] for call in calls], [('OkAction', {'a': 1})])
+
+    def test_priority_order(self):
+        calls = []
+        event = PolicyEvent('priority')
+        event.add_action(RecordingAction('LowAction', calls, priority=1))
+        event.add_action(RecordingAction('HighAction', calls, priority=5))
+        event.run_actions({'a': 1})
+        self.assertEqual([call[0] for call in calls], ['HighAction', 'LowAction'])
+
+    def test_parallel_timeout(self):
+        calls = []
+        event = PolicyEvent('parallel', timeout=0.2)
+        event.add_action(RecordingAction('SlowAction', calls, delay=1.0))
+        event.add_action(RecordingAction('FastAction', calls))
+        start = time.monotonic()
+        results = event.run_actions({'a': 1})
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual({result.action_name: result.status for result in results},
+                         {'SlowAction': 'timeout', 'FastAction': 'ok'})
+
+    def test_queued_actions_are_cancelled(self):
+        calls = []
+        event = PolicyEvent('parallel', timeout=0.2)
+        event.add_action(RecordingAction('SlowAction', calls, delay=1.0))
+        event.add_action(RecordingAction('QueuedAction', calls))
+        # one pool thread, so the second action is still queued at the deadline
+        with patch('components.events.base.event._action_pool', ThreadPoolExecutor(max_workers=1)) as pool:
+            results = event.run_actions({'a': 1})
+            pool.shutdown(wait=True)
+        self.assertEqual({result.action_name: result.status for result in results},
+                         {'SlowAction': 'timeout', 'QueuedAction': 'cancelled'})
+        self.assertEqual([call[0] for call in calls], ['SlowAction'])
+
+    def test_action_pool_is_created_once(self):
+        with patch('components.events.base.event._action_pool', None):
+            pools = []
+            threads = [threading.Thread(target=lambda: pools.append(get_action_pool())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len({id(pool) for pool in pools}), 1)
+            pools[0].shutdown()
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, PolicyEvent, 'random')
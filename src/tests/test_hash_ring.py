@@ -0,0 +1,31 @@
+from collections import Counter
+from unittest import TestCase
+
+from utils.hash_ring import HashRing
+
+NODES = ['redis://10.0.0.1:6379', 'redis://10.0.0.2:6379', 'redis://10.0.0.3:6379']
+KEYS = [f'REDIS_SKEY_{idx}' for idx in range(1, 301)]
+
+
+class TestHashRing(TestCase):
+    def test_keys_spread_across_nodes(self):
+        ring = HashRing(NODES)
+        counts = Counter(ring.get_node(key) for key in KEYS)
+        self.assertEqual(set(counts), set(NODES))
+        self.assertGreater(min(counts.values()), len(KEYS) / len(NODES) / 2)
+
+    def test_mapping_is_stable(self):
+        self.assertEqual([HashRing(NODES).get_node(key) for key in KEYS],
+                         [HashRing(reversed(NODES)).get_node(key) for key in KEYS])
+
+    def test_adding_a_node_only_moves_its_keys(self):
+        ring = HashRing(NODES)
+        before = {key: ring.get_node(key) for key in KEYS}
+        ring.add('redis://10.0.0.4:6379')
+        moved = [key for key in KEYS if ring.get_node(key) != before[key]]
+        self.assertTrue(all(ring.get_node(key) == 'redis://10.0.0.4:6379' for key in moved))
+        ring.remove('redis://10.0.0.4:6379')
+        self.assertEqual({key: ring.get_node(key) for key in KEYS}, before)
+
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing().get_node('REDIS_SKEY_1'))
@@ -0,0 +1,139 @@
+import json
+import time
+import uuid
+from unittest import TestCase, skipUnless
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from components.events.base.job_queue import JobQueue, JobWorker
+from utils.raw_payload import RawPayload
+
+
+def redis_available():
+    try:
+        return Redis(socket_connect_timeout=0.2).ping()
+    except RedisError:
+        return False
+
+
+class RecordingEvent:
+    def __init__(self):
+        self.runs = []
+        self.received = []
+
+    def run_actions(self, data, received_ns=None):
+        self.runs.append(data)
+        self.received.append(received_ns)
+
+
+class RecordingManager:
+    def __init__(self, **events):
+        self.events = events
+
+    def get(self, event_name):
+        if event_name not in self.events:
+            raise ValueError(f'Cannot find event with name {event_name}')
+        return self.events[event_name]
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.added = []
+
+    def xadd(self, stream, fields, **kwargs):
+        self.added.append((stream, fields))
+
+
+class TestJobQueue(TestCase):
+    def test_decode_round_trip(self):
+        raw = RawPayload.parse('{"key": "abc", "clientId": 1, "qty": 5}')
+        self.assertEqual(JobQueue.decode({'event': 'WebhookReceived', 'data': '{"a": 1}', 'raw': '0'}),
+                         ('WebhookReceived', {'a': 1}))
+        event_name, data = JobQueue.decode({'event': 'WebhookReceived', 'data': raw.raw, 'raw': '1'})
+        self.assertEqual(data.raw, raw.raw)
+        self.assertEqual(data, {'key': 'abc', 'clientId': 1})
+
+    def test_jobs_are_sharded_by_client(self):
+        queue = JobQueue(stream='TEST_JOBS', shards=4)
+        queue._connection = RecordingConnection()
+        self.assertEqual(queue.streams, ['TEST_JOBS:0', 'TEST_JOBS:1', 'TEST_JOBS:2', 'TEST_JOBS:3'])
+        for idx in range(20):
+            queue.enqueue('WebhookReceived', {'clientId': idx % 5 + 1, 'idx': idx})
+        streams = {}
+        for stream, fields in queue._connection.added:
+            streams.setdefault(json.loads(fields['data'])['clientId'], set()).add(stream)
+        # every job of a client goes to one stream
+        self.assertTrue(all(len(client_streams) == 1 for client_streams in streams.values()))
+        self.assertEqual(JobQueue(stream='TEST_JOBS').streams, ['TEST_JOBS'])
+
+    def test_received_stamp(self):
+        wall_ns = time.time_ns() - 2_000_000
+        received_ns = JobQueue.received_ns({'received_ns': str(wall_ns), 'enqueued_ns': str(time.time_ns())})
+        self.assertAlmostEqual(time.monotonic_ns() - received_ns, 2_000_000, delta=1_000_000)
+        # jobs queued without a receive stamp fall back to when they were queued
+        self.assertIsNotNone(JobQueue.received_ns({'enqueued_ns': str(wall_ns)}))
+        self.assertIsNone(JobQueue.received_ns({}))
+
+
+@skipUnless(redis_available(), 'needs a local redis-server')
+class TestJobWorker(TestCase):
+    def setUp(self):
+        self.queue = JobQueue('redis://127.0.0.1:6379/0', stream=f'TEST_JOBS_{uuid.uuid4().hex}', group='test')
+        self.queue.ensure_group()
+
+    def tearDown(self):
+        self.queue.connection.delete(*self.queue.streams, self.queue.dead_stream)
+
+    def test_jobs_are_run_and_acknowledged(self):
+        event = RecordingEvent()
+        for idx in range(5):
+            self.queue.enqueue('WebhookReceived', {'idx': idx}, received_ns=time.monotonic_ns())
+        worker = JobWorker(self.queue, RecordingManager(WebhookReceived=event), 'test-0', block_ms=100)
+        self.assertEqual(worker.run_once(), 5)
+        self.assertEqual([data['idx'] for data in event.runs], list(range(5)))
+        self.assertTrue(all(received_ns <= time.monotonic_ns() for received_ns in event.received))
+        self.assertEqual(self.queue.stats()['groups']['test']['pending'], 0)
+
+    def test_unrunnable_jobs_are_dead_lettered(self):
+        self.queue.enqueue('Unknown', {})
+        worker = JobWorker(self.queue, RecordingManager(), 'test-0', block_ms=100)
+        worker.run_once()
+        self.assertEqual(worker.failed, 1)
+        self.assertEqual(self.queue.stats()['dead'], 1)
+
+    def test_stale_jobs_are_reclaimed(self):
+        self.queue.enqueue('WebhookReceived', {'idx': 0})
+        # a consumer reads the job and dies before acknowledging it
+        self.queue.connection.xreadgroup(self.queue.group, 'dead-0', {self.queue.stream: '>'}, count=1)
+        event = RecordingEvent()
+        worker = JobWorker(self.queue, RecordingManager(WebhookReceived=event), 'test-0', block_ms=100,
+                           claim_idle_ms=0)
+        self.assertEqual(worker.reclaim(), 1)
+        self.assertEqual(event.runs, [{'idx': 0}])
+        self.assertEqual(self.queue.stats()['groups']['test']['pending'], 0)
+
+    def test_shards_keep_client_order(self):
+        queue = JobQueue('redis://127.0.0.1:6379/0', stream=f'TEST_JOBS_{uuid.uuid4().hex}', group='test', shards=2)
+        queue.ensure_group()
+        try:
+            for idx in range(10):
+                queue.enqueue('WebhookReceived', {'clientId': idx % 3 + 1, 'idx': idx})
+            event = RecordingEvent()
+            workers = [JobWorker(queue, RecordingManager(WebhookReceived=event), f'test-{shard}', block_ms=100,
+                                 shards=[shard]) for shard in range(2)]
+            self.assertEqual(sum(worker.run_once() for worker in workers), 10)
+            for client_id in (1, 2, 3):
+                runs = [data['idx'] for data in event.runs if data['clientId'] == client_id]
+                self.assertEqual(runs, sorted(runs))
+        finally:
+            queue.connection.delete(*queue.streams, queue.dead_stream)
+
+    def test_restarted_worker_recovers_its_jobs(self):
+        self.queue.enqueue('WebhookReceived', {'idx': 0})
+        # the worker read the job and was restarted before acknowledging it
+        self.queue.connection.xreadgroup(self.queue.group, 'test-0', {self.queue.stream: '>'}, count=1)
+        event = RecordingEvent()
+        worker = JobWorker(self.queue, RecordingManager(WebhookReceived=event), 'test-0', block_ms=100)
+        self.assertEqual(worker.recover(), 1)
+        self.assertEqual(event.runs, [{'idx': 0}])
@@ -0,0 +1,77 @@
+import json
+import time
+import uuid
+from unittest import TestCase, skipUnless
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from components.actions.base.action import ActionContext
+from utils.latency import (LatencyReport, consume, latency_fields, monotonic_to_wall_ns, percentile,
+                           wall_to_monotonic_ns)
+
+
+def redis_available():
+    try:
+        return Redis(socket_connect_timeout=0.2).ping()
+    except RedisError:
+        return False
+
+
+class TestLatencyReport(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_hops_from_stamps(self):
+        now = time.monotonic_ns()
+        fields = latency_fields(ActionContext({}, received_ns=now - 3_000_000, dispatched_ns=now - 1_000_000))
+        self.assertGreaterEqual(fields['dispatch_ns'] - fields['recv_ns'], 2_000_000)
+        report = LatencyReport()
+        entry_id = f'{fields["wall_ns"] // 1_000_000}-0'
+        # values come back from Redis as strings
+        report.add(entry_id, {name: str(value) for name, value in fields.items()}, fields['wall_ns'] + 5_000_000)
+        summary = report.summary()
+        self.assertEqual(summary['queue']['p50'], 2.0)
+        self.assertEqual(summary['consumer']['max'], 5.0)
+        self.assertGreaterEqual(summary['total']['p99'], 8.0)
+
+    def test_missing_receive_stamp(self):
+        # a context without a receive stamp, i.e. an event triggered outside /webhook
+        fields = latency_fields(ActionContext({}, dispatched_ns=time.monotonic_ns() - 1_000_000))
+        self.assertEqual(fields['recv_ns'], fields['dispatch_ns'])
+        self.assertGreaterEqual(fields['publish_ns'] - fields['dispatch_ns'], 1_000_000)
+
+    def test_clock_conversion(self):
+        now = time.monotonic_ns()
+        self.assertLess(abs(wall_to_monotonic_ns(monotonic_to_wall_ns(now - 5_000_000)) - (now - 5_000_000)),
+                        1_000_000)
+
+    def test_sequence_gaps_and_unstamped_entries(self):
+        report = LatencyReport()
+        stamps = {'pid': 1, 'recv_ns': 0, 'dispatch_ns': 0, 'publish_ns': 0, 'wall_ns': 0}
+        for seq in (1, 2, 5):
+            report.add('0-0', {**stamps, 'seq': seq}, 1)
+        report.add('0-0', {'tradingboat': '{}'})
+        self.assertEqual((report.entries, report.skipped, report.gaps), (3, 1, 2))
+
+
+@skipUnless(redis_available(), 'needs a local redis-server')
+class TestLatencyConsumer(TestCase):
+    def setUp(self):
+        self.connection = Redis(decode_responses=True)
+        self.key = f'TEST_LATENCY_{uuid.uuid4().hex}'
+
+    def tearDown(self):
+        self.connection.delete(self.key)
+
+    def test_consume_reads_stamped_entries(self):
+        for idx in range(20):
+            self.connection.xadd(self.key, {'tradingboat': json.dumps({'idx': idx}), **latency_fields()})
+        report = consume(self.connection, self.key, 20, last_id='0', timeout=5)
+        self.assertEqual(report.entries, 20)
+        self.assertEqual(report.gaps, 0)
+        self.assertIsNotNone(report.summary()['total']['p50'])
@@ -0,0 +1,38 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from components.logs.event_log import EventLog
+from components.logs.log_event import parse_event_time
+from components.logs.log_index import LogIndex
+
+
+class TestLogIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = EventLog(os.path.join(self.tmp.name, 'log.log'))
+        self.log.append([
+            'EventA,triggered,2023-01-31 13:45:00,EventA was triggered\n',
+            'EventB,triggered,2023-01-31 13:45:01,EventB was triggered\n',
+            'not a log line\n',
+            'EventA,triggered,2023-01-31 13:45:02,EventA was triggered\n',
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_groups_by_parent(self):
+        index = LogIndex(self.log)
+        self.assertEqual([log.event_time.second for log in index.get('EventA')], [0, 2])
+        self.assertEqual(len(index.get('EventB')), 1)
+        self.assertEqual(index.get('EventC'), [])
+
+    def test_get_returns_copies(self):
+        index = LogIndex(self.log)
+        index.get('EventA').append(None)
+        self.assertEqual(len(index.get('EventA')), 2)
+
+    def test_parse_event_time(self):
+        self.assertEqual(parse_event_time('2023-01-31 13:45:02'), datetime(2023, 1, 31, 13, 45, 2))
+        self.assertRaises(ValueError, parse_event_time, '2023-01-31')
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from components.logs.event_log import EventLog
+from components.logs.log_writer import LogWriter
+
+
+class TestLogWriter(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = EventLog(os.path.join(self.tmp.name, 'log.log'), max_lines=10_000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sync_mode_writes_immediately(self):
+        writer = LogWriter(self.log, sync=True)
+        writer.submit('a,b,c,d\n')
+        self.assertEqual(self.log.read_lines(), ['a,b,c,d\n'])
+
+    def test_batches_from_many_threads(self):
+        writer = LogWriter(self.log, batch_size=50, interval=0.01, sync=False)
+
+        def submit(thread_idx):
+            for idx in range(100):
+                writer.submit(f'{thread_idx},{idx}\n')
+
+        threads = [threading.Thread(target=submit, args=(thread_idx,)) for thread_idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.close()
+        lines = self.log.read_lines()
+        self.assertEqual(len(lines), 400)
+        for thread_idx in range(4):
+            # per-thread submit order is kept
+            self.assertEqual([line for line in lines if line.startswith(f'{thread_idx},')],
+                             [f'{thread_idx},{idx}\n' for idx in range(100)])
+
+    def test_flush(self):
+        writer = LogWriter(self.log, batch_size=1000, interval=60, sync=False)
+        writer.submit('a,b,c,d\n')
+        writer.flush()
+        self.assertEqual(self.log.read_lines(), ['a,b,c,d\n'])
+        writer.close()
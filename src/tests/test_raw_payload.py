@@ -0,0 +1,42 @@
+import json
+from unittest import TestCase
+
+from components.actions.base.action import ActionContext
+from utils.raw_payload import RawPayload, scan_fields
+
+
+class TestScanFields(TestCase):
+    def test_finds_top_level_fields(self):
+        body = '{"nested": {"key": "no", "clientId": 9}, "list": [1, "}"], "key": "abc", "clientId": "2"}'
+        self.assertEqual(scan_fields(body), {'key': 'abc', 'clientId': '2'})
+
+    def test_malformed_after_routing_fields(self):
+        # a truncated or corrupt body is rejected even when the routing fields come first
+        for body in ('{"key":"k","clientId":1, garbage', '{"key": "abc", "clientId": 1, "qty": 5',
+                     '{"key": "abc", "clientId": 1} trailing', '{"key": "abc", "clientId": 1, "qty": [1, }'):
+            self.assertIsNone(scan_fields(body), body)
+            self.assertIsNone(RawPayload.parse(body), body)
+        self.assertEqual(scan_fields(' { "key" : "abc", "clientId": 1, "qty": 5 }\n'), {'key': 'abc', 'clientId': 1})
+
+    def test_missing_fields(self):
+        self.assertEqual(scan_fields('{}'), {})
+        self.assertEqual(scan_fields('{"key": "abc", "qty": 1}'), {'key': 'abc'})
+
+    def test_not_an_object(self):
+        for body in ('', '[]', '"key"', '{"key" "abc"}', '{"key": }', '{"a": 1 "key": 2}', 'null'):
+            self.assertIsNone(scan_fields(body), body)
+
+
+class TestRawPayload(TestCase):
+    def test_context_decodes_on_first_use(self):
+        body = json.dumps({'key': 'abc', 'clientId': 1, 'qty': 5})
+        payload = RawPayload.parse(body)
+        context = ActionContext(payload)
+        self.assertEqual(context.raw, body)
+        self.assertEqual(context.payload, {'key': 'abc', 'clientId': 1})
+        self.assertEqual(context.data, json.loads(body))
+
+    def test_plain_dict_has_no_raw(self):
+        context = ActionContext({'key': 'abc'})
+        self.assertIsNone(context.raw)
+        self.assertEqual(context.data, {'key': 'abc'})
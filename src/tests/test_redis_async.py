@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from redis.exceptions import ConnectionError
+
+from components.actions.base.action import ActionContext
+from components.actions.redis_pub_action_clients_async import AsyncRedisClient, RedisPubActionClientsAsync
+from utils import async_bridge
+from utils.redis_retention import StreamRetention
+
+
+class FakeAsyncConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def xadd(self, key, fields, **kwargs):
+        # replies arrive out of order, the client lock must keep them in order
+        await asyncio.sleep(random.uniform(0, 0.005))
+        if self.fail:
+            raise ConnectionError('down')
+        self.sent.append((key, fields))
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+
+class FakeAsyncPipeline:
+    def __init__(self, connection):
+        self.connection = connection
+        self.queued = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def xadd(self, key, fields, **kwargs):
+        self.queued.append((key, fields))
+        return self
+
+    async def execute(self):
+        self.connection.sent.append(list(self.queued))
+
+
+class TestAsyncBridge(TestCase):
+    def test_coroutines_run_concurrently(self):
+        start = time.monotonic()
+        futures = [async_bridge.submit(asyncio.sleep(0.2, result=idx)) for idx in range(50)]
+        self.assertEqual([future.result(5) for future in futures], list(range(50)))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_run_waits_for_result(self):
+        async def add(a, b):
+            return a + b
+        self.assertEqual(async_bridge.run(add(1, 2), timeout=5), 3)
+
+
+class TestRedisPubActionClientsAsync(TestCase):
+    def test_publishes_keep_order_per_client(self):
+        action = RedisPubActionClientsAsync()
+        action.is_redis_stream = True
+        connection = FakeAsyncConnection()
+        client = action.clients[1] = AsyncRedisClient(stream_key='REDIS_SKEY_1', channel='REDIS_CH_1', client_id=1,
+                                                      connection=connection, retention=StreamRetention())
+        self.assertIsNone(client.lock)
+        for idx in range(30):
+            action.run(context=ActionContext({'key': 'abc', 'clientId': 1, 'idx': idx}))
+        action.close()
+        # the lock is made in the bridge loop, not in the thread that created the client
+        self.assertIs(client.lock_loop, async_bridge.get_loop())
+        self.assertEqual([json.loads(fields['tradingboat'])['idx'] for _, fields in connection.sent], list(range(30)))
+        self.assertEqual(action.stats(), {'in_flight': 0, 'published': 30, 'failed': 0})
+
+    def test_legs_are_sent_in_one_transaction(self):
+        action = RedisPubActionClientsAsync()
+        action.is_redis_stream = True
+        connection = FakeAsyncConnection()
+        action.clients[1] = AsyncRedisClient(stream_key='REDIS_SKEY_1', channel='REDIS_CH_1', client_id=1,
+                                             connection=connection, retention=StreamRetention())
+        data = {'key': 'abc', 'clientId': 1, 'ticker': 'AAPL',
+                'legs': [{'direction': 'strategy.entrylong'}, {'orderRef': 'tp'}, {'orderRef': 'sl'}]}
+        action.run(context=ActionContext(data))
+        action.close()
+        self.assertEqual(len(connection.sent), 1)
+        legs = connection.sent[0]
+        self.assertEqual([fields['leg'] for _, fields in legs], ['1/3', '2/3', '3/3'])
+        self.assertEqual(json.loads(legs[1][1]['tradingboat']),
+                         {'key': 'abc', 'clientId': 1, 'ticker': 'AAPL', 'orderRef': 'tp'})
+
+    def test_failed_publish_is_set_on_the_future(self):
+        action = RedisPubActionClientsAsync()
+        action.is_redis_stream = True
+        action.clients[1] = AsyncRedisClient(stream_key='REDIS_SKEY_1', channel='REDIS_CH_1', client_id=1,
+                                             connection=FakeAsyncConnection(fail=True), retention=StreamRetention())
+        future = action.run(context=ActionContext({'key': 'abc', 'clientId': 1}))
+        self.assertIsInstance(future.exception(5), ConnectionError)
+        # waiting makes the failure fail the action
+        with patch('components.actions.redis_pub_action_clients_async.TBOT_REDIS_ASYNC_WAIT', True):
+            self.assertRaises(ConnectionError, action.run, context=ActionContext({'key': 'abc', 'clientId': 1}))
+        action.close()
+
+    def test_invalid_legs(self):
+        action = RedisPubActionClientsAsync()
+        self.assertIsNone(action.broker_legs(ActionContext({'key': 'abc', 'clientId': 1})))
+        self.assertRaises(ValueError, action.broker_legs, ActionContext({'key': 'abc', 'legs': [1, 2]}))
+
+    def test_invalid_client_id(self):
+        action = RedisPubActionClientsAsync()
+        self.assertIsNone(action.get_client(0))
+        action.run(context=ActionContext({'key': 'abc', 'clientId': 999}))
+        self.assertEqual(action.stats()['published'], 0)
@@ -0,0 +1,127 @@
+import threading
+from unittest import TestCase
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from utils.redis_batch import TRANSACTION, RedisBatcher, execute_transaction, reply_errors
+
+
+class FakePipeline:
+    def __init__(self, connection, transaction):
+        self.connection = connection
+        self.transaction = transaction
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args, **kwargs: self.commands.append((command, args))
+
+    def reply(self, command, args):
+        name = args[0] if command == 'execute_command' else command
+        return ResponseError(f'{name} rejected') if name in self.connection.reject else True
+
+    def execute(self, raise_on_error=True):
+        if self.connection.fail:
+            raise ConnectionError('down')
+        self.connection.batches.append(self.commands)
+        self.connection.transactions.append(self.transaction)
+        replies, multi = [], None
+        for command, args in self.commands:
+            if args == ('MULTI',):
+                multi = []
+                replies.append('OK')
+            elif args == ('EXEC',):
+                # like Redis, errors of queued commands come back inside the EXEC reply
+                replies.append(multi)
+                multi = None
+            elif multi is not None:
+                multi.append(self.reply(command, args))
+                replies.append('QUEUED')
+            else:
+                replies.append(self.reply(command, args))
+        errors = [reply for reply in replies if isinstance(reply, ResponseError)]
+        if raise_on_error and errors:
+            raise errors[0]
+        return replies
+
+
+class FakeConnection:
+    def __init__(self, fail=False, reject=()):
+        self.fail = fail
+        # commands answered with a ResponseError
+        self.reject = set(reject)
+        self.batches = []
+        self.transactions = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+
+class TestRedisBatcher(TestCase):
+    def test_batches_keep_order(self):
+        connection = FakeConnection()
+        batcher = RedisBatcher(connection, linger=0.05, max_batch=10)
+        for idx in range(25):
+            batcher.submit('xadd', 'REDIS_SKEY_1', {'idx': idx})
+        batcher.close()
+        sent = [args[1]['idx'] for batch in connection.batches for _, args in batch]
+        self.assertEqual(sent, list(range(25)))
+        self.assertTrue(all(len(batch) <= 10 for batch in connection.batches))
+        self.assertLess(len(connection.batches), 25)
+        self.assertEqual(batcher.stats()['commands'], 25)
+
+    def test_concurrent_submits(self):
+        connection = FakeConnection()
+        batcher = RedisBatcher(connection, linger=0.01, max_batch=64)
+        threads = [
+            threading.Thread(target=lambda: [batcher.submit('publish', 'REDIS_CH_1', 'msg') for _ in range(50)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        self.assertEqual(sum(len(batch) for batch in connection.batches), 200)
+
+    def test_failed_batch_is_counted(self):
+        batcher = RedisBatcher(FakeConnection(fail=True), linger=0, max_batch=10)
+        batcher.submit('xadd', 'REDIS_SKEY_1', {})
+        batcher.close()
+        self.assertEqual(batcher.stats()['errors'], 1)
+
+    def test_transaction_is_wrapped_in_multi_exec(self):
+        connection = FakeConnection()
+        batcher = RedisBatcher(connection, linger=0, max_batch=10)
+        legs = [('xadd', ['REDIS_SKEY_1', {'leg': '1/2'}], {}), ('xadd', ['REDIS_SKEY_1', {'leg': '2/2'}], {})]
+        batcher.submit(TRANSACTION, *legs)
+        batcher.close()
+        self.assertEqual(connection.batches, [[
+            ('execute_command', ('MULTI',)),
+            ('xadd', ('REDIS_SKEY_1', {'leg': '1/2'})),
+            ('xadd', ('REDIS_SKEY_1', {'leg': '2/2'})),
+            ('execute_command', ('EXEC',)),
+        ]])
+
+    def test_failing_leg_of_a_transaction(self):
+        connection = FakeConnection(reject={'publish'})
+        batcher = RedisBatcher(connection, linger=0, max_batch=10)
+        legs = [('xadd', ['REDIS_SKEY_1', {'leg': '1/2'}], {}), ('publish', ['REDIS_CH_1', 'msg'], {})]
+        batcher.submit('xadd', 'REDIS_SKEY_1', {})
+        batcher.submit(TRANSACTION, *legs)
+        batcher.close()
+        # the error is nested in the EXEC reply, it is reported and the batch is not retried
+        self.assertEqual(batcher.stats()['rejected'], 1)
+        self.assertEqual(batcher.stats()['errors'], 0)
+        self.assertEqual(len(connection.batches), 1)
+
+    def test_reply_errors(self):
+        legs = [('xadd', ['REDIS_SKEY_1', {}], {}), ('publish', ['REDIS_CH_1', 'msg'], {})]
+        replies = ['1-0', 'OK', 'QUEUED', 'QUEUED', ['1-1', ResponseError('publish rejected')], ResponseError('bad')]
+        errors = reply_errors([('xadd', ()), (TRANSACTION, legs), ('publish', ())], replies)
+        self.assertEqual([idx for idx, _ in errors], [1, 2])
+
+    def test_direct_transaction_raises_for_failing_leg(self):
+        connection = FakeConnection(reject={'publish'})
+        legs = [('xadd', ['REDIS_SKEY_1', {'leg': '1/2'}], {}), ('publish', ['REDIS_CH_1', 'msg'], {})]
+        self.assertRaises(ResponseError, execute_transaction, connection, legs)
+        self.assertEqual(connection.transactions, [True])
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from tests.test_redis_batch import FakeConnection
+from utils.redis_batch import RedisBatcher
+from utils.redis_outbox import RedisOutbox
+
+
+class FakePool:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.errors = []
+
+    def mark_unhealthy(self, err=None):
+        self.healthy = False
+        self.errors.append(err)
+
+
+class FakeClient:
+    def __init__(self, connection, healthy=True):
+        self.connection = connection
+        self.pool = FakePool(healthy)
+
+
+class TestRedisOutbox(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'outbox.db')
+        self.outbox = RedisOutbox(self.path, batch_size=10)
+
+    def tearDown(self):
+        self.outbox.close()
+        self.dir.cleanup()
+
+    def test_replays_in_order_per_client(self):
+        for idx in range(25):
+            self.outbox.put(1, 'xadd', ('REDIS_SKEY_1', {'idx': idx}), {'maxlen': 100, 'approximate': True})
+        self.outbox.put(2, 'publish', ('REDIS_CH_2', 'msg'))
+        clients = {1: FakeClient(FakeConnection()), 2: FakeClient(FakeConnection(), healthy=False)}
+        self.assertEqual(self.outbox.replay(clients.get), 25)
+        batches = clients[1].connection.batches
+        self.assertEqual([args[1]['idx'] for batch in batches for _, args in batch], list(range(25)))
+        self.assertEqual(len(batches), 3)
+        self.assertFalse(self.outbox.has_pending(1))
+        # unhealthy clients keep their backlog
+        self.assertTrue(self.outbox.has_pending(2))
+        self.assertEqual(self.outbox.pending(), {2: 1})
+
+    def test_failed_replay_keeps_commands(self):
+        self.outbox.put(1, 'publish', ('REDIS_CH_1', 'msg'))
+        client = FakeClient(FakeConnection(fail=True))
+        self.assertEqual(self.outbox.replay({1: client}.get), 0)
+        self.assertFalse(client.pool.healthy)
+        self.assertEqual(self.outbox.pending(), {1: 1})
+
+    def test_batches_behind_a_failed_one_are_held(self):
+        connection = FakeConnection(fail=True)
+
+        def spool(err, commands):
+            for command, args, kwargs in commands:
+                self.outbox.put(1, command, args, kwargs)
+
+        def hold(commands):
+            if not self.outbox.has_pending(1):
+                return False
+            spool(None, commands)
+            return True
+
+        batcher = RedisBatcher(connection, linger=0, max_batch=10, on_error=spool, hold=hold)
+        batcher.execute([('publish', ('REDIS_CH_1', 'msg 1'), {})])
+        # Redis is back, but the next batch must not overtake the spooled one
+        connection.fail = False
+        self.assertIsNone(batcher.execute([('publish', ('REDIS_CH_1', 'msg 2'), {})]))
+        self.assertEqual(connection.batches, [])
+        self.assertEqual(batcher.stats()['held'], 1)
+        self.assertEqual(self.outbox.replay({1: FakeClient(connection)}.get), 2)
+        batcher.execute([('publish', ('REDIS_CH_1', 'msg 3'), {})])
+        sent = [args[1] for batch in connection.batches for _, args in batch]
+        self.assertEqual(sent, ['msg 1', 'msg 2', 'msg 3'])
+
+    def test_backlog_survives_restart(self):
+        self.outbox.put(3, 'publish', ('REDIS_CH_3', 'msg'))
+        self.outbox.close()
+        self.outbox = RedisOutbox(self.path)
+        self.assertTrue(self.outbox.has_pending(3))
+        self.assertEqual(self.outbox.pending(), {3: 1})
+
+    def test_has_pending_does_not_query_without_backlog(self):
+        with patch.object(self.outbox, '_db', wraps=self.outbox._db) as db:
+            self.assertFalse(self.outbox.has_pending(1))
+            db.execute.assert_not_called()
+
+    def test_binary_arguments(self):
+        self.outbox.put(1, 'publish', ('REDIS_CH_1', b'\xc1TB\x01\x80'))
+        client = FakeClient(FakeConnection())
+        self.outbox.replay({1: client}.get)
+        self.assertEqual(client.connection.batches, [[('publish', ('REDIS_CH_1', b'\xc1TB\x01\x80'))]])
+
+    def test_pending_is_shared_between_processes(self):
+        other = RedisOutbox(self.path)
+        try:
+            other.put(1, 'publish', ('REDIS_CH_1', 'msg'))
+            # seen on the next replay pass, sends do not query the table for clients without a backlog
+            self.assertFalse(self.outbox.has_pending(1))
+            self.outbox._load_pending()
+            self.assertTrue(self.outbox.has_pending(1))
+            self.outbox.replay({1: FakeClient(FakeConnection())}.get)
+            self.assertFalse(other.has_pending(1))
+        finally:
+            other.close()
+
+    def test_concurrent_replays_send_once(self):
+        for idx in range(5):
+            self.outbox.put(1, 'publish', ('REDIS_CH_1', idx))
+        other = RedisOutbox(self.path)
+        connection = FakeConnection()
+        try:
+            # another process holds the client's lease
+            self.assertTrue(other._claim(1))
+            self.assertEqual(self.outbox.replay({1: FakeClient(connection)}.get), 0)
+            other._release(1)
+            threads = [threading.Thread(target=outbox.replay, args=({1: FakeClient(connection)}.get,))
+                       for outbox in (self.outbox, other)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            other.close()
+        self.assertEqual([args[1] for batch in connection.batches for _, args in batch], list(range(5)))
+
+    def test_rejected_commands_are_dropped(self):
+        self.outbox.put(1, 'xadd', ('REDIS_SKEY_1', {'idx': 0}))
+        self.outbox.put(1, 'publish', ('REDIS_CH_1', 'msg'))
+        self.outbox.put(1, 'xadd', ('REDIS_SKEY_1', {'idx': 1}))
+        client = FakeClient(FakeConnection(reject={'publish'}))
+        self.assertEqual(self.outbox.replay({1: client}.get), 2)
+        self.assertTrue(client.pool.healthy)
+        self.assertEqual(self.outbox.pending(), {})
+        self.assertEqual(self.outbox.stats()['dropped'], 1)
+        self.assertEqual(len(client.connection.batches), 1)
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from utils.redis_pool import TimedLifoQueue, get_pool, get_pool_stats
+
+
+class TestRedisPool(TestCase):
+    def test_pool_is_shared_per_endpoint(self):
+        first = get_pool(host='127.0.0.1', port=1, decode_responses=True)
+        second = get_pool(host='127.0.0.1', port=1, decode_responses=True)
+        other = get_pool(host='127.0.0.1', port=2, decode_responses=True)
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertIn('127.0.0.1:1', get_pool_stats())
+        first.close()
+        other.close()
+
+    def test_unreachable_endpoint_is_marked_unhealthy(self):
+        pool = get_pool(host='127.0.0.1', port=3, decode_responses=True)
+        self.assertFalse(pool.ping())
+        pool.mark_unhealthy(ConnectionError('refused'))
+        self.assertFalse(pool.healthy)
+        self.assertEqual(pool.stats()['failures'], 1)
+        pool.close()
+
+    def test_queue_counts_hits_and_misses(self):
+        queue = TimedLifoQueue(2)
+        queue.put(None)
+        queue.put('connection')
+        self.assertEqual(queue.get(), 'connection')
+        self.assertIsNone(queue.get())
+        self.assertEqual((queue.hits, queue.misses), (1, 1))
@@ -0,0 +1,44 @@
+import os
+import time
+from unittest import TestCase, mock
+
+from utils.redis_retention import StreamRetention, StreamTrimmer
+
+
+class FakeConnection:
+    def __init__(self):
+        self.trims = []
+
+    def xtrim(self, key, **kwargs):
+        self.trims.append((key, kwargs))
+        return 1
+
+    def xlen(self, key):
+        return 10
+
+    def memory_usage(self, key):
+        return 1024
+
+
+class TestStreamRetention(TestCase):
+    def test_from_env_prefers_suffix(self):
+        env = {'TBOT_REDIS_STREAM_MAXLEN': '1000', 'TBOT_REDIS_STREAM_MAXLEN_2': '50',
+               'TBOT_REDIS_STREAM_MAX_AGE_SEC': '3600'}
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(StreamRetention.from_env('_1'), StreamRetention(1000, 3600))
+            self.assertEqual(StreamRetention.from_env('_2'), StreamRetention(50, 3600))
+
+    def test_xadd_kwargs(self):
+        self.assertEqual(StreamRetention().xadd_kwargs(), {})
+        self.assertEqual(StreamRetention(maxlen=10, max_age=60).xadd_kwargs(), {'maxlen': 10, 'approximate': True})
+        minid = StreamRetention(max_age=60).xadd_kwargs()['minid']
+        self.assertAlmostEqual(int(minid.split('-')[0]) / 1000, time.time() - 60, delta=5)
+
+    def test_trimmer_applies_both_limits(self):
+        connection = FakeConnection()
+        streams = [(connection, 'REDIS_SKEY_1', StreamRetention(maxlen=10, max_age=60)),
+                   (connection, 'REDIS_SKEY_2', StreamRetention())]
+        StreamTrimmer(lambda: streams, interval=60).run_once()
+        self.assertEqual([key for key, _ in connection.trims], ['REDIS_SKEY_1', 'REDIS_SKEY_1'])
+        self.assertEqual(connection.trims[0][1], {'maxlen': 10, 'approximate': True})
+        self.assertIn('minid', connection.trims[1][1])
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from flask import Flask
+
+import tbot
+from utils.result_cache import DataVersion, ResultCache
+
+
+class TestResultCache(TestCase):
+    def test_hit_until_version_changes(self):
+        cache = ResultCache(1024)
+        self.assertEqual(cache.get('q', 1, lambda: b'one'), b'one')
+        self.assertEqual(cache.get('q', 1, lambda: b'two'), b'one')
+        self.assertEqual(cache.get('q', 2, lambda: b'two'), b'two')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bytes']), (1, 2, 3))
+
+    def test_memory_bound(self):
+        cache = ResultCache(10)
+        cache.get('a', 1, lambda: b'aaaa')
+        cache.get('b', 1, lambda: b'bbbb')
+        cache.get('a', 1, lambda: b'')
+        cache.get('c', 1, lambda: b'cccc')
+        # b was the least recently used
+        self.assertEqual(cache.get('a', 1, lambda: b''), b'aaaa')
+        self.assertEqual(cache.get('b', 1, lambda: b'new'), b'new')
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertLessEqual(cache.stats()['bytes'], 10)
+        # results larger than the bound are not kept
+        cache.get('big', 1, lambda: b'x' * 11)
+        self.assertEqual(cache.get('big', 1, lambda: b'y'), b'y')
+
+    def test_concurrent_misses_compute_once(self):
+        cache = ResultCache(1024)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return b'rows'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('q', 1, compute))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [b'rows'] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_failures_are_not_cached(self):
+        cache = ResultCache(1024)
+
+        def fail():
+            raise sqlite3.OperationalError('database is locked')
+
+        self.assertRaises(sqlite3.OperationalError, cache.get, 'q', 1, fail)
+        self.assertEqual(cache.get('q', 1, lambda: b'rows'), b'rows')
+
+
+class TestDataEndpoints(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tbot_sqlite3')
+        self.write("CREATE TABLE TBOTERRORS (errstr TEXT)", "INSERT INTO TBOTERRORS VALUES ('error')")
+        self.env = os.environ.get('TBOT_DB_OFFICE')
+        os.environ['TBOT_DB_OFFICE'] = self.path
+        tbot.result_cache.clear()
+        app = Flask(__name__)
+        app.add_url_rule('/errors/data', view_func=tbot.get_errors_data)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        tbot.close_connection(Exception('teardown'))
+        if self.env is None:
+            os.environ.pop('TBOT_DB_OFFICE')
+        else:
+            os.environ['TBOT_DB_OFFICE'] = self.env
+        self.dir.cleanup()
+
+    def write(self, *statements):
+        writer = sqlite3.connect(self.path)
+        for statement in statements:
+            writer.execute(statement)
+        writer.commit()
+        writer.close()
+
+    def test_data_version(self):
+        version = DataVersion()
+        first = version.get()
+        self.assertEqual(version.get(), first)
+        self.write("INSERT INTO TBOTERRORS VALUES ('later')")
+        self.assertNotEqual(version.get(), first)
+
+    def test_served_from_cache_until_tbot_writes(self):
+        hits = tbot.result_cache.hits
+        first = self.client.get('/errors/data?draw=1&start=0&length=10&_=1').json
+        second = self.client.get('/errors/data?draw=2&start=0&length=10&_=2').json
+        self.assertEqual(tbot.result_cache.hits, hits + 1)
+        self.assertEqual((first['draw'], second['draw']), (1, 2))
+        self.assertEqual(first['data'], second['data'])
+        self.write("INSERT INTO TBOTERRORS VALUES ('later')")
+        self.assertEqual(self.client.get('/errors/data?draw=3&start=0&length=10').json['recordsTotal'], 2)
+        self.assertEqual(len(self.client.get('/errors/data').json['data']), 2)
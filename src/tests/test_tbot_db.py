@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+
+import tbot
+
+
+class TestTbotDb(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tbot_sqlite3')
+        self.create()
+        self.env = os.environ.get('TBOT_DB_OFFICE')
+        os.environ['TBOT_DB_OFFICE'] = self.path
+
+    def tearDown(self):
+        tbot.close_connection(Exception('teardown'))
+        if self.env is None:
+            os.environ.pop('TBOT_DB_OFFICE')
+        else:
+            os.environ['TBOT_DB_OFFICE'] = self.env
+        self.dir.cleanup()
+
+    def create(self, rows=1):
+        writer = sqlite3.connect(self.path)
+        writer.execute('PRAGMA journal_mode = WAL')
+        writer.execute('CREATE TABLE TBOTERRORS (errstr TEXT)')
+        writer.executemany('INSERT INTO TBOTERRORS VALUES (?)', [('error',)] * rows)
+        writer.commit()
+        writer.close()
+
+    def test_connection_per_thread(self):
+        database = tbot.get_db()
+        self.assertIs(tbot.get_db(), database)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(tbot.get_db()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], database)
+
+    def test_read_only(self):
+        self.assertEqual(tbot.query_db('select * from TBOTERRORS'), [{'errstr': 'error'}])
+        self.assertRaises(sqlite3.OperationalError, tbot.get_db().execute, "INSERT INTO TBOTERRORS VALUES ('x')")
+
+    def test_sees_new_rows_while_open(self):
+        tbot.get_db()
+        writer = sqlite3.connect(self.path)
+        writer.execute("INSERT INTO TBOTERRORS VALUES ('later')")
+        writer.commit()
+        writer.close()
+        self.assertEqual(len(tbot.query_db('select * from TBOTERRORS')), 2)
+
+    def test_reconnects_to_replaced_file(self):
+        database = tbot.get_db()
+        os.rename(self.path, self.path + '.old')
+        self.create(rows=3)
+        self.assertIsNot(tbot.get_db(), database)
+        self.assertEqual(len(tbot.query_db('select * from TBOTERRORS')), 3)
+
+    def test_missing_file_is_not_created(self):
+        os.environ['TBOT_DB_OFFICE'] = os.path.join(self.dir.name, 'missing')
+        self.assertEqual(tbot.query_db('select * from TBOTERRORS'), [])
+        self.assertFalse(os.path.exists(os.environ['TBOT_DB_OFFICE']))
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+
+import tbot
+from utils.timeline import ROWS_QUERY, Timeline
+
+JOIN = ('SELECT TBOTORDERS.rowid AS order_rowid, TBOTALERTS.rowid AS alert_rowid, orderstatus '
+        'FROM TBOTORDERS INNER JOIN TBOTALERTS ON TBOTALERTS.orderref = TBOTORDERS.orderref '
+        'AND TBOTALERTS.uniquekey = TBOTORDERS.uniquekey ORDER BY order_rowid, alert_rowid')
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.dir.name, 'tbot_sqlite3')
+        self.tbot = sqlite3.connect(self.source)
+        self.tbot.execute('CREATE TABLE TBOTORDERS (timestamp TEXT, uniquekey TEXT, avgprice REAL, action TEXT, '
+                          'ordertype TEXT, qty REAL, position REAL, orderstatus TEXT, orderref TEXT)')
+        self.tbot.execute('CREATE TABLE TBOTALERTS (tv_timestamp TEXT, uniquekey TEXT, ticker TEXT, tv_price REAL, '
+                          'direction TEXT, orderref TEXT)')
+        self.timeline = Timeline(os.path.join(self.dir.name, 'timeline.db'))
+
+    def tearDown(self):
+        self.timeline.close()
+        self.tbot.close()
+        self.dir.cleanup()
+
+    def alert(self, idx):
+        self.tbot.execute('INSERT INTO TBOTALERTS VALUES (?, ?, ?, ?, ?, ?)',
+                          (f'tv{idx}', f'k{idx}', 'AAPL', 189.0, 'strategy.entrylong', f'Long#{idx}'))
+        self.tbot.commit()
+
+    def order(self, idx, status='Submitted', timestamp='t0'):
+        self.tbot.execute('INSERT INTO TBOTORDERS VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (timestamp, f'k{idx}', 189.1, 'BUY', 'LMT', 100, 100, status, f'Long#{idx}'))
+        self.tbot.commit()
+
+    def rows(self):
+        return [tuple(row) for row in self.timeline.reader().execute(
+            'SELECT order_rowid, alert_rowid, orderstatus FROM timeline ORDER BY order_rowid, alert_rowid')]
+
+    def assert_matches_join(self):
+        self.assertEqual(self.rows(), [tuple(row) for row in self.tbot.execute(JOIN)])
+        self.assertEqual(self.timeline.rows(), len(self.rows()))
+
+    def test_incremental_refresh_matches_join(self):
+        for idx in range(5):
+            self.alert(idx)
+        self.order(0)
+        self.order(1)
+        self.assertEqual(self.timeline.refresh(self.source)['added'], 2)
+        self.assert_matches_join()
+        # orders of old alerts, alerts of old orders, two orders of one alert
+        self.order(3)
+        self.order(6)
+        self.alert(6)
+        self.order(3, status='Filled')
+        self.assertEqual(self.timeline.refresh(self.source)['added'], 3)
+        self.assert_matches_join()
+        self.assertEqual(self.timeline.refresh(self.source), {'added': 0, 'updated': 0, 'rows': 5})
+
+    def test_updated_orders_are_copied_again(self):
+        self.alert(0)
+        self.order(0)
+        self.timeline.refresh(self.source)
+        self.tbot.execute("UPDATE TBOTORDERS SET orderstatus = 'Filled', timestamp = 't1' WHERE rowid = 1")
+        self.tbot.commit()
+        self.assertEqual(self.timeline.refresh(self.source)['updated'], 1)
+        self.assertEqual(self.rows(), [(1, 1, 'Filled')])
+
+    def test_updates_before_the_watermark_are_skipped(self):
+        self.alert(0)
+        self.order(0, timestamp='t1')
+        self.alert(1)
+        self.order(1, timestamp='t2')
+        self.timeline.refresh(self.source)
+        # only orders stamped at or after the latest timestamp copied (t2) are compared
+        self.tbot.execute("UPDATE TBOTORDERS SET orderstatus = 'Filled', timestamp = 't0' WHERE rowid = 1")
+        self.tbot.commit()
+        self.assertEqual(self.timeline.refresh(self.source)['updated'], 0)
+        self.tbot.execute("UPDATE TBOTORDERS SET timestamp = 't2' WHERE rowid = 1")
+        self.tbot.commit()
+        self.assertEqual(self.timeline.refresh(self.source)['updated'], 1)
+        self.assertEqual(self.rows(), [(1, 1, 'Filled'), (2, 2, 'Submitted')])
+
+    def test_rebuild(self):
+        self.alert(0)
+        self.order(0)
+        self.timeline.refresh(self.source)
+        self.tbot.execute('DELETE FROM TBOTORDERS')
+        self.tbot.commit()
+        self.order(1)
+        self.alert(1)
+        result = self.timeline.refresh(self.source, rebuild=True)
+        self.assertEqual(result['rows'], 1)
+        self.assert_matches_join()
+        self.assertEqual(self.timeline.reader().execute(ROWS_QUERY).fetchone()[0], 1)
+
+    def test_tbot_data(self):
+        for idx in range(30):
+            self.alert(idx)
+            self.order(idx)
+        app = Flask(__name__)
+        app.add_url_rule('/tbot/data', view_func=tbot.get_tbot_data)
+        tbot.result_cache.clear()
+        with patch.object(tbot, 'timeline', self.timeline), patch.dict(os.environ, {'TBOT_DB_OFFICE': self.source}):
+            response = app.test_client().get('/tbot/data?draw=1&start=0&length=10&columns[0][data]=uniquekey'
+                                             '&order[0][column]=0&order[0][dir]=desc').json
+            self.assertEqual(response['recordsTotal'], 30)
+            self.assertEqual(response['data'][0]['uniquekey'], 'k9')
+            self.assertEqual(response['data'][0]['ticker'], 'AAPL')
+            self.assertEqual(len(app.test_client().get('/tbot/data').json['data']), 30)
@@ -1,4 +1,5 @@
 import os
+import socket
 from logging import getLogger, DEBUG
 
 import typer
@@ -60,7 +61,9 @@ def start(
 
     def run_server():
         print("Close server with Ctrl+C in terminal.")
-        run(f'gunicorn --bind {host}:{port} wsgi:app'.split(' '))
+        from commons import SERVER_THREADS
+        # a sync worker would be held by the first /stream, threads serve the rest
+        run(f'gunicorn --bind {host}:{port} --threads {SERVER_THREADS} wsgi:app'.split(' '))
 
     # clear gui key if gui is set to open, else generate key
     # Flask uses the existence of the key file to determine GUI mode
@@ -202,6 +205,140 @@ def trigger_event(name: str):
     return True
 
 
+def run_worker(consumer: str, count: int, block_ms: int, shards=None):
+    from settings import REGISTERED_ACTIONS, REGISTERED_EVENTS, REGISTERED_LINKS
+    from components.actions.base.action import am
+    from components.events.base.job_queue import JobWorker, job_queue
+    from utils.register import register_action, register_event, register_link
+
+    # each worker process registers its own actions and events, like main.py does
+    [register_action(action) for action in REGISTERED_ACTIONS]
+    [register_event(event) for event in REGISTERED_EVENTS]
+    [register_link(link, em, am) for link in REGISTERED_LINKS]
+    try:
+        JobWorker(job_queue, em, consumer, count=count, block_ms=block_ms, shards=shards).run()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command('worker')
+def worker(
+        processes: int = typer.Option(default=1, help='Worker processes to run, at most one per shard '
+                                                         '(TVWB_JOB_SHARDS).'),
+        consumer: str = typer.Option(default=socket.gethostname(), help='Consumer name prefix, unique per host.'),
+        count: int = typer.Option(default=10, help='Jobs read per call.'),
+        block_ms: int = typer.Option(default=5000, help='Milliseconds to wait for new jobs.'),
+):
+    """
+    Runs the actions of events queued by the web server (TVWB_JOB_QUEUE=true) in a Redis consumer group.
+    Each shard is read by one process, so the jobs of a clientId run in order.
+    Run a single `worker` command per job queue, processes of another one would share the shards.
+    """
+    from commons import JOB_SHARDS
+    if processes > JOB_SHARDS:
+        typer.echo(f'Running {JOB_SHARDS} processes, one per shard. Raise TVWB_JOB_SHARDS to run more.')
+        processes = JOB_SHARDS
+    if processes <= 1:
+        return run_worker(f'{consumer}-0', count, block_ms)
+    from multiprocessing import get_context
+    context = get_context('spawn')
+    # shards are dealt out round robin, the same ones to the same consumer name on every start
+    workers = [context.Process(target=run_worker, args=(f'{consumer}-{idx}', count, block_ms,
+                                                        list(range(idx, JOB_SHARDS, processes))),
+                               name=f'worker-{idx}')
+               for idx in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.join()
+
+
+@app.command('worker:stats')
+def worker_stats():
+    """
+    Shows the length of the job stream and pending jobs per consumer group.
+    """
+    from components.events.base.job_queue import job_queue
+    job_queue.ensure_group()
+    typer.echo(job_queue.stats())
+
+
+@app.command('redis:streams')
+def redis_streams():
+    """
+    Shows the length and memory use of each TBOT client stream.
+    """
+    from components.actions.redis_pub_action_clients import RedisPubActionClients, TBOT_CLIENT_MAX_LEN
+    action = RedisPubActionClients()
+    for client_id in range(1, TBOT_CLIENT_MAX_LEN + 1):
+        action.get_client(client_id)
+    for key, stats in action.stream_stats().items():
+        typer.echo(f'{key}\t{stats}')
+
+
+@app.command('redis:latency')
+def redis_latency(
+        client_id: int = typer.Option(default=1, help='TBOT clientId whose stream is read.'),
+        count: int = typer.Option(default=1000, help='Number of entries to read.'),
+        from_start: bool = typer.Option(default=False, help='Read the stream from its first entry, not only new ones.'),
+        timeout: float = typer.Option(default=60, help='Seconds to wait for entries.'),
+):
+    """
+    Reads latency stamps from a TBOT client stream and shows per-hop percentiles in ms.
+    Entries are only stamped while TBOT_REDIS_LATENCY_STAMPS=1.
+    """
+    from redis import ConnectionPool, Redis
+    from components.actions.redis_pub_action_clients import RedisPubActionClients
+    from utils.latency import HOPS, consume
+    client = RedisPubActionClients().get_client(client_id)
+    if client is None:
+        return typer.echo(f'Invalid clientId {client_id}')
+    # read bytes, entries may hold msgpack messages
+    pool = ConnectionPool(connection_class=client.pool.connection_class,
+                          **{**client.pool.connection_kwargs, 'decode_responses': False})
+    report = consume(Redis(connection_pool=pool), client.stream_key, count,
+                     last_id='0' if from_start else '$', timeout=timeout)
+    typer.echo(f'{client.stream_key}: {report.entries} entries, {report.skipped} without stamps, '
+               f'{report.gaps} missing by sequence number')
+    for hop, stats in report.summary().items():
+        typer.echo(f'{hop:<9}' + ''.join(f'{name}={value}\t' for name, value in stats.items()) + HOPS[hop])
+
+
+@app.command('redis:outbox')
+def redis_outbox():
+    """
+    Shows the commands waiting in the Redis outbox for each TBOT client.
+    """
+    from components.actions.redis_pub_action_clients import TBOT_REDIS_OUTBOX
+    from utils.redis_outbox import RedisOutbox
+    if not TBOT_REDIS_OUTBOX:
+        return typer.echo('The Redis outbox is disabled.')
+    outbox = RedisOutbox(TBOT_REDIS_OUTBOX)
+    pending = outbox.pending()
+    outbox.close()
+    if not pending:
+        return typer.echo('The Redis outbox is empty.')
+    for client_id, count in pending.items():
+        typer.echo(f'clientId {client_id}\t{count}')
+
+
+@app.command('timeline:rebuild')
+def timeline_rebuild():
+    """
+    Rebuilds the alert to order timeline served on /tbot/data from TBOT's database.
+    """
+    from tbot import TIMELINE_PATH, timeline
+    if timeline is None:
+        return typer.echo('The timeline is disabled (TBOT_TIMELINE is empty).')
+    result = timeline.refresh(os.environ.get("TBOT_DB_OFFICE", "/run/tbot/tbot_sqlite3"), rebuild=True)
+    timeline.close()
+    typer.echo(f'{TIMELINE_PATH}: {result["rows"]} rows')
+
+
 @app.command('shell')
 def shell():
     cmd = '--help'
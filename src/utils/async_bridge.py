@@ -0,0 +1,48 @@
+"""
+One asyncio event loop, run on a background thread, for sync code to hand
+coroutines to.
+
+Flask views and Event.trigger are synchronous. They submit coroutines
+here and get a concurrent.futures.Future back, which they can wait on or
+leave to finish in the background.
+"""
+import asyncio
+import os
+import threading
+
+_loop = None
+_thread = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    Gets the shared loop, starting its thread on first use and again after a fork
+    :return: asyncio.AbstractEventLoop
+    """
+    global _loop, _thread, _pid
+    if _thread is None or not _thread.is_alive() or _pid != os.getpid():
+        with _lock:
+            if _thread is None or not _thread.is_alive() or _pid != os.getpid():
+                _loop = asyncio.new_event_loop()
+                _thread = threading.Thread(target=_loop.run_forever, name='async-bridge', daemon=True)
+                _thread.start()
+                _pid = os.getpid()
+    return _loop
+
+
+def submit(coroutine):
+    """
+    Schedules a coroutine on the shared loop, coroutines run in the order they are submitted
+    :return: concurrent.futures.Future
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
+
+def run(coroutine, timeout: float = None):
+    """
+    Runs a coroutine on the shared loop and waits for its result
+    :param timeout: seconds to wait, None waits forever
+    """
+    return submit(coroutine).result(timeout)
@@ -0,0 +1,190 @@
+"""
+Live updates for the dashboards, sent as Server-Sent Events.
+
+One producer thread watches the event log and the TBOT database and fans
+each change out to every subscriber. Messages are serialised once and
+shared, and each subscriber has its own bounded buffer, so a slow
+browser tab cannot hold up the others.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+
+from werkzeug.http import http_date
+
+from commons import STREAM_BUFFER, STREAM_INTERVAL, STREAM_MAX_CLIENTS
+from components.logs.event_log import event_log
+from components.logs.log_event import LogEvent
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# tables watched for the orders, alerts and errors pages
+WATCHED_TABLES = ('TBOTORDERS', 'TBOTALERTS', 'TBOTERRORS')
+
+
+def format_message(event, data):
+    """
+    Formats an SSE message
+    :param event: event name the browser listens for
+    :param data: JSON-serialisable payload
+    :return: str
+    """
+    return f'event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n'
+
+
+def _json_default(value):
+    # match the dates Flask's jsonify sends for the same records
+    if isinstance(value, datetime):
+        return http_date(value)
+    return str(value)
+
+
+class Subscription:
+    def __init__(self, buffer_size):
+        self._messages = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, message):
+        with self._cond:
+            if len(self._messages) == self._messages.maxlen:
+                self.dropped += 1
+            self._messages.append(message)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Waits for messages
+        :param timeout: seconds to wait before returning nothing
+        :return: list of str, oldest first
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._messages, timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+            if self.dropped:
+                # the buffer overflowed, tell the browser to refetch rather than trust the gaps
+                messages.insert(0, format_message('reset', {'dropped': self.dropped}))
+                self.dropped = 0
+            return messages
+
+
+class LogWatcher:
+    def __init__(self, log=event_log):
+        self.log = log
+        # only send records written after the watcher starts
+        _, self.cursor = log.tail(1)
+
+    def poll(self):
+        lines, self.cursor = self.log.read_after(self.cursor)
+        if not lines:
+            return []
+        # same shape as a paged /logs response, so the browser can keep polling from cursor
+        return [('logs', {'logs': [LogEvent().from_line(line).as_json() for line in lines], 'cursor': self.cursor})]
+
+
+class DatabaseWatcher:
+    def __init__(self, path=None, tables=WATCHED_TABLES):
+        self.path = path or os.environ.get("TBOT_DB_OFFICE", "/run/tbot/tbot_sqlite3")
+        self.tables = tables
+        self._connection = None
+        self._data_version = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        return self._connection
+
+    def poll(self):
+        try:
+            connection = self._connect()
+            # data_version changes whenever another connection commits
+            data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            rowids = {}
+            for table in self.tables:
+                try:
+                    rowids[table] = connection.execute(f'SELECT max(rowid) FROM {table}').fetchone()[0]
+                except sqlite3.OperationalError:
+                    rowids[table] = None
+            return [('db', {'data_version': data_version, 'tables': rowids})]
+        except sqlite3.Error as e:
+            logger.debug(f'Database watcher failed: {e}')
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+            return []
+
+
+class Broadcaster:
+    def __init__(self, watchers=None, interval=1.0, buffer_size=256, max_subscribers=8):
+        self.watchers = watchers
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self):
+        """
+        Adds a subscriber, starting the producer if needed
+        :return: Subscription(), or None when there are already max_subscribers
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self.buffer_size)
+            self._subscribers.add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                if self.watchers is None:
+                    self.watchers = [LogWatcher(), DatabaseWatcher()]
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._produce, name='broadcast', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data):
+        """
+        Sends a message to every subscriber
+        :param event: event name the browser listens for
+        :param data: JSON-serialisable payload
+        """
+        message = format_message(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def poll(self):
+        """
+        Polls every watcher once and publishes what changed
+        """
+        for watcher in self.watchers:
+            try:
+                for event, data in watcher.poll():
+                    self.publish(event, data)
+            except Exception as e:
+                logger.error(f'{type(watcher).__name__} failed: {e}')
+
+    def _produce(self):
+        # keeps polling with no subscribers, so watchers never replay a backlog to a new one
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self._stop.set()
+
+
+broadcaster = Broadcaster(interval=STREAM_INTERVAL, buffer_size=STREAM_BUFFER, max_subscribers=STREAM_MAX_CLIENTS)
@@ -0,0 +1,101 @@
+"""
+Encodings for messages sent to TBOT.
+
+'json' is the default and what TBOT has always read: the tradingboat
+field (or the pub/sub message) holds JSON text.
+
+'msgpack' is the compact option. Stream entries carry an enc field of
+'msgpack:<version>' next to the binary tradingboat field. Pub/sub
+messages start with MSGPACK_MAGIC and a version byte, which JSON text
+never does. Consumers reading msgpack must use decode_responses=False.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODINGS = ('json', 'msgpack')
+# bumped when the layout of an encoding changes, consumers reject newer versions
+CODEC_VERSION = 1
+ENCODING_FIELD = 'enc'
+MESSAGE_FIELD = 'tradingboat'
+MSGPACK_MAGIC = b'\xc1TB'
+
+
+def require_encoding(encoding):
+    """Raises if an encoding is unknown or its package is not installed"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f'Unknown encoding {encoding}, expected one of {ENCODINGS}')
+    if encoding == 'msgpack' and msgpack is None:
+        raise ImportError('The msgpack encoding needs the msgpack package, pip install msgpack')
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def encode(data, encoding: str = 'json'):
+    """
+    Encodes webhook data
+    :return: str for json, bytes for msgpack
+    """
+    require_encoding(encoding)
+    if encoding == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data)
+
+
+def entry_fields(body, encoding: str = 'json', key: str = MESSAGE_FIELD):
+    """
+    Stream entry fields for an encoded body
+    :return: dict
+    """
+    if encoding == 'json':
+        return {key: body}
+    return {key: body, ENCODING_FIELD: f'{encoding}:{CODEC_VERSION}'}
+
+
+def frame(body, encoding: str = 'json'):
+    """
+    Pub/sub message for an encoded body
+    :return: str or bytes
+    """
+    if encoding == 'json':
+        return body
+    return MSGPACK_MAGIC + bytes([CODEC_VERSION]) + body
+
+
+def _check_version(version):
+    if version > CODEC_VERSION:
+        raise ValueError(f'Message encoded with version {version}, this side understands up to {CODEC_VERSION}')
+
+
+def decode_entry(fields, key: str = MESSAGE_FIELD):
+    """
+    Decodes the message of a stream entry, whichever encoding it was sent in
+    :param fields: entry fields, with str or bytes keys
+    :return: dict
+    """
+    fields = {_text(name): value for name, value in fields.items()}
+    enc = _text(fields.get(ENCODING_FIELD, 'json'))
+    encoding, _, version = enc.partition(':')
+    require_encoding(encoding)
+    if encoding == 'msgpack':
+        _check_version(int(version or 0))
+        return msgpack.unpackb(fields[key], raw=False)
+    return json.loads(fields[key])
+
+
+def decode_message(payload):
+    """
+    Decodes a pub/sub message, whichever encoding it was sent in
+    :param payload: str or bytes
+    :return: dict
+    """
+    if isinstance(payload, bytes) and payload.startswith(MSGPACK_MAGIC):
+        require_encoding('msgpack')
+        _check_version(payload[len(MSGPACK_MAGIC)])
+        return msgpack.unpackb(payload[len(MSGPACK_MAGIC) + 1:], raw=False)
+    return json.loads(payload)
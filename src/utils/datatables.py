@@ -0,0 +1,223 @@
+"""
+DataTables server-side processing over SQLite tables
+(https://datatables.net/manual/server-side).
+
+Pages are read with LIMIT/OFFSET, or by seeking past a cursor (`after`) when
+the browser asks for the page following the one it shows, so paging through
+months of history does not scan every row before the page. Between reloads,
+`since` requests return only the rows added or changed after a watermark.
+"""
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+# rows shown when DataTables asks for "All" (length=-1)
+MAX_PAGE_LENGTH = 1000
+# rowid of each row, part of the cursor of the next page
+ROWID = '_rowid'
+
+
+@dataclass
+class TableSource:
+    """
+    Rows served to a DataTable.
+
+    :param from_sql: FROM clause, a table or a join
+    :param columns: column name -> SQL expression, the only columns that can be sorted and searched
+    :param key: SQL expression of the rowid, breaks ties between equal sort values
+    :param default_order: column sorted by when the request names none, else the key
+    :param updated: SQL expression of the time a row last changed, for rows updated in place
+    :param total: SQL returning the number of rows when it is kept up to date elsewhere, else they are counted
+    """
+    from_sql: str
+    columns: dict
+    key: str = 'rowid'
+    default_order: Optional[str] = None
+    updated: Optional[str] = None
+    total: Optional[str] = None
+
+    def select(self):
+        return ', '.join([f'{self.key} AS {ROWID}'] + [f'{expr} AS "{name}"' for name, expr in self.columns.items()])
+
+
+@dataclass
+class PageRequest:
+    draw: int = 0
+    start: int = 0
+    length: int = 10
+    order: Optional[str] = None
+    descending: bool = True
+    search: str = ''
+    searchable: Optional[list] = None
+    after: Optional[list] = None
+
+
+def _int(value, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_request(args, max_length: int = MAX_PAGE_LENGTH) -> PageRequest:
+    """
+    Reads the parameters DataTables sends
+    :param args: request.args
+    :return: PageRequest
+    """
+    page = PageRequest(draw=_int(args.get('draw'), 0), start=max(_int(args.get('start'), 0), 0),
+                       search=args.get('search[value]', ''))
+    length = _int(args.get('length'), page.length)
+    page.length = max_length if length < 0 or length > max_length else length
+
+    names, searchable = [], []
+    while f'columns[{len(names)}][data]' in args:
+        name = args.get(f'columns[{len(names)}][data]')
+        if args.get(f'columns[{len(names)}][searchable]', 'true') == 'true':
+            searchable.append(name)
+        names.append(name)
+    if names:
+        page.searchable = searchable
+
+    column = _int(args.get('order[0][column]'), -1)
+    if 0 <= column < len(names):
+        page.order = names[column]
+        page.descending = args.get('order[0][dir]') == 'desc'
+
+    try:
+        after = json.loads(args.get('after', 'null'))
+    except ValueError:
+        after = None
+    if isinstance(after, list) and len(after) == 2 and isinstance(after[1], int):
+        page.after = after
+    return page
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _seek(expr: Optional[str], key: str, descending: bool, after: list):
+    """
+    Builds the condition of rows sorted after the cursor.
+    NULL sort values come first in SQLite, so they are last when descending.
+    :return: tuple of (SQL, parameters)
+    """
+    value, rowid = after
+    op = '<' if descending else '>'
+    if expr is None:
+        return f'{key} {op} ?', [rowid]
+    if value is None:
+        if descending:
+            return f'({expr} IS NULL AND {key} < ?)', [rowid]
+        return f'(({expr} IS NULL AND {key} > ?) OR {expr} IS NOT NULL)', [rowid]
+    if descending:
+        return f'({expr} IS NULL OR ({expr}, {key}) < (?, ?))', [value, rowid]
+    return f'({expr}, {key}) > (?, ?)', [value, rowid]
+
+
+def fetch_page(db, source: TableSource, page: PageRequest) -> dict:
+    """
+    Reads one page of rows of source
+    :param db: sqlite3 connection with sqlite3.Row rows
+    :return: DataTables response, with the cursor of the next page as `after`
+    """
+    order = page.order if page.order in source.columns else source.default_order
+    order_expr = source.columns.get(order)
+    descending = page.descending if order == page.order else True
+
+    where, params = [], []
+    if page.search:
+        names = source.columns if page.searchable is None else page.searchable
+        exprs = [source.columns[name] for name in names if name in source.columns]
+        if exprs:
+            where.append('(' + ' OR '.join(f"{expr} LIKE ? ESCAPE '\\'" for expr in exprs) + ')')
+            params += [f'%{_escape_like(page.search)}%'] * len(exprs)
+    filter_sql = f' WHERE {" AND ".join(where)}' if where else ''
+    filter_params = list(params)
+
+    offset = page.start
+    if page.after is not None:
+        sql, seek_params = _seek(order_expr, source.key, descending, page.after)
+        where.append(sql)
+        params += seek_params
+        offset = 0
+
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f'{order_expr} {direction}, {source.key} {direction}' if order_expr else f'{source.key} {direction}'
+    query = (f'SELECT {source.select()} FROM {source.from_sql}'
+             f'{" WHERE " + " AND ".join(where) if where else ""}'
+             f' ORDER BY {order_by} LIMIT ? OFFSET ?')
+    rows = [{k: row[k] for k in row.keys()} for row in db.execute(query, params + [page.length, offset])]
+
+    total = db.execute(source.total or f'SELECT count(*) FROM {source.from_sql}').fetchone()[0]
+    filtered = total
+    if filter_sql:
+        filtered = db.execute(f'SELECT count(*) FROM {source.from_sql}{filter_sql}', filter_params).fetchone()[0]
+
+    after = [rows[-1][order] if order_expr else None, rows[-1][ROWID]] if rows else None
+    return {'draw': page.draw, 'recordsTotal': total, 'recordsFiltered': filtered, 'data': rows, 'after': after}
+
+
+def parse_delta(args):
+    """
+    Reads the watermarks of a delta request
+    :param args: request.args, `since` is empty to only get the current watermarks
+    :return: tuple of (rowid or None, updated cursor or None)
+    """
+    since = _int(args.get('since'), -1)
+    try:
+        updated = json.loads(args.get('updated', 'null'))
+    except ValueError:
+        updated = None
+    if not (isinstance(updated, list) and len(updated) == 2):
+        updated = None
+    return (since if since >= 0 else None), updated
+
+
+def fetch_delta(db, source: TableSource, since: Optional[int], updated: Optional[list] = None,
+                limit: int = MAX_PAGE_LENGTH) -> dict:
+    """
+    Reads the rows added after rowid since and, if source has an updated
+    column, the older rows changed after the updated cursor
+    :param db: sqlite3 connection with sqlite3.Row rows
+    :param since: rowid watermark, None to only get the current watermarks
+    :param updated: [updated value, rowid] of the last change seen, None for any change
+    :param limit: rows read by each of the two queries
+    :return: dict of rows, next watermarks, and whether rows are left to read (`more`)
+    """
+    if since is None:
+        last = db.execute(f'SELECT max({source.key}) FROM {source.from_sql}').fetchone()[0]
+        latest = None
+        if source.updated:
+            latest = db.execute(f'SELECT {source.updated}, {source.key} FROM {source.from_sql} '
+                                f'WHERE {source.updated} IS NOT NULL '
+                                f'ORDER BY {source.updated} DESC, {source.key} DESC LIMIT 1').fetchone()
+        return {'data': [], 'since': last or 0, 'updated': list(latest) if latest else None, 'more': False}
+
+    select = f'{source.select()}, {source.updated} AS _updated' if source.updated else source.select()
+
+    def read(where, params, order_by):
+        query = f'SELECT {select} FROM {source.from_sql} WHERE {where} ORDER BY {order_by} LIMIT ?'
+        rows = [{k: row[k] for k in row.keys()} for row in db.execute(query, params + [limit + 1])]
+        return rows[:limit], len(rows) > limit
+
+    added, more = read(f'{source.key} > ?', [since], source.key)
+    changed, more_changed = [], False
+    if source.updated:
+        where, params = f'{source.key} <= ? AND {source.updated} IS NOT NULL', [since]
+        if updated is not None and updated[0] is not None:
+            where += f' AND ({source.updated}, {source.key}) > (?, ?)'
+            params += updated
+        changed, more_changed = read(where, params, f'{source.updated}, {source.key}')
+        # past the last change read, or when all were read, past the rows added too
+        seen = changed[-1:] if more_changed else changed + added
+        cursors = [(row['_updated'], row[ROWID]) for row in seen if row['_updated'] is not None]
+        if updated is not None and updated[0] is not None:
+            cursors.append(tuple(updated))
+        if cursors:
+            updated = list(max(cursors))
+    for row in changed + added:
+        row.pop('_updated', None)
+    return {'data': changed + added, 'since': added[-1][ROWID] if added else since, 'updated': updated,
+            'more': more or more_changed}
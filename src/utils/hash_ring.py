@@ -0,0 +1,51 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """
+    Consistent-hash ring mapping keys to nodes.
+
+    Each node is placed on the ring many times (virtual nodes) so keys
+    spread evenly, and adding or removing a node only moves the keys
+    that node owned.
+    """
+
+    def __init__(self, nodes=(), replicas: int = 160):
+        self.replicas = replicas
+        self._hashes = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def add(self, node: str):
+        for replica in range(self.replicas):
+            point = self._hash(f'{node}#{replica}')
+            if point not in self._nodes:
+                bisect.insort(self._hashes, point)
+            self._nodes[point] = node
+
+    def remove(self, node: str):
+        for replica in range(self.replicas):
+            point = self._hash(f'{node}#{replica}')
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._hashes.remove(point)
+
+    def get_node(self, key: str):
+        """
+        Gets the node owning a key
+        :return: node, or None for an empty ring
+        """
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[self._hashes[idx]]
+
+    @property
+    def nodes(self):
+        return sorted(set(self._nodes.values()))
@@ -0,0 +1,148 @@
+"""
+Delivery latency stamps for stream entries, and a report over them.
+
+With TBOT_REDIS_LATENCY_STAMPS=1, TVWB adds these fields next to the
+message in each stream entry:
+
+    seq          per-process sequence number, with pid to tell processes apart
+    recv_ns      time.monotonic_ns() when /webhook received the request
+    dispatch_ns  time.monotonic_ns() when the event started its actions
+    publish_ns   time.monotonic_ns() when the action handed the entry to the Redis client
+    wall_ns      time.time_ns() at publish, for hops measured in another process
+
+Monotonic stamps are only comparable within one process, so the hops from
+publish onwards use the wall clock, and the entry id Redis assigned (ms).
+Jobs run by a `tvwb.py worker` carry their receive stamp as wall time, and
+the worker turns it back into its own monotonic clock, so the queue hop
+includes the time spent in the job queue.
+"""
+import itertools
+import math
+import os
+import time
+
+LATENCY_FIELDS = ('seq', 'pid', 'recv_ns', 'dispatch_ns', 'publish_ns', 'wall_ns')
+# hop name -> what it covers
+HOPS = {
+    'queue': 'recv -> dispatch, waiting for a dispatch worker or in the job queue',
+    'action': 'dispatch -> publish, running actions up to the Redis call',
+    'redis': 'publish -> stored in the stream, by entry id (ms resolution)',
+    'consumer': 'publish -> read by the consumer',
+    'total': 'recv -> read by the consumer',
+}
+
+_seq = itertools.count(1)
+
+
+def monotonic_to_wall_ns(monotonic_ns: int) -> int:
+    """Converts a time.monotonic_ns() stamp of this process to time.time_ns()"""
+    return time.time_ns() - (time.monotonic_ns() - monotonic_ns)
+
+
+def wall_to_monotonic_ns(wall_ns: int) -> int:
+    """Converts a time.time_ns() stamp, possibly taken in another process, to this process's time.monotonic_ns()"""
+    return time.monotonic_ns() - (time.time_ns() - wall_ns)
+
+
+def latency_fields(context=None):
+    """
+    Stamps for a stream entry published now
+    :param context: ActionContext() carrying received_ns/dispatched_ns
+    :return: dict of str to int
+    """
+    publish_ns = time.monotonic_ns()
+    dispatched_ns = getattr(context, 'dispatched_ns', None) or publish_ns
+    # without a receive stamp the queue hop is 0, never negative
+    received_ns = getattr(context, 'received_ns', None) or dispatched_ns
+    return {
+        'seq': next(_seq),
+        'pid': os.getpid(),
+        'recv_ns': received_ns,
+        'dispatch_ns': dispatched_ns,
+        'publish_ns': publish_ns,
+        'wall_ns': time.time_ns(),
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class LatencyReport:
+    """Collects per-hop latencies from stamped stream entries"""
+
+    def __init__(self):
+        self.hops = {hop: [] for hop in HOPS}
+        self.entries = 0
+        self.skipped = 0
+        self.gaps = 0
+        self._last_seq = {}
+
+    def add(self, entry_id: str, fields: dict, read_wall_ns: int = None):
+        """
+        Adds one stream entry
+        :param entry_id: id Redis assigned, i.e. '1700000000000-0'
+        :param fields: entry fields, as read from the stream
+        :param read_wall_ns: time.time_ns() when the entry was read
+        """
+        # decode_responses=False returns bytes, needed to read msgpack entries
+        fields = {name.decode() if isinstance(name, bytes) else name: value for name, value in fields.items()}
+        entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        if any(name not in fields for name in LATENCY_FIELDS):
+            self.skipped += 1
+            return
+        read_wall_ns = read_wall_ns or time.time_ns()
+        stamps = {name: int(fields[name]) for name in LATENCY_FIELDS}
+        last = self._last_seq.get(stamps['pid'])
+        if last is not None and stamps['seq'] > last + 1:
+            self.gaps += stamps['seq'] - last - 1
+        self._last_seq[stamps['pid']] = stamps['seq']
+
+        stored_ns = int(entry_id.split('-')[0]) * 1_000_000
+        queue = stamps['dispatch_ns'] - stamps['recv_ns']
+        action = stamps['publish_ns'] - stamps['dispatch_ns']
+        consumer = read_wall_ns - stamps['wall_ns']
+        self.hops['queue'].append(queue)
+        self.hops['action'].append(action)
+        self.hops['redis'].append(max(stored_ns - stamps['wall_ns'], 0))
+        self.hops['consumer'].append(consumer)
+        self.hops['total'].append(queue + action + consumer)
+        self.entries += 1
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Gets latency percentiles per hop, in ms
+        :return: dict of hop to dict of p50/p90/p99/max
+        """
+        result = {}
+        for hop, values in self.hops.items():
+            values = sorted(values)
+            stats = {f'p{pct}': percentile(values, pct) for pct in percentiles}
+            stats['max'] = values[-1] if values else None
+            result[hop] = {name: None if value is None else round(value / 1e6, 3) for name, value in stats.items()}
+        return result
+
+
+def consume(connection, key: str, count: int, last_id: str = '$', block_ms: int = 1000, timeout: float = None):
+    """
+    Reads stamped entries from a stream with XREAD
+    :param last_id: read entries after this id, '$' for new entries only, '0' for the whole stream
+    :param timeout: seconds to wait overall, None waits until count entries were read
+    :return: LatencyReport()
+    """
+    report = LatencyReport()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while report.entries + report.skipped < count:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        response = connection.xread({key: last_id}, count=count - report.entries - report.skipped, block=block_ms)
+        read_wall_ns = time.time_ns()
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                report.add(entry_id, fields, read_wall_ns)
+                last_id = entry_id
+    return report
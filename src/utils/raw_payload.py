@@ -0,0 +1,84 @@
+"""
+Webhook bodies that are routed without being fully decoded.
+
+Only the top-level members needed for routing are kept. The rest of the
+body is still scanned to its closing brace, so a truncated or corrupt body
+is rejected like json.loads would, but it is not turned into a dict. The
+body is kept as sent, so it can be forwarded without a decode/encode round
+trip.
+"""
+import json
+import re
+from json.decoder import scanstring
+from json.scanner import make_scanner
+
+# fields /webhook and the Redis actions route on
+ROUTING_FIELDS = ('key', 'clientId')
+
+_scan_value = make_scanner(json.JSONDecoder())
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def scan_fields(body: str, names=ROUTING_FIELDS):
+    """
+    Decodes the named top-level members of a JSON object
+    :param body: JSON text
+    :param names: members to find
+    :return: dict of the members found, or None if body is not a single valid JSON object
+    """
+    wanted = set(names)
+    found = {}
+    skip = _whitespace.match
+    try:
+        idx = skip(body, 0).end()
+        if body[idx:idx + 1] != '{':
+            return None
+        idx = skip(body, idx + 1).end()
+        if body[idx:idx + 1] == '}':
+            return found if skip(body, idx + 1).end() == len(body) else None
+        while True:
+            if body[idx:idx + 1] != '"':
+                return None
+            name, idx = scanstring(body, idx + 1)
+            idx = skip(body, idx).end()
+            if body[idx:idx + 1] != ':':
+                return None
+            # the other values are decoded to find their end, in C, and dropped
+            value, idx = _scan_value(body, skip(body, idx + 1).end())
+            if name in wanted:
+                found[name] = value
+            idx = skip(body, idx).end()
+            separator = body[idx:idx + 1]
+            if separator == '}':
+                # nothing but whitespace may follow the object
+                return found if skip(body, idx + 1).end() == len(body) else None
+            if separator != ',':
+                return None
+            idx = skip(body, idx + 1).end()
+    except (StopIteration, ValueError):
+        return None
+
+
+class RawPayload(dict):
+    """
+    Routing fields of a webhook body, with the body kept in raw.
+    Actions that need the other fields get them from decode(),
+    ActionContext.data does this on first use.
+    """
+
+    def __init__(self, raw: str, fields):
+        super().__init__(fields)
+        self.raw = raw
+
+    @classmethod
+    def parse(cls, body: str):
+        """
+        :return: RawPayload(), or None if body is not a JSON object
+        """
+        fields = scan_fields(body)
+        if fields is None:
+            return None
+        return cls(body, fields)
+
+    def decode(self):
+        return json.loads(self.raw)
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from itertools import islice
+
+from redis.exceptions import RedisError, ResponseError
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# pseudo-command whose args are (command, args, kwargs) tuples, sent as one MULTI/EXEC block
+TRANSACTION = 'transaction'
+
+
+def queue_command(pipe, command, args=(), kwargs=None):
+    """
+    Queues a command on a pipeline, wrapping the commands of a TRANSACTION in MULTI/EXEC
+    """
+    if command == TRANSACTION:
+        pipe.execute_command('MULTI')
+        for name, name_args, name_kwargs in args:
+            getattr(pipe, name)(*name_args, **name_kwargs)
+        pipe.execute_command('EXEC')
+    else:
+        getattr(pipe, command)(*args, **(kwargs or {}))
+
+
+def execute_transaction(connection, commands):
+    """
+    Sends the commands of a TRANSACTION in one MULTI/EXEC block,
+    raising ResponseError if Redis rejected any of them
+    :param commands: list of (command, args, kwargs)
+    :return: list of replies
+    """
+    pipe = connection.pipeline(transaction=True)
+    for name, name_args, name_kwargs in commands:
+        getattr(pipe, name)(*name_args, **name_kwargs)
+    return pipe.execute()
+
+
+def reply_errors(commands, replies):
+    """
+    Finds the commands Redis rejected in the replies of a pipeline run with raise_on_error=False.
+    Errors of a TRANSACTION's commands come back inside the EXEC reply, and are looked for there too.
+    :param commands: list of (command, args), as queued with queue_command
+    :param replies: replies of pipe.execute(raise_on_error=False)
+    :return: list of (index of the command, error)
+    """
+    errors = []
+    replies = iter(replies)
+    for idx, (command, args) in enumerate(commands):
+        # a TRANSACTION is MULTI, one reply per command, EXEC
+        count = len(args) + 2 if command == TRANSACTION else 1
+        command_replies = list(islice(replies, count))
+        if command == TRANSACTION and command_replies and isinstance(command_replies[-1], list):
+            command_replies += command_replies.pop()
+        error = next((reply for reply in command_replies if isinstance(reply, ResponseError)), None)
+        if error is not None:
+            errors.append((idx, error))
+    return errors
+
+
+class RedisBatcher:
+    """
+    Coalesces Redis commands for one client into pipelined batches.
+
+    Commands are queued and sent by a single background thread, so their
+    order is kept. A batch is sent once it holds `max_batch` commands or
+    `linger` seconds after its first command arrived.
+    """
+
+    def __init__(self, connection, linger: float, max_batch: int, name: str = 'redis-batch', on_error=None,
+                 hold=None):
+        self.connection = connection
+        # called with the exception and the unsent commands when a batch fails
+        self.on_error = on_error
+        # called with a batch before it is sent, a true return means it took the commands instead
+        self.hold = hold
+        self.linger = linger
+        self.max_batch = max_batch
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.commands = 0
+        self.errors = 0
+        self.rejected = 0
+        self.held = 0
+
+    def _ensure_thread(self):
+        # threads do not survive a fork, so this is checked on every submit
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._work, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, command: str, *args, **kwargs):
+        """
+        Queues a command for the next batch
+        :param command: name of the Redis method, i.e. 'xadd'
+        """
+        self._ensure_thread()
+        self._queue.put((command, args, kwargs))
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        # a None marks close(), send what came before it and stop
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = batch[-1] is None
+            commands = [item for item in batch if item is not None]
+            if commands:
+                self.execute(commands)
+            if stop:
+                return
+
+    def execute(self, commands):
+        """
+        Sends commands in one pipelined round trip.
+        Commands Redis rejects are logged, the others in the batch are not affected.
+        :param commands: list of (command, args, kwargs)
+        :return: list of replies, or None if the batch failed or was held
+        """
+        if self.hold is not None and self.hold(commands):
+            # an earlier batch was kept back, this one must not overtake it
+            self.held += len(commands)
+            return None
+        pipe = self.connection.pipeline(transaction=False)
+        for command, args, kwargs in commands:
+            queue_command(pipe, command, args, kwargs)
+        try:
+            replies = pipe.execute(raise_on_error=False)
+        except RedisError as err:
+            self.errors += 1
+            logger.error(f'{self.name}: failed to send {len(commands)} commands: {err}')
+            if self.on_error is not None:
+                self.on_error(err, commands)
+            return None
+        for idx, error in reply_errors([command[:2] for command in commands], replies):
+            self.rejected += 1
+            logger.error(f'{self.name}: Redis rejected {commands[idx][0]}: {error}')
+        self.batches += 1
+        self.commands += len(commands)
+        return replies
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'commands': self.commands,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'held': self.held,
+        }
+
+    def close(self):
+        """
+        Sends everything queued and stops the background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
@@ -0,0 +1,237 @@
+"""
+Durable outbox for Redis commands that could not be sent.
+
+Commands are kept in a SQLite table (WAL mode) and replayed in order per
+client once its Redis endpoint is healthy again. While a client has
+commands waiting, new ones for it are spooled too, so nothing overtakes
+the backlog. Each process keeps the set of clients with a backlog in
+memory, so sends only query the table for those, and reloads it from the
+table on every replay pass, so a backlog spooled by another process sharing
+the file is seen within `interval` seconds.
+
+Several processes may replay the same file (web server, workers). A client
+is replayed by one of them at a time, the one holding its lease; a lease
+left by a crashed process expires after `lease` seconds. Commands Redis
+rejects (ResponseError) are logged and dropped rather than retried, as
+sending them again would only resend the ones that succeeded.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+from utils.log import get_logger
+from utils.redis_batch import queue_command, reply_errors
+
+logger = get_logger(__name__)
+
+
+def _encode_bytes(value):
+    # binary messages, see utils/codec.py
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    raise TypeError(f'Cannot spool {type(value).__name__}')
+
+
+def _decode_bytes(value):
+    if '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+class RedisOutbox:
+    def __init__(self, path: str, batch_size: int = 1000, interval: float = 1.0, lease: float = 30.0):
+        """
+        :param path: SQLite database file
+        :param batch_size: commands sent per pipelined round trip when replaying
+        :param interval: seconds between replay attempts
+        :param lease: seconds a replaying process holds a client before another may take it over
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # a commit survives a process crash, only an OS crash can lose the last few
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'client_id INTEGER NOT NULL, '
+            'command TEXT NOT NULL, '
+            'arguments TEXT NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS outbox_client ON outbox (client_id, id)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox_lease ('
+            'client_id INTEGER PRIMARY KEY, '
+            'owner TEXT NOT NULL, '
+            'expires REAL NOT NULL)'
+        )
+        self._pending = set()
+        self._load_pending()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    @property
+    def owner(self):
+        return f'{os.getpid()}:{id(self)}'
+
+    def _load_pending(self):
+        """
+        Reloads the clients with spooled commands, from every process, from the table
+        :return: sorted list of client ids
+        """
+        with self._lock:
+            self._pending = {row[0] for row in self._db.execute('SELECT DISTINCT client_id FROM outbox')}
+            return sorted(self._pending)
+
+    def has_pending(self, client_id: int):
+        """Checks whether commands spooled for client_id are not replayed yet, only asking the table if any were"""
+        if client_id not in self._pending:
+            return False
+        with self._lock:
+            if self._db.execute('SELECT 1 FROM outbox WHERE client_id = ? LIMIT 1', (client_id,)).fetchone():
+                return True
+            # replayed, maybe by another process
+            self._pending.discard(client_id)
+            return False
+
+    def put(self, client_id: int, command: str, args=(), kwargs=None):
+        """
+        Spools a command for client_id
+        :param command: name of the Redis method, i.e. 'xadd'
+        """
+        arguments = json.dumps([list(args), kwargs or {}], default=_encode_bytes)
+        with self._lock:
+            self._db.execute('INSERT INTO outbox (client_id, command, arguments) VALUES (?, ?, ?)',
+                             (client_id, command, arguments))
+            self._pending.add(client_id)
+            self.spooled += 1
+
+    def pending(self):
+        """
+        Gets the number of spooled commands per client
+        :return: dict
+        """
+        with self._lock:
+            return dict(self._db.execute('SELECT client_id, count(*) FROM outbox GROUP BY client_id').fetchall())
+
+    def _claim(self, client_id: int):
+        """
+        Takes or renews the lease on replaying client_id
+        :return: True if this outbox holds it
+        """
+        now = time.time()
+        with self._lock:
+            return self._db.execute(
+                'INSERT INTO outbox_lease VALUES (?, ?, ?) ON CONFLICT (client_id) DO UPDATE '
+                'SET owner = excluded.owner, expires = excluded.expires WHERE owner = excluded.owner OR expires < ?',
+                (client_id, self.owner, now + self.lease, now)).rowcount == 1
+
+    def _release(self, client_id: int):
+        with self._lock:
+            self._db.execute('DELETE FROM outbox_lease WHERE client_id = ? AND owner = ?', (client_id, self.owner))
+
+    def replay_client(self, client_id: int, connection):
+        """
+        Sends everything spooled for a client, oldest first, unless another process is replaying it
+        :return: number of commands sent
+        """
+        sent = 0
+        if not self._claim(client_id):
+            return sent
+        try:
+            while True:
+                with self._lock:
+                    rows = self._db.execute(
+                        'SELECT id, command, arguments FROM outbox WHERE client_id = ? ORDER BY id LIMIT ?',
+                        (client_id, self.batch_size)).fetchall()
+                    if not rows:
+                        # checked under the lock, so a put() cannot slip in between
+                        self._pending.discard(client_id)
+                        return sent
+                pipe = connection.pipeline(transaction=False)
+                commands = []
+                for _, command, arguments in rows:
+                    args, kwargs = json.loads(arguments, object_hook=_decode_bytes)
+                    queue_command(pipe, command, args, kwargs)
+                    commands.append((command, args))
+                # connection errors raise and keep the batch, rejected commands are dropped
+                errors = reply_errors(commands, pipe.execute(raise_on_error=False))
+                for idx, error in errors:
+                    logger.error(f'Dropped spooled {commands[idx][0]} for client {client_id}: {error}')
+                with self._lock:
+                    self._db.execute('DELETE FROM outbox WHERE client_id = ? AND id <= ?',
+                                     (client_id, rows[-1][0]))
+                    self.replayed += len(rows) - len(errors)
+                    self.dropped += len(errors)
+                sent += len(rows) - len(errors)
+                if not self._claim(client_id):
+                    # too slow, another process took the client over
+                    return sent
+        finally:
+            self._release(client_id)
+
+    def replay(self, get_client):
+        """
+        Replays every client whose Redis endpoint is healthy
+        :param get_client: callable taking a client id, returning a RedisClient or None
+        :return: number of commands sent
+        """
+        sent = 0
+        for client_id in self._load_pending():
+            client = get_client(client_id)
+            if client is None or client.connection is None or not client.pool.healthy:
+                continue
+            try:
+                count = self.replay_client(client_id, client.connection)
+            except RedisError as err:
+                client.pool.mark_unhealthy(err)
+                continue
+            if count:
+                logger.info(f'Replayed {count} spooled commands for client {client_id}')
+            sent += count
+        return sent
+
+    def start(self, get_client):
+        """
+        Starts replaying in the background
+        :param get_client: see replay()
+        """
+        # threads do not survive a fork, so this may be called on every send
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._work, args=(get_client,), name='redis-outbox',
+                                                    daemon=True)
+                    self._thread.start()
+
+    def _work(self, get_client):
+        while not self._stop.wait(self.interval):
+            try:
+                self.replay(get_client)
+            except Exception as e:
+                logger.error(f'Outbox replay failed: {e}')
+
+    def stats(self):
+        return {'pending': self.pending(), 'spooled': self.spooled, 'replayed': self.replayed,
+                'dropped': self.dropped}
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,172 @@
+"""
+Shared, health-checked Redis connection pools.
+
+Every client talking to the same Redis endpoint gets the same pool. A
+background monitor pings it, and after a failure reconnects with jittered
+exponential backoff, so webhooks fail fast instead of waiting on a dead
+server.
+"""
+import os
+import random
+import threading
+import time
+from queue import LifoQueue
+
+from redis import Redis, BlockingConnectionPool
+from redis.exceptions import RedisError
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+TBOT_REDIS_MAX_CONNECTIONS = int(os.getenv("TBOT_REDIS_MAX_CONNECTIONS", "20"))
+# seconds a command waits for a free connection before failing
+TBOT_REDIS_POOL_TIMEOUT = float(os.getenv("TBOT_REDIS_POOL_TIMEOUT", "5"))
+# seconds between background pings while the endpoint is healthy
+TBOT_REDIS_HEALTH_CHECK_SEC = float(os.getenv("TBOT_REDIS_HEALTH_CHECK_SEC", "5"))
+# reconnect backoff bounds, in seconds
+TBOT_REDIS_BACKOFF_BASE = 0.5
+TBOT_REDIS_BACKOFF_MAX = 30.0
+
+
+class TimedLifoQueue(LifoQueue):
+    """Pool queue that counts reused (hit) and new (miss) connections and time spent waiting"""
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def get(self, block=True, timeout=None):
+        start = time.perf_counter()
+        connection = super().get(block, timeout)
+        waited = time.perf_counter() - start
+        with self.mutex:
+            # None is the pool's cue to open a new connection
+            if connection is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+
+class MonitoredConnectionPool(BlockingConnectionPool):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_connections', TBOT_REDIS_MAX_CONNECTIONS)
+        kwargs.setdefault('timeout', TBOT_REDIS_POOL_TIMEOUT)
+        # redis-py pings connections idle for longer than this before reusing them
+        kwargs.setdefault('health_check_interval', TBOT_REDIS_HEALTH_CHECK_SEC)
+        super().__init__(queue_class=TimedLifoQueue, **kwargs)
+        self.healthy = True
+        self.failures = 0
+        self.reconnects = 0
+        self._wake = threading.Event()
+        self._monitor = None
+        self._closed = False
+
+    def __repr__(self):
+        kwargs = self.connection_kwargs
+        return kwargs.get('path') or f"{kwargs.get('host')}:{kwargs.get('port')}"
+
+    def ensure_monitor(self):
+        """Starts the health monitor, again after a fork if needed"""
+        if self._monitor is None or not self._monitor.is_alive():
+            self._closed = False
+            self._monitor = threading.Thread(target=self._monitor_loop, name=f'redis-monitor-{self!r}', daemon=True)
+            self._monitor.start()
+
+    def mark_unhealthy(self, err=None):
+        """
+        Flags the endpoint as down, webhooks fail fast until the monitor reconnects
+        """
+        if self.healthy:
+            logger.error(f'Redis {self!r} unavailable, reconnecting in the background: {err}')
+        self.healthy = False
+        self.failures += 1
+        self.ensure_monitor()
+        self._wake.set()
+
+    def ping(self):
+        try:
+            return Redis(connection_pool=self).ping()
+        except RedisError:
+            return False
+
+    def _monitor_loop(self):
+        attempt = 0
+        while not self._closed:
+            if self.healthy:
+                self._wake.wait(TBOT_REDIS_HEALTH_CHECK_SEC)
+                self._wake.clear()
+            else:
+                # full jitter, so clients of one endpoint do not reconnect in lockstep
+                time.sleep(random.uniform(0, min(TBOT_REDIS_BACKOFF_MAX, TBOT_REDIS_BACKOFF_BASE * 2 ** attempt)))
+            if self._closed:
+                return
+            if self.ping():
+                if not self.healthy:
+                    self.reconnects += 1
+                    logger.info(f'Redis {self!r} reconnected after {attempt} attempts')
+                self.healthy = True
+                attempt = 0
+            else:
+                if self.healthy:
+                    logger.error(f'Redis {self!r} failed its health check, reconnecting in the background')
+                self.healthy = False
+                attempt += 1
+
+    def stats(self):
+        queue = self.pool
+        checkouts = queue.hits + queue.misses
+        return {
+            'healthy': self.healthy,
+            'max_connections': self.max_connections,
+            'open_connections': len(self._connections),
+            'hits': queue.hits,
+            'misses': queue.misses,
+            'wait_ms': {
+                'avg': round(queue.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'max': round(queue.wait_max * 1000, 3),
+            },
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+        }
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.disconnect()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url: str = None, **kwargs):
+    """
+    Gets the shared pool for a Redis endpoint, creating it on first use
+    :param url: unix:// or redis:// url, otherwise host/port are taken from kwargs
+    :return: MonitoredConnectionPool()
+    """
+    key = (url, tuple(sorted(kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MonitoredConnectionPool.from_url(url, **kwargs) if url else MonitoredConnectionPool(**kwargs)
+            _pools[key] = pool
+    pool.ensure_monitor()
+    return pool
+
+
+def get_pool_stats():
+    """
+    Gets stats for every shared pool
+    :return: dict of endpoint to stats
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {repr(pool): pool.stats() for pool in pools}
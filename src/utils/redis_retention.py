@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from redis.exceptions import RedisError
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class StreamRetention:
+    """How much of a Redis stream to keep. 0 disables a limit."""
+    maxlen: int = 0
+    max_age: float = 0
+
+    @classmethod
+    def from_env(cls, suffix: str = ''):
+        """
+        Reads TBOT_REDIS_STREAM_MAXLEN and TBOT_REDIS_STREAM_MAX_AGE_SEC,
+        preferring a per-stream variable ending in suffix, i.e. TBOT_REDIS_STREAM_MAXLEN_1
+        """
+        def read(name, default):
+            return os.getenv(f'{name}{suffix}', os.getenv(name, default))
+
+        return cls(maxlen=int(read('TBOT_REDIS_STREAM_MAXLEN', '0')),
+                   max_age=float(read('TBOT_REDIS_STREAM_MAX_AGE_SEC', '0')))
+
+    @property
+    def enabled(self):
+        return bool(self.maxlen or self.max_age)
+
+    def minid(self):
+        """Oldest stream id to keep, stream ids start with their creation time in ms"""
+        return f'{int((time.time() - self.max_age) * 1000)}-0'
+
+    def xadd_kwargs(self):
+        """
+        Trimming arguments for XADD. A command takes MAXLEN or MINID but not both,
+        so with both set MAXLEN is applied inline and MINID by the trimmer.
+        :return: dict
+        """
+        if self.maxlen:
+            return {'maxlen': self.maxlen, 'approximate': True}
+        if self.max_age:
+            return {'minid': self.minid(), 'approximate': True}
+        return {}
+
+    def trim(self, connection, key):
+        """
+        Trims a stream to this retention
+        :return: number of entries removed
+        """
+        removed = 0
+        if self.maxlen:
+            removed += connection.xtrim(key, maxlen=self.maxlen, approximate=True)
+        if self.max_age:
+            removed += connection.xtrim(key, minid=self.minid(), approximate=True)
+        return removed
+
+
+def stream_stats(connection, key):
+    """
+    Gets the length and memory footprint of a stream
+    :return: dict
+    """
+    try:
+        return {'length': connection.xlen(key), 'memory_bytes': connection.memory_usage(key) or 0}
+    except RedisError as err:
+        return {'error': str(err)}
+
+
+class StreamTrimmer:
+    """
+    Trims streams in the background, for retention XADD cannot apply inline
+    and for streams that were written without it.
+    """
+
+    def __init__(self, streams, interval: float):
+        """
+        :param streams: callable returning a list of (connection, key, StreamRetention)
+        :param interval: seconds between runs
+        """
+        self.streams = streams
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._work, name='stream-trimmer', daemon=True)
+            self._thread.start()
+
+    def run_once(self):
+        for connection, key, retention in self.streams():
+            if not retention.enabled:
+                continue
+            try:
+                removed = retention.trim(connection, key)
+            except RedisError as err:
+                logger.warning(f'Failed to trim {key}: {err}')
+                continue
+            logger.debug(f'Trimmed {removed} entries from {key}: {stream_stats(connection, key)}')
+
+    def _work(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stop(self):
+        self._stop.set()
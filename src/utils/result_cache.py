@@ -0,0 +1,118 @@
+"""
+Results of read-only queries, reused while the database is unchanged.
+
+Entries are keyed on the query and stamped with the database version they
+were computed at, so the first request after TBOT writes recomputes them.
+Concurrent misses of one key wait for a single computation.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class DataVersion:
+    """
+    Version of a SQLite database as seen from one probe connection.
+
+    PRAGMA data_version only changes when other connections commit, and its
+    values mean nothing across connections, so every reader asks this one.
+    """
+
+    def __init__(self, path_env: str = 'TBOT_DB_OFFICE', default_path: str = '/run/tbot/tbot_sqlite3'):
+        self.path_env = path_env
+        self.default_path = default_path
+        self._connection = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Gets the version, raising sqlite3.Error when the database cannot be read
+        :return: tuple of (path, inode, data_version)
+        """
+        path = os.environ.get(self.path_env, self.default_path)
+        try:
+            inode = os.stat(path).st_ino
+        except OSError as e:
+            raise sqlite3.OperationalError(str(e)) from e
+        with self._lock:
+            key = (os.getpid(), path, inode)
+            if self._connection is None or self._key != key:
+                if self._connection is not None and self._key[0] == os.getpid():
+                    self._connection.close()
+                self._connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, isolation_level=None,
+                                                   check_same_thread=False)
+                self._key = key
+            return path, inode, self._connection.execute('PRAGMA data_version').fetchone()[0]
+
+
+class ResultCache:
+    """Least recently used results, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._computing = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+
+    def get(self, key, version, compute, sizeof=len):
+        """
+        Gets the result for key at version, computing it on a miss
+        :param compute: function returning the result, exceptions are raised to every caller waiting for it
+        :param sizeof: function returning a result's size in bytes
+        :return: result
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                done = self._computing.get((key, version))
+                if done is None:
+                    done = self._computing[(key, version)] = threading.Event()
+                    self.misses += 1
+                    break
+                self.waits += 1
+            # another request is computing it, use its result (or compute it if it failed)
+            done.wait()
+
+        try:
+            value = compute()
+            self._put(key, version, value, sizeof(value))
+            return value
+        finally:
+            with self._lock:
+                del self._computing[(key, version)]
+            done.set()
+
+    def _put(self, key, version, value, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'waits': self.waits, 'evictions': self.evictions}
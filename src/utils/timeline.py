@@ -0,0 +1,175 @@
+"""
+Alert to order timeline of TBOT, kept in a side SQLite database.
+
+The timeline holds the join of TBOTORDERS and TBOTALERTS on orderref and
+uniquekey. Each refresh attaches TBOT's database read-only and only joins
+the rows added since the last one (rowid watermarks), so /tbot/data reads a
+page of an indexed table instead of sorting the whole join on every call.
+
+    new rows = new orders x all alerts + old orders x new alerts
+
+Orders change status in place, so orders whose timestamp moved are copied
+again. Only orders at or past the latest timestamp already copied (a
+watermark) are compared, which is an index seek when TBOT's database has an
+index on TBOTORDERS (timestamp), and a scan of that one table otherwise. This
+relies on TBOT stamping updates with increasing timestamps. If TBOT's
+database is replaced or its rowids go back, the timeline is rebuilt.
+"""
+import os
+import sqlite3
+import threading
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# columns of the timeline taken from each table, the ones /tbot/data shows
+ORDER_COLUMNS = ('timestamp', 'uniquekey', 'avgprice', 'action', 'ordertype', 'qty', 'position', 'orderstatus')
+ALERT_COLUMNS = ('tv_timestamp', 'ticker', 'tv_price', 'direction', 'orderref')
+TIMELINE_COLUMNS = ORDER_COLUMNS + ALERT_COLUMNS
+# columns copied again when an order is updated, the join keys never change
+UPDATED_COLUMNS = tuple(column for column in ORDER_COLUMNS if column != 'uniquekey')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS timeline (
+    id INTEGER PRIMARY KEY,
+    order_rowid INTEGER NOT NULL,
+    alert_rowid INTEGER NOT NULL,
+    {', '.join(TIMELINE_COLUMNS)},
+    UNIQUE (order_rowid, alert_rowid)
+);
+CREATE INDEX IF NOT EXISTS timeline_uniquekey ON timeline (uniquekey, id);
+CREATE INDEX IF NOT EXISTS timeline_timestamp ON timeline (timestamp, id);
+CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, orderref, uniquekey, timestamp);
+CREATE INDEX IF NOT EXISTS orders_key ON orders (orderref, uniquekey);
+CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY, orderref, uniquekey);
+CREATE INDEX IF NOT EXISTS alerts_key ON alerts (orderref, uniquekey);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+"""
+
+_INSERT = f"INSERT OR IGNORE INTO timeline (order_rowid, alert_rowid, {', '.join(TIMELINE_COLUMNS)}) "
+_SELECT = 'SELECT o.rowid, a.rowid, ' + ', '.join([f'o.{column}' for column in ORDER_COLUMNS] +
+                                                  [f'a.{column}' for column in ALERT_COLUMNS])
+# old orders x new alerts, before the new orders are copied
+JOIN_NEW_ALERTS = (_INSERT + _SELECT + ' FROM tbot.TBOTALERTS a '
+                   'JOIN orders k ON k.orderref = a.orderref AND k.uniquekey = a.uniquekey '
+                   'JOIN tbot.TBOTORDERS o ON o.rowid = k.id '
+                   'WHERE a.rowid > ? AND a.rowid <= ?')
+# new orders x all alerts
+JOIN_NEW_ORDERS = (_INSERT + _SELECT + ' FROM tbot.TBOTORDERS o '
+                   'JOIN alerts k ON k.orderref = o.orderref AND k.uniquekey = o.uniquekey '
+                   'JOIN tbot.TBOTALERTS a ON a.rowid = k.id '
+                   'WHERE o.rowid > ? AND o.rowid <= ?')
+# old orders stamped at or after the watermark, equal timestamps may still hide an update
+CHANGED_ORDERS = ('SELECT k.id, o.timestamp FROM tbot.TBOTORDERS o JOIN orders k ON k.id = o.rowid '
+                  'WHERE o.timestamp >= ? AND o.timestamp IS NOT k.timestamp')
+# number of rows of the timeline, kept by each refresh
+ROWS_QUERY = "SELECT coalesce((SELECT value FROM meta WHERE name = 'rows'), 0)"
+UPDATE_TIMELINE = (f"UPDATE timeline SET ({', '.join(UPDATED_COLUMNS)}) = "
+                   f"(SELECT {', '.join(UPDATED_COLUMNS)} FROM tbot.TBOTORDERS WHERE rowid = ?) "
+                   f"WHERE order_rowid = ?")
+
+
+class Timeline:
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+        self._pid = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._writer is None or self._pid != os.getpid():
+            self._writer = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False,
+                                           uri=True)
+            self._writer.execute('PRAGMA journal_mode = WAL')
+            self._writer.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._writer
+
+    def reader(self):
+        """
+        Gets this thread's connection to read the timeline
+        :return: sqlite3 connection with sqlite3.Row rows
+        """
+        key = (os.getpid(), self.path)
+        if getattr(self._local, 'key', None) != key:
+            with self._lock:
+                self._connect()
+            reader = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            reader.row_factory = sqlite3.Row
+            reader.execute('PRAGMA query_only = ON')
+            self._local.reader, self._local.key = reader, key
+        return self._local.reader
+
+    def rows(self):
+        """Gets the number of rows of the timeline"""
+        return self.reader().execute(ROWS_QUERY).fetchone()[0]
+
+    def refresh(self, source_path: str, rebuild: bool = False):
+        """
+        Joins the rows TBOT added since the last refresh, and copies updated orders again
+        :param source_path: TBOT's database
+        :param rebuild: drop the timeline and join every row
+        :return: dict of rows added and orders updated
+        """
+        try:
+            source = f'{source_path}:{os.stat(source_path).st_ino}'
+        except OSError as e:
+            raise sqlite3.OperationalError(str(e)) from e
+        with self._lock:
+            db = self._connect()
+            db.execute('ATTACH DATABASE ? AS tbot', (f'file:{source_path}?mode=ro',))
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    result = self._refresh(db, source, rebuild)
+                    db.execute('COMMIT')
+                except BaseException:
+                    db.execute('ROLLBACK')
+                    raise
+            finally:
+                db.execute('DETACH DATABASE tbot')
+        if result['added'] or result['updated']:
+            logger.debug(f'Timeline refreshed: {result}')
+        return result
+
+    def _refresh(self, db, source, rebuild):
+        meta = dict(db.execute('SELECT name, value FROM meta').fetchall())
+        orders_to = db.execute('SELECT max(rowid) FROM tbot.TBOTORDERS').fetchone()[0] or 0
+        alerts_to = db.execute('SELECT max(rowid) FROM tbot.TBOTALERTS').fetchone()[0] or 0
+        orders_from, alerts_from = meta.get('orders', 0), meta.get('alerts', 0)
+        rows, changed_from = meta.get('rows', 0), meta.get('changed')
+        if rebuild or meta.get('source') != source or orders_to < orders_from or alerts_to < alerts_from:
+            for table in ('timeline', 'orders', 'alerts', 'meta'):
+                db.execute(f'DELETE FROM {table}')
+            orders_from = alerts_from = rows = 0
+            changed_from = None
+
+        changed = db.execute(CHANGED_ORDERS, (changed_from,)).fetchall() if changed_from is not None else []
+        updated = [order_id for order_id, _ in changed]
+        for order_id in updated:
+            db.execute(UPDATE_TIMELINE, (order_id, order_id))
+            db.execute('UPDATE orders SET timestamp = (SELECT timestamp FROM tbot.TBOTORDERS WHERE rowid = ?) '
+                       'WHERE id = ?', (order_id, order_id))
+
+        db.execute('INSERT INTO alerts SELECT rowid, orderref, uniquekey FROM tbot.TBOTALERTS '
+                   'WHERE rowid > ? AND rowid <= ?', (alerts_from, alerts_to))
+        added = db.execute(JOIN_NEW_ALERTS, (alerts_from, alerts_to)).rowcount
+        db.execute('INSERT INTO orders SELECT rowid, orderref, uniquekey, timestamp FROM tbot.TBOTORDERS '
+                   'WHERE rowid > ? AND rowid <= ?', (orders_from, orders_to))
+        added += db.execute(JOIN_NEW_ORDERS, (orders_from, orders_to)).rowcount
+
+        # the latest timestamp copied, of the new orders or the updated ones
+        stamps = [timestamp for _, timestamp in changed] + [changed_from] + [
+            db.execute('SELECT max(timestamp) FROM orders WHERE id > ?', (orders_from,)).fetchone()[0]]
+        stamps = [stamp for stamp in stamps if stamp is not None]
+        db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                       [('source', source), ('orders', orders_to), ('alerts', alerts_to), ('rows', rows + added),
+                        ('changed', max(stamps) if stamps else None)])
+        return {'added': added, 'updated': len(updated), 'rows': rows + added}
+
+    def close(self):
+        if self._writer is not None and self._pid == os.getpid():
+            self._writer.close()
+        self._writer = None